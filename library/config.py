@@ -19,11 +19,11 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 import os
-import queue
 import sys
 
 import yaml
 
+from library.lcd.update_queue import UpdateQueue
 from library.log import logger
 
 
@@ -80,5 +80,6 @@ def check_theme_compatible(display_size: str):
 # Load theme on import
 load_theme()
 
-# Queue containing the serial requests to send to the screen
-update_queue = queue.Queue()
+# Queue containing the serial requests to send to the screen. Pending images are replaced by newer images drawn at the
+# same place, so that the queue does not grow when the serial link is slower than the display updates
+update_queue = UpdateQueue()
@@ -19,7 +19,7 @@ import sys
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 from library import config
-from library.lcd.lcd_comm import Orientation
+from library.lcd.lcd_comm import LcdComm, Orientation
 from library.lcd.lcd_comm_rev_a import LcdCommRevA
 from library.lcd.lcd_comm_rev_b import LcdCommRevB
 from library.lcd.lcd_comm_rev_c import LcdCommRevC
@@ -52,18 +52,62 @@ def _get_theme_orientation() -> Orientation:
         return Orientation.PORTRAIT
 
 
+def _get_theme_fonts(theme_data, fonts: set = None) -> set:
+    # Get all (font, size) used by the theme widgets, with the same default values as when they are drawn
+    if fonts is None:
+        fonts = set()
+    if isinstance(theme_data, dict):
+        if "FONT" in theme_data or "FONT_SIZE" in theme_data:
+            font = theme_data.get("FONT", "roboto-mono/RobotoMono-Regular.ttf")
+            if "RATIO" in theme_data:
+                # Weather graph: texts are drawn in 2 sizes, scaled by the ratio
+                fonts.update((font, int(size * theme_data["RATIO"])) for size in (12, 18))
+            else:
+                fonts.add((font, theme_data.get("FONT_SIZE", 10)))
+        if theme_data.get("AXIS", False):
+            fonts.add(LcdComm.GRAPH_AXIS_FONT)
+        for value in theme_data.values():
+            _get_theme_fonts(value, fonts)
+    return fonts
+
+
+def _get_theme_radial_bars(theme_data, radial_bars: list = None) -> list:
+    # Get the geometry of all radial progress bars shown by the theme, with the same default values as when they are
+    # drawn: (radius, bar width, angle start, angle end, angle separation, angle steps, clockwise)
+    if radial_bars is None:
+        radial_bars = []
+    if isinstance(theme_data, dict):
+        if "RADIUS" in theme_data and theme_data.get("SHOW", False):
+            radial_bars.append((theme_data.get("RADIUS", 1), theme_data.get("WIDTH", 1),
+                                theme_data.get("ANGLE_START", 0), theme_data.get("ANGLE_END", 360),
+                                theme_data.get("ANGLE_SEP", 0), theme_data.get("ANGLE_STEPS", 1),
+                                theme_data.get("CLOCKWISE", False)))
+        for value in theme_data.values():
+            _get_theme_radial_bars(value, radial_bars)
+    return radial_bars
+
+
 class Display:
     def __init__(self):
         self.lcd = None
         if config.CONFIG_DATA["display"]["REVISION"] == "A":
             self.lcd = LcdCommRevA(com_port=config.CONFIG_DATA['config']['COM_PORT'],
-                                   update_queue=config.update_queue)
+                                   update_queue=config.update_queue,
+                                   sparse_pixels=config.CONFIG_DATA["display"].get("SPARSE_PIXELS", False))
         elif config.CONFIG_DATA["display"]["REVISION"] == "B":
             self.lcd = LcdCommRevB(com_port=config.CONFIG_DATA['config']['COM_PORT'],
                                    update_queue=config.update_queue)
         elif config.CONFIG_DATA["display"]["REVISION"] == "C":
             self.lcd = LcdCommRevC(com_port=config.CONFIG_DATA['config']['COM_PORT'],
-                                   update_queue=config.update_queue)
+                                   update_queue=config.update_queue,
+                                   status_window=config.CONFIG_DATA["display"].get("STATUS_WINDOW",
+                                                                                   LcdCommRevC.STATUS_WINDOW),
+                                   full_frame_ratio=config.CONFIG_DATA["display"].get("FULL_FRAME_RATIO",
+                                                                                      LcdCommRevC.FULL_FRAME_RATIO),
+                                   command_cost=config.CONFIG_DATA["display"].get("COMMAND_COST",
+                                                                                  LcdCommRevC.COMMAND_COST),
+                                   pixel_cost=config.CONFIG_DATA["display"].get("PIXEL_COST",
+                                                                                LcdCommRevC.PIXEL_COST))
         elif config.CONFIG_DATA["display"]["REVISION"] == "D":
             self.lcd = LcdCommRevD(com_port=config.CONFIG_DATA['config']['COM_PORT'],
                                    update_queue=config.update_queue)
@@ -76,6 +120,36 @@ class Display:
         else:
             logger.error("Unknown display revision '", config.CONFIG_DATA["display"]["REVISION"], "'")
 
+        # Compositor mode: widgets are drawn off-screen and sent periodically by the scheduler (see FrameFlush)
+        if self.lcd and config.CONFIG_DATA["display"].get("FRAME_INTERVAL", 0) > 0:
+            self.lcd.compositor_enabled = True
+
+        # Maximum time for high-priority widgets to reach the display: lower priority refreshes are skipped to keep it
+        if self.lcd:
+            self.lcd.link_monitor.target_latency = config.CONFIG_DATA["display"].get("TARGET_LATENCY", 1)
+
+        # Render widgets directly to RGB565 pixels, for displays that use them
+        if self.lcd:
+            self.lcd.rgb565_render = config.CONFIG_DATA["display"].get("RGB565_RENDER", False)
+
+        # Open all fonts used by the theme now, so that they are not loaded while refreshing widgets
+        if self.lcd:
+            self.lcd.font_manager.memory_budget = config.CONFIG_DATA["display"].get("FONT_MEMORY", 32) * 1024 * 1024
+            self.lcd.font_manager.preload(sorted(_get_theme_fonts(config.THEME_DATA)))
+
+        # Precompute the masks of the radial progress bars of the theme
+        if self.lcd:
+            for radial_bar in _get_theme_radial_bars(config.THEME_DATA):
+                try:
+                    self.lcd.radial_bar(*radial_bar)
+                except (ValueError, TypeError, ZeroDivisionError) as e:
+                    # Invalid bar: the error will be reported when it is drawn
+                    logger.warning(f"Cannot precompute radial progress bar {radial_bar}: {e}")
+
+        # Record all data exchanged with the display, to replay it later with tools/trace-replay.py
+        if self.lcd and config.CONFIG_DATA["display"].get("TRACE_FILE"):
+            self.lcd.StartTrace(config.CONFIG_DATA["display"]["TRACE_FILE"])
+
     def initialize_display(self):
         # Reset screen in case it was in an unstable state (screen is also cleared)
         self.lcd.Reset()
@@ -0,0 +1,67 @@
+# turing-smart-screen-python - a Python system monitor and library for USB-C displays like Turing Smart Screen or XuanFang
+# https://github.com/mathoudebine/turing-smart-screen-python/
+
+# Copyright (C) 2021-2023  Matthieu Houdebine (mathoudebine)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# LRU cache: bounded cache of rendered bitmaps, the least recently used entries are evicted first
+
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+
+class LruCache:
+    def __init__(self, max_entries: int):
+        # Maximum number of entries kept, 0 to disable the cache
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.mutex = threading.Lock()
+
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self.mutex:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        with self.mutex:
+            if self.max_entries <= 0:
+                return
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def discard(self, predicate: Callable[[Hashable], bool]):
+        # Remove all entries whose key matches the predicate
+        with self.mutex:
+            for key in [key for key in self.entries if predicate(key)]:
+                del self.entries[key]
+
+    def clear(self):
+        with self.mutex:
+            self.entries.clear()
+
+    def __len__(self) -> int:
+        return len(self.entries)
@@ -0,0 +1,197 @@
+# turing-smart-screen-python - a Python system monitor and library for USB-C displays like Turing Smart Screen or XuanFang
+# https://github.com/mathoudebine/turing-smart-screen-python/
+
+# Copyright (C) 2021-2023  Matthieu Houdebine (mathoudebine)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Pixel encoders for the wire formats used by the different hardware revisions.
+# All conversions are vectorized with NumPy: a full-screen frame is encoded in a few milliseconds instead of looping
+# over every pixel in Python.
+# Encoders can rotate images to the native orientation of the display: rotation is a strided view of the pixels, read
+# by the encoder while it writes its output, so that no rotated copy of the image is made.
+
+from typing import Optional, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+
+# PIL modes of RGB565 images: 16-bit pixels are stored as 0bRRRRRGGGGGGBBBBB values in the device byte order
+RGB565_MODES = {"little": "I;16", "big": "I;16B"}
+
+
+def is_rgb565_image(image) -> bool:
+    return isinstance(image, Image.Image) and image.mode in RGB565_MODES.values()
+
+
+def rgb565_image(rgb565: np.ndarray) -> Image.Image:
+    # Get a RGB565 image from a (height, width) array of RGB565 values, in the byte order of the array
+    return Image.fromarray(rgb565)
+
+
+def rgb_image(image: Image.Image) -> Image.Image:
+    # Get an image that can be drawn on or composited with PIL: RGB565 images are converted to RGB, other images are
+    # returned as-is
+    if is_rgb565_image(image):
+        return Image.fromarray(rgb565_to_rgb(np.asarray(image)), "RGB")
+    return image
+
+
+def solid_image(size: Tuple[int, int], color: Tuple[int, int, int]) -> Image.Image:
+    # Create an image of a single color, flagged as such so that solid_color() does not need to check its pixels.
+    # Do not draw on it: the flag would not be updated
+    image = Image.new("RGB", size, color)
+    image.info["solid_color"] = tuple(color)
+    return image
+
+
+def solid_color(image: Union[Image.Image, np.ndarray]) -> Optional[Tuple[int, int, int]]:
+    # Get the RGB color of an image made of a single color, or None if it has several colors.
+    # A sparse sample of the pixels is checked first, so that most images are rejected without checking all pixels
+    if isinstance(image, Image.Image) and "solid_color" in image.info:
+        return image.info["solid_color"]
+
+    pixels = np.asarray(image) if is_rgb565_image(image) else image_to_array(image)
+    first = pixels[0, 0]
+    if not (pixels[::16, ::16] == first).all() or not (pixels == first).all():
+        return None
+
+    if pixels.ndim == 2:
+        first = rgb565_to_rgb(first.reshape(1, 1))[0, 0]
+    return int(first[0]), int(first[1]), int(first[2])
+
+
+def image_to_array(image: Union[Image.Image, np.ndarray], mode: str = "RGB") -> np.ndarray:
+    # Get a (height, width, channels) uint8 array from a PIL image. Arrays are returned as-is (no copy)
+    if isinstance(image, np.ndarray):
+        return image
+
+    if is_rgb565_image(image):
+        rgb = rgb565_to_rgb(np.asarray(image))
+        if mode == "RGBA":
+            return np.concatenate((rgb, np.full(rgb.shape[:2] + (1,), 255, dtype=np.uint8)), axis=2)
+        return rgb
+
+    if image.mode != mode:
+        if mode == "RGB" and image.mode == "RGBA":
+            # Alpha channel is ignored: keep only the first 3 channels instead of converting the whole image
+            return np.asarray(image)[:, :, :3]
+        image = image.convert(mode)
+
+    return np.asarray(image)
+
+
+def rotate_array(pixels: np.ndarray, rotation: int) -> np.ndarray:
+    # Get a view of a (height, width, ...) array rotated by rotation * 90° counterclockwise, like PIL
+    # Image.rotate(rotation * 90, expand=True). No data is copied
+    return np.rot90(pixels, rotation % 4) if rotation % 4 else pixels
+
+
+def rgb_to_rgb565(rgb: np.ndarray) -> np.ndarray:
+    # Color information is 0bRRRRRGGGGGGBBBBB, returned as native-endian uint16 values
+    r = rgb[..., 0].astype(np.uint16)
+    g = rgb[..., 1].astype(np.uint16)
+    b = rgb[..., 2].astype(np.uint16)
+    return ((r >> 3) << 11) | ((g >> 2) << 5) | (b >> 3)
+
+
+def rgb_to_rgb888(rgb: np.ndarray) -> np.ndarray:
+    # Color information is 0x00RRGGBB, returned as native-endian uint32 values
+    r = rgb[..., 0].astype(np.uint32)
+    g = rgb[..., 1].astype(np.uint32)
+    b = rgb[..., 2].astype(np.uint32)
+    return (r << 16) | (g << 8) | b
+
+
+def rgb888_to_rgb(rgb888: np.ndarray) -> np.ndarray:
+    # Get back a (height, width, 3) uint8 array from 0x00RRGGBB values
+    rgb = np.empty(rgb888.shape + (3,), dtype=np.uint8)
+    rgb[..., 0] = (rgb888 >> 16) & 0xFF
+    rgb[..., 1] = (rgb888 >> 8) & 0xFF
+    rgb[..., 2] = rgb888 & 0xFF
+    return rgb
+
+
+def rgb565_to_rgb(rgb565: np.ndarray) -> np.ndarray:
+    # Get back a (height, width, 3) uint8 array from RGB565 values: low bits are filled from the high bits
+    rgb565 = rgb565.astype(np.uint16)
+    rgb = np.empty(rgb565.shape + (3,), dtype=np.uint8)
+    r, g, b = (rgb565 >> 11) & 0x1F, (rgb565 >> 5) & 0x3F, rgb565 & 0x1F
+    rgb[..., 0] = (r << 3) | (r >> 2)
+    rgb[..., 1] = (g << 2) | (g >> 4)
+    rgb[..., 2] = (b << 3) | (b >> 2)
+    return rgb
+
+
+def image_to_rgb565_array(image: Union[Image.Image, np.ndarray], byteorder: str = "little",
+                          reverse: bool = False, rotation: int = 0) -> np.ndarray:
+    # Encode an image to a (height, width) array of RGB565 pixels
+    #  . Revision A: Little-Endian (native x86/ARM encoding)
+    #  . Revisions B & D: Big-Endian
+    # If reverse is True, the image is rotated 180° (for revisions that manage reverse orientations from software).
+    # Image is first rotated by rotation * 90° counterclockwise (see rotate_array).
+    # RGB565 images are not converted again: their pixels are only reordered, and byte-swapped if needed
+    if is_rgb565_image(image):
+        rgb565 = rotate_array(np.asarray(image), rotation)
+    else:
+        rgb565 = rgb_to_rgb565(rotate_array(image_to_array(image), rotation))
+    if reverse:
+        rgb565 = rgb565[::-1, ::-1]
+
+    return rgb565.astype('<u2' if byteorder == "little" else '>u2', copy=False)
+
+
+def image_to_rgb565(image: Union[Image.Image, np.ndarray], byteorder: str = "little",
+                    reverse: bool = False, rotation: int = 0) -> bytes:
+    return image_to_rgb565_array(image, byteorder, reverse, rotation).tobytes()
+
+
+def image_to_bgra_array(image: Union[Image.Image, np.ndarray], rotation: int = 0) -> np.ndarray:
+    # Encode an image to a (height, width, 4) array of 32-bit BGRA pixels (revision C full frame).
+    # Image is first rotated by rotation * 90° counterclockwise (see rotate_array)
+    rgba = rotate_array(image_to_array(image, "RGBA"), rotation)
+    return np.ascontiguousarray(rgba[..., [2, 1, 0, 3]])
+
+
+def image_to_bgra(image: Union[Image.Image, np.ndarray], rotation: int = 0) -> bytes:
+    return image_to_bgra_array(image, rotation).tobytes()
+
+
+def image_to_bgr_rows_array(image: Union[Image.Image, np.ndarray], first_row_offset: int,
+                            row_stride: int, rotation: int = 0) -> np.ndarray:
+    # Encode an image to 24-bit BGR, each row being preceded by a 5-byte header (revision C partial update):
+    #  . 3 bytes: offset of the first pixel of the row in the screen memory (Big-Endian)
+    #  . 2 bytes: row width in pixels (Big-Endian)
+    # The result is a (height, 5 + 3 * width) array, height and width being those of the image after rotation by
+    # rotation * 90° counterclockwise (see rotate_array)
+    rgb = rotate_array(image_to_array(image), rotation)
+    height, width = rgb.shape[0], rgb.shape[1]
+
+    offsets = first_row_offset + np.arange(height, dtype=np.uint32) * row_stride
+
+    rows = np.empty((height, 5 + 3 * width), dtype=np.uint8)
+    rows[:, 0] = (offsets >> 16) & 0xFF
+    rows[:, 1] = (offsets >> 8) & 0xFF
+    rows[:, 2] = offsets & 0xFF
+    rows[:, 3] = (width >> 8) & 0xFF
+    rows[:, 4] = width & 0xFF
+    rows[:, 5:].reshape(height, width, 3)[:] = rgb[:, :, 2::-1]
+
+    return rows
+
+
+def image_to_bgr_rows(image: Union[Image.Image, np.ndarray], first_row_offset: int, row_stride: int,
+                      rotation: int = 0) -> bytes:
+    return image_to_bgr_rows_array(image, first_row_offset, row_stride, rotation).tobytes()
@@ -0,0 +1,96 @@
+# turing-smart-screen-python - a Python system monitor and library for USB-C displays like Turing Smart Screen or XuanFang
+# https://github.com/mathoudebine/turing-smart-screen-python/
+
+# Copyright (C) 2021-2023  Matthieu Houdebine (mathoudebine)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Connection: state of the link with the display. When the link is lost (e.g. display unplugged), the port is reopened
+# from a background thread with exponential backoff, so that the threads sending data to the display never wait for it.
+
+import threading
+import time
+from enum import IntEnum
+from typing import Callable, Optional
+
+from library.lcd.transport import Transport
+from library.log import logger
+
+
+class ConnectionState(IntEnum):
+    CONNECTED = 0
+    DISCONNECTED = 1  # Link lost, reconnection in progress
+    RECONNECTED = 2  # Port reopened, waiting for the requests queued before to be dropped before using it
+
+
+class Connection:
+    # Delay before the first reconnection attempt, doubled after each failed attempt up to the maximum delay (seconds)
+    RECONNECT_DELAY = 1
+    RECONNECT_MAX_DELAY = 30
+
+    def __init__(self, reopen: Callable[[], Optional[Transport]], reconnected: Callable[[Transport], None],
+                 delay: float = RECONNECT_DELAY, max_delay: float = RECONNECT_MAX_DELAY):
+        # reopen() opens the port again and returns the new transport, or None if it failed.
+        # reconnected(transport) is called from the reconnection thread once the port has been reopened
+        self.reopen = reopen
+        self.reconnected = reconnected
+        self.delay = delay
+        self.max_delay = max_delay
+
+        self.mutex = threading.Lock()
+        self.state = ConnectionState.CONNECTED
+        self.thread = None
+
+        # Statistics
+        self.disconnections = 0
+        self.attempts = 0  # Reconnection attempts since the link was lost
+        self.disconnected_since = None
+
+    def is_connected(self) -> bool:
+        return self.state == ConnectionState.CONNECTED
+
+    def lost(self, error: Exception = None):
+        # Link with the display is lost: start reconnecting in background, unless it is already in progress
+        with self.mutex:
+            if self.state != ConnectionState.CONNECTED:
+                return
+            self.state = ConnectionState.DISCONNECTED
+            self.disconnections += 1
+            self.attempts = 0
+            self.disconnected_since = time.monotonic()
+            logger.error(f"Connection with the display lost ({error}), reconnecting in background")
+            self.thread = threading.Thread(target=self._reconnect, name="Display_Reconnect", daemon=True)
+            self.thread.start()
+
+    def _reconnect(self):
+        delay = self.delay
+        while True:
+            time.sleep(delay)
+            self.attempts += 1
+            transport = self.reopen()
+            if transport is not None:
+                break
+            logger.debug(f"Reconnection attempt {self.attempts} failed, next one in {min(delay * 2, self.max_delay)}s")
+            delay = min(delay * 2, self.max_delay)
+
+        with self.mutex:
+            self.state = ConnectionState.RECONNECTED
+        self.reconnected(transport)
+
+    def set_connected(self):
+        # New transport is in use: data can be sent to the display again
+        with self.mutex:
+            self.state = ConnectionState.CONNECTED
+            logger.info(f"Connection with the display restored after {time.monotonic() - self.disconnected_since:.1f}s"
+                        f" ({self.attempts} attempts)")
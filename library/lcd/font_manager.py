@@ -0,0 +1,119 @@
+# turing-smart-screen-python - a Python system monitor and library for USB-C displays like Turing Smart Screen or XuanFang
+# https://github.com/mathoudebine/turing-smart-screen-python/
+
+# Copyright (C) 2021-2023  Matthieu Houdebine (mathoudebine)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Font manager: fonts used by all drawing functions are opened once and kept in memory, so that no font file is opened
+# or parsed when widgets are refreshed. Fonts referenced by the theme are preloaded at startup.
+# Memory used by the fonts is bounded: least recently used fonts are closed first when the budget is exceeded. Users
+# keeping data tied to a font (e.g. glyph atlases) are notified, so that they release it with the font.
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Iterable, List, Tuple
+
+from PIL import ImageFont
+
+from library.log import logger
+
+
+class FontManager:
+    # Fonts are searched in this folder, unless their path is absolute
+    FONTS_DIR = "./res/fonts/"
+
+    # Default memory budget for opened fonts (bytes)
+    MEMORY_BUDGET = 32 * 1024 * 1024
+
+    def __init__(self, fonts_dir: str = FONTS_DIR, memory_budget: int = MEMORY_BUDGET,
+                 on_evict: Callable[[str, int], None] = None):
+        self.fonts_dir = fonts_dir
+        self.memory_budget = memory_budget
+        # Called with (font, size) of each font closed, outside of the mutex
+        self.on_evict = on_evict
+
+        self.fonts = OrderedDict()  # { key=(font, size), value=(PIL.ImageFont, estimated size in bytes) }
+        self.memory = 0
+        self.mutex = threading.Lock()
+
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def path(self, font: str) -> str:
+        return font if os.path.isabs(font) else self.fonts_dir + font
+
+    def _font_memory(self, font: str) -> int:
+        # Memory used by an opened font, estimated from the size of its file which FreeType may load entirely
+        try:
+            return os.path.getsize(self.path(font))
+        except OSError:
+            return 0
+
+    def get(self, font: str, size: int) -> ImageFont.FreeTypeFont:
+        key = (font, size)
+        with self.mutex:
+            entry = self.fonts.get(key)
+            if entry is not None:
+                self.fonts.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        # Font is opened outside the mutex: other threads can still get the fonts already opened
+        loaded = ImageFont.truetype(self.path(font), size)
+        memory = self._font_memory(font)
+
+        evicted = []
+        with self.mutex:
+            if key not in self.fonts:
+                self.fonts[key] = (loaded, memory)
+                self.memory += memory
+                # The font just opened is always kept, even if it exceeds the budget alone
+                while self.memory > self.memory_budget and len(self.fonts) > 1:
+                    evicted_key, (_, evicted_memory) = self.fonts.popitem(last=False)
+                    self.memory -= evicted_memory
+                    self.evictions += 1
+                    evicted.append(evicted_key)
+            loaded = self.fonts[key][0]
+        self._evicted(evicted)
+        return loaded
+
+    def _evicted(self, keys: List[Tuple[str, int]]):
+        if self.on_evict:
+            for font, size in keys:
+                self.on_evict(font, size)
+
+    def preload(self, fonts: Iterable[Tuple[str, int]]):
+        # Open the fonts in advance, e.g. all fonts referenced by the theme. Fonts that cannot be opened are skipped:
+        # the error will be raised when they are used
+        for font, size in fonts:
+            try:
+                self.get(font, size)
+            except OSError as e:
+                logger.warning(f"Cannot preload font {font} ({size}): {e}")
+        logger.debug(f"Preloaded {len(self.fonts)} fonts ({self.memory / 1024:.0f} kB)")
+
+    def clear(self):
+        with self.mutex:
+            evicted = list(self.fonts)
+            self.fonts.clear()
+            self.memory = 0
+        self._evicted(evicted)
+
+    def __len__(self) -> int:
+        return len(self.fonts)
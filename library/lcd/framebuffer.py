@@ -0,0 +1,133 @@
+# turing-smart-screen-python - a Python system monitor and library for USB-C displays like Turing Smart Screen or XuanFang
+# https://github.com/mathoudebine/turing-smart-screen-python/
+
+# Copyright (C) 2021-2023  Matthieu Houdebine (mathoudebine)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Shadow framebuffer: a copy of what is currently displayed on the screen, stored in the device pixel format.
+# Incoming images are compared against it so that only the pixels that actually changed are sent to the display.
+
+from typing import List, Tuple
+
+import numpy as np
+
+# A rectangle is stored as a PIL-like box: (left, top, right, bottom), right and bottom being excluded
+Rect = Tuple[int, int, int, int]
+
+
+def _runs(mask: np.ndarray, max_gap: int = 0) -> List[Tuple[int, int]]:
+    # Get [start, end) index ranges of consecutive True values in a 1D boolean array
+    # Ranges separated by max_gap False values or less are joined
+    edges = np.flatnonzero(np.diff(np.concatenate(([False], mask, [False])).astype(np.int8)))
+    starts, ends = edges[::2], edges[1::2]
+    if max_gap > 0 and len(starts) > 1:
+        keep = (starts[1:] - ends[:-1]) > max_gap
+        starts = starts[np.concatenate(([True], keep))]
+        ends = ends[np.concatenate((keep, [True]))]
+    return list(zip(starts.tolist(), ends.tolist()))
+
+
+def rect_area(rect: Rect) -> int:
+    return (rect[2] - rect[0]) * (rect[3] - rect[1])
+
+
+def rect_union(a: Rect, b: Rect) -> Rect:
+    return min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])
+
+
+def merge_rects(rects: List[Rect], command_cost: int, pixel_cost: int) -> List[Rect]:
+    # Merge rectangles as long as sending their union costs less than sending them separately:
+    # each transfer costs command_cost bytes, plus pixel_cost bytes per pixel
+    rects = list(rects)
+    merged = True
+    while merged and len(rects) > 1:
+        merged = False
+        for i in range(len(rects)):
+            for j in range(i + 1, len(rects)):
+                union = rect_union(rects[i], rects[j])
+                if rect_area(union) * pixel_cost <= (rect_area(rects[i]) + rect_area(rects[j])) * pixel_cost + command_cost:
+                    rects[i] = union
+                    del rects[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return rects
+
+
+def dirty_rects(changed: np.ndarray, command_cost: int, pixel_cost: int) -> List[Rect]:
+    # Split a 2D mask of changed pixels into rectangles covering all changed pixels
+    # Unchanged rows/columns are sent anyway if it is cheaper than starting a new transfer
+    pixel_cost = max(pixel_cost, 1)
+    rects = []
+    for top, bottom in _runs(changed.any(axis=1), command_cost // (pixel_cost * changed.shape[1])):
+        band = changed[top:bottom]
+        for left, right in _runs(band.any(axis=0), command_cost // (pixel_cost * (bottom - top))):
+            rows = np.flatnonzero(band[:, left:right].any(axis=1))
+            rects.append((left, top + int(rows[0]), right, top + int(rows[-1]) + 1))
+    return merge_rects(rects, command_cost, pixel_cost)
+
+
+class ShadowFramebuffer:
+    def __init__(self, width: int, height: int, dtype=np.uint16):
+        self.width = width
+        self.height = height
+        # Last pixel values sent to the display, in the device pixel format
+        self.pixels = np.zeros((height, width), dtype=dtype)
+        # Pixels for which the displayed content is known
+        self.valid = np.zeros((height, width), dtype=bool)
+        # Pixel value of the whole screen if it was filled with a single color and not updated since, else None
+        self.solid = None
+        # Pixels changed by the updates and not sent yet (see clear_changed), for HW revisions able to send them alone
+        self.changed = np.zeros((height, width), dtype=bool)
+
+    def invalidate(self):
+        # Content of the screen is unknown (e.g. after a reset): next updates will be sent entirely
+        self.valid[:] = False
+        self.solid = None
+
+    def mark_changed(self, rects: List[Rect]):
+        # Pixels of these rectangles must all be sent, whether they changed or not
+        for left, top, right, bottom in rects:
+            self.changed[top:bottom, left:right] = True
+
+    def clear_changed(self, rects: List[Rect]):
+        # Pixels of these rectangles have been sent
+        for left, top, right, bottom in rects:
+            self.changed[top:bottom, left:right] = False
+
+    def fill(self, value):
+        # Whole screen has been filled with a single color
+        self.pixels[:] = value
+        self.valid[:] = True
+        self.solid = value
+
+    def update(self, pixels: np.ndarray, x: int, y: int, command_cost: int = 0, pixel_cost: int = 1) -> List[Rect]:
+        # Store a region in the framebuffer and return the rectangles that changed, relative to the region
+        height, width = pixels.shape
+        current = self.pixels[y:y + height, x:x + width]
+        valid = self.valid[y:y + height, x:x + width]
+
+        changed = current != pixels
+        changed |= ~valid
+
+        current[:] = pixels
+        valid[:] = True
+        self.changed[y:y + height, x:x + width] |= changed
+
+        rects = dirty_rects(changed, command_cost, pixel_cost)
+        if rects:
+            self.solid = None
+        return rects
@@ -0,0 +1,121 @@
+# turing-smart-screen-python - a Python system monitor and library for USB-C displays like Turing Smart Screen or XuanFang
+# https://github.com/mathoudebine/turing-smart-screen-python/
+
+# Copyright (C) 2021-2023  Matthieu Houdebine (mathoudebine)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Glyph atlas: characters of a font are rasterized once, then texts are composed from them without calling FreeType.
+# Only characters having the same advance width (e.g. all characters of monospaced fonts, digits of most fonts) are
+# composed: each character of a text then occupies a fixed-width cell. Each character is checked once against the
+# rendering of a whole text by PIL, characters that would not be composed identically are not put in the atlas.
+
+import threading
+from typing import List, Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+# Text placed between 2 other characters to check that a character is composed like PIL renders it
+CHECK_CONTEXT = "0%s0"
+
+
+class GlyphAtlas:
+    def __init__(self, font: ImageFont.FreeTypeFont, font_color: Tuple[int, int, int],
+                 background_color: Tuple[int, int, int], anchor: str = None):
+        self.font = font
+        self.font_color = font_color
+        self.background_color = background_color
+        self.anchor = anchor
+
+        # Width of a character cell: advance of the digits, texts are only composed if it is a whole number of pixels
+        advance = font.getlength("0")
+        self.advance = int(advance) if advance == int(advance) else 0
+
+        # Coverage mask of each character and its bounding box relative to the origin of its cell.
+        # None for characters that cannot be composed
+        self.glyphs = {}  # { key=character, value=(bbox, np.ndarray) }
+        self.measure = ImageDraw.Draw(Image.new("L", (1, 1)))
+        self.mutex = threading.Lock()
+
+    def _render_glyph(self, char: str):
+        if self.font.getlength(char) != self.advance:
+            return None
+        bbox = self.measure.textbbox((0, 0), char, font=self.font, anchor=self.anchor)
+        if bbox[0] < 0 or bbox[2] > self.advance:
+            # Glyph drawn outside of its cell: coverage of overlapping glyphs cannot be merged like FreeType does
+            return None
+        mask = Image.new("L", (bbox[2] - bbox[0], bbox[3] - bbox[1]), 0)
+        ImageDraw.Draw(mask).text((-bbox[0], -bbox[1]), char, font=self.font, fill=255, anchor=self.anchor)
+        return bbox, np.asarray(mask)
+
+    def _glyph(self, char: str):
+        if char not in self.glyphs:
+            self.glyphs[char] = self._render_glyph(char)
+            if self.glyphs[char] is not None and not self._check(CHECK_CONTEXT % char):
+                self.glyphs[char] = None
+        return self.glyphs[char]
+
+    def _check(self, text: str) -> bool:
+        # Check that a composed text is identical to the text rendered by PIL, with the same bounding box
+        composed = self._compose(text)
+        if composed is None:
+            return False
+        image, left, top = composed
+        if self.measure.textbbox((0, 0), text, font=self.font, anchor=self.anchor) != \
+                (left, top, left + image.size[0], top + image.size[1]):
+            return False
+        expected = Image.new("RGB", image.size, self.background_color)
+        ImageDraw.Draw(expected).text((-left, -top), text, font=self.font, fill=self.font_color, anchor=self.anchor)
+        return np.array_equal(np.asarray(expected), np.asarray(image))
+
+    def _compose(self, text: str) -> Optional[Tuple[Image.Image, int, int]]:
+        glyphs = [self._glyph(char) for char in text]
+        if not self.advance or any(glyph is None for glyph in glyphs):
+            return None
+
+        # Bounding box of the text, relative to its origin
+        left = min(i * self.advance + bbox[0] for i, (bbox, _) in enumerate(glyphs))
+        right = max(i * self.advance + bbox[2] for i, (bbox, _) in enumerate(glyphs))
+        top = min(bbox[1] for bbox, _ in glyphs)
+        bottom = max(bbox[3] for bbox, _ in glyphs)
+
+        # Glyphs stay inside their cells and never overlap
+        mask = np.zeros((bottom - top, right - left), dtype=np.uint8)
+        for i, (bbox, glyph) in enumerate(glyphs):
+            x, y = i * self.advance + bbox[0] - left, bbox[1] - top
+            mask[y:y + glyph.shape[0], x:x + glyph.shape[1]] = glyph
+
+        image = Image.new("RGB", (right - left, bottom - top), self.background_color)
+        image.paste(self.font_color, (0, 0, right - left, bottom - top), Image.fromarray(mask, "L"))
+        return image, left, top
+
+    def render(self, text: str) -> Optional[Tuple[Image.Image, int, int]]:
+        # Compose a single-line text. Return the image and the position of its top-left corner relative to the text
+        # origin, or None if some characters are not in the atlas
+        with self.mutex:
+            return self._compose(text)
+
+    def can_compose(self, text: str) -> bool:
+        # Whether the text is composed from the atlas, i.e. each character occupies its own cell
+        with self.mutex:
+            return bool(self.advance) and all(self._glyph(char) is not None for char in text)
+
+    def changed_cells(self, old_text: str, new_text: str) -> List[int]:
+        # Indexes of the character cells that differ between 2 texts of the same length
+        return [i for i, (old, new) in enumerate(zip(old_text, new_text)) if old != new]
+
+    def cell_span(self, cells: List[int]) -> Tuple[int, int]:
+        # Horizontal span of pixels, relative to the text origin, covered by these cells
+        return min(cells) * self.advance, (max(cells) + 1) * self.advance
@@ -25,11 +25,23 @@ import threading
 import time
 from abc import ABC, abstractmethod
 from enum import IntEnum
-from typing import Tuple, List
+from typing import Tuple, List, Optional
 
+import numpy as np
 import serial
 from PIL import Image, ImageDraw, ImageFont
 
+import library.lcd.codec as codec
+from library.lcd.cache import LruCache
+from library.lcd.connection import Connection
+from library.lcd.framebuffer import ShadowFramebuffer, Rect, merge_rects, dirty_rects
+from library.lcd.font_manager import FontManager
+from library.lcd.glyph_atlas import GlyphAtlas
+from library.lcd.link_monitor import LinkMonitor
+from library.lcd.radial_bar import RadialBar, changed_box, normalize_angles
+from library.lcd.trace import TraceRecorder, TracingTransport
+from library.lcd.transport import Transport, open_transport
+from library.lcd.update_queue import UpdateQueue, RegionUpdate
 from library.log import logger
 
 
@@ -41,12 +53,34 @@ class Orientation(IntEnum):
 
 
 class LcdComm(ABC):
+    # Approximate cost in bytes of starting a new bitmap transfer, and of sending one pixel.
+    # Used to decide whether changed areas of an image are sent as several small bitmaps or as one bigger bitmap
+    COMMAND_COST = 64
+    PIXEL_COST = 2
+
+    # Byte order of the RGB565 pixels sent to the display ("little" or "big"), None if it does not use RGB565 pixels
+    RGB565_BYTEORDER = None
+
+    # Maximum number of rendered texts kept in cache
+    TEXT_CACHE_SIZE = 256
+
+    # Maximum number of background image areas kept in cache
+    BACKGROUND_CACHE_SIZE = 128
+
+    # Font of the min / max values drawn on line graph axis: (font, size)
+    GRAPH_AXIS_FONT = ("roboto/Roboto-Black.ttf", 10)
+
     def __init__(self, com_port: str = "AUTO", display_width: int = 320, display_height: int = 480,
                  update_queue: queue.Queue = None):
         self.lcd_serial = None
 
         # String containing absolute path to serial port e.g. "COM3", "/dev/ttyACM1" or "AUTO" for auto-discovery
         self.com_port = com_port
+        # Auto-discovery is done again when reconnecting: COM port may change when the display is plugged again
+        self.com_port_auto = com_port == "AUTO"
+
+        # State of the link with the display: when it is lost, data sent is dropped while reconnecting in background
+        self.connection = Connection(self._reopen_serial, self._reconnected)
 
         # Display always start in portrait orientation by default
         self.orientation = Orientation.PORTRAIT
@@ -60,14 +94,73 @@ class LcdComm(ABC):
         self.update_queue = update_queue
 
         # Mutex to protect the queue in case a thread want to add multiple requests (e.g. image data) that should not be
-        # mixed with other requests in-between
-        self.update_queue_mutex = threading.Lock()
+        # mixed with other requests in-between. Re-entrant so that a whole frame can be queued at once
+        self.update_queue_mutex = threading.RLock()
+
+        # Costs of bitmap transfers (see COMMAND_COST / PIXEL_COST), can be tuned per display
+        self.command_cost = self.COMMAND_COST
+        self.pixel_cost = self.PIXEL_COST
+
+        # Measures of the serial link throughput and latency, used to skip low-priority refreshes when it is overloaded
+        self.link_monitor = LinkMonitor()
+
+        # Trace of all data exchanged with the screen, to replay it later (see tools/trace-replay.py). None if disabled
+        self.trace_recorder = None
 
         # Create a cache to store opened images, to avoid opening and loading from the filesystem every time
         self.image_cache = {}  # { key=path, value=PIL.Image }
 
-        # Create a cache to store opened fonts, to avoid opening and loading from the filesystem every time
-        self.font_cache = {}  # { key=(font, size), value=PIL.ImageFont }
+        # Areas of background images behind widgets with transparent background, so that the full image is not copied
+        # and cropped on each refresh. Arrays in it are read-only
+        self.background_cache = LruCache(self.BACKGROUND_CACHE_SIZE)  # { key=(path, box, orientation), value=array }
+
+        # RGB565 rendering: images are converted once to RGB565 pixels in the device byte order, which are stored in the
+        # framebuffer and sent as-is. Bitmaps are cached as RGB565 pixels too, so that they are never converted again.
+        # Only for displays using RGB565 pixels, see rgb565_render_enabled()
+        self.rgb565_render = False
+        self.rgb565_cache = {}  # { key=path, value=np.ndarray of RGB565 pixels }
+
+        # Fonts used by all drawing functions, opened only once. See library/lcd/font_manager.py
+        self.font_manager = FontManager(on_evict=self._font_evicted)
+
+        # Cache of the texts rendered by DisplayText, with their position. Bitmaps in it must not be modified
+        self.text_cache = LruCache(self.TEXT_CACHE_SIZE)
+        # Image used to measure texts before allocating their bitmap
+        self.text_measure = ImageDraw.Draw(Image.new('RGB', (1, 1)))
+
+        # Glyph atlases used to compose single-line texts without FreeType, see library/lcd/glyph_atlas.py
+        self.glyph_atlas_enabled = True
+        self.glyph_atlases = {}  # { key=(font, size, font color, background color, anchor), value=GlyphAtlas }
+        # Last text displayed in each text field, to only send the character cells that changed without framebuffer
+        self.text_fields = {}
+        # Incremented when the whole screen content is replaced (e.g. cleared): text fields must be sent entirely
+        self.screen_epoch = 0
+
+        # Incremental progress bars: only the strip between the previous and the new fill edge is drawn and sent.
+        # For radial progress bars, only the sector that changed is sent
+        self.progress_bar_incremental = True
+        self.progress_bars = {}  # { key=bar position, size and colors, value=(filled width, screen epoch) }
+        self.radial_bars = {}  # { key=bar position, size and colors, value=(mask, text, text box, screen epoch) }
+
+        # Radial progress bars are composed from precomputed masks of their pixels, see library/lcd/radial_bar.py
+        self.radial_bar_masks_enabled = True
+        self.radial_bar_cache = {}  # { key=bar geometry, value=RadialBar }
+
+        # Shadow framebuffer containing what is currently displayed on the screen, in current orientation.
+        # Images are compared against it to only send the parts that changed. Set to False to always send full images
+        self.framebuffer_enabled = True
+        self.framebuffer = None
+        self.framebuffer_orientation = None
+
+        # Mutex to keep the framebuffer content and the order of the requests sent to the screen consistent
+        self.framebuffer_mutex = threading.Lock()
+
+        # Compositor: when enabled, images are drawn on an off-screen frame instead of being sent to the screen.
+        # Changes are sent all at once when FlushFrame() is called
+        self.compositor_enabled = False
+        self.frame = None  # PIL.Image in current orientation
+        self.frame_orientation = None
+        self.frame_damage = []  # List of areas drawn on the frame since last flush
 
     def get_width(self) -> int:
         if self.orientation == Orientation.PORTRAIT or self.orientation == Orientation.REVERSE_PORTRAIT:
@@ -97,7 +190,9 @@ class LcdComm(ABC):
             logger.debug(f"Static COM port: {self.com_port}")
 
         try:
-            self.lcd_serial = serial.Serial(self.com_port, 115200, timeout=1, rtscts=1)
+            self.lcd_serial = open_transport(self.com_port, 115200, timeout=1)
+            if self.trace_recorder:
+                self.lcd_serial = TracingTransport(self.lcd_serial, self.trace_recorder)
         except Exception as e:
             logger.error(f"Cannot open COM port {self.com_port}: {e}")
             try:
@@ -111,6 +206,71 @@ class LcdComm(ABC):
         except:
             pass
 
+    def _connection_lost(self, error: Exception):
+        # Error on the serial port: close it and reopen it in background
+        self.closeSerial()
+        self.connection.lost(error)
+
+    def _reopen_serial(self) -> Optional[Transport]:
+        # Called from the reconnection thread: open the port again, without using it yet
+        self.closeSerial()
+        com_port = self.auto_detect_com_port() if self.com_port_auto else self.com_port
+        if not com_port:
+            return None
+        try:
+            transport = open_transport(com_port, 115200, timeout=1)
+        except Exception as e:
+            logger.debug(f"Cannot open COM port {com_port}: {e}")
+            return None
+        self.com_port = com_port
+        if self.trace_recorder:
+            transport = TracingTransport(transport, self.trace_recorder)
+        return transport
+
+    def _reconnected(self, transport: Transport):
+        # Called from the reconnection thread. Requests queued while disconnected are dropped in order before the new
+        # transport is used, so that the display does not receive the end of a request whose start was dropped
+        with self.update_queue_mutex:
+            if self.update_queue:
+                self.update_queue.put((self._restore_connection, [transport]))
+                return
+        self._restore_connection(transport)
+
+    def _restore_connection(self, transport: Transport):
+        self.lcd_serial = transport
+        self.connection.set_connected()
+        self._restore_screen()
+
+    def _restore_screen(self):
+        # Display may have been reset or unplugged while disconnected: send the orientation and all known screen
+        # content again from the framebuffer, in as few bitmaps as possible
+        self.SetOrientation(self.orientation)
+        with self.framebuffer_mutex:
+            self.screen_epoch += 1
+            if self.framebuffer is None or self.framebuffer_orientation != self.orientation:
+                return
+            rects = dirty_rects(self.framebuffer.valid, self.command_cost, self.pixel_cost)
+            self.framebuffer.mark_changed(rects)
+            self._send_rects(self.framebuffer_to_image(self.framebuffer.pixels), 0, 0, rects)
+            self.framebuffer.clear_changed(rects)
+
+    def StartTrace(self, path: str):
+        # Record all data written to / read from the screen from now on. Tracing is done at transport level, so that
+        # accesses to lcd_serial made outside WriteLine / ReadData are also recorded
+        self.StopTrace()
+        self.trace_recorder = TraceRecorder(path)
+        if self.lcd_serial:
+            self.lcd_serial = TracingTransport(self.lcd_serial, self.trace_recorder)
+        logger.info(f"Recording trace of the communication with the screen to {path}")
+
+    def StopTrace(self):
+        if not self.trace_recorder:
+            return
+        if isinstance(self.lcd_serial, TracingTransport):
+            self.lcd_serial = self.lcd_serial.transport
+        self.trace_recorder.close()
+        self.trace_recorder = None
+
     def WriteData(self, byteBuffer: bytearray):
         self.WriteLine(bytes(byteBuffer))
 
@@ -123,36 +283,37 @@ class LcdComm(ABC):
             self.WriteLine(line)
 
     def WriteLine(self, line: bytes):
+        if not self.connection.is_connected():
+            # Data is dropped while disconnected: screen content is restored from the framebuffer once reconnected
+            return
+        start = time.perf_counter()
         try:
             self.lcd_serial.write(line)
+            self.link_monitor.record_write(len(line), time.perf_counter() - start)
         except serial.serialutil.SerialTimeoutException:
             # We timed-out trying to write to our device, slow things down.
             logger.warning("(Write line) Too fast! Slow down!")
-        except serial.serialutil.SerialException:
-            # Error writing data to device: close and reopen serial port, try to write again
-            logger.error(
-                "SerialException: Failed to send serial data to device. Closing and reopening COM port before retrying once.")
-            self.closeSerial()
-            time.sleep(1)
-            self.openSerial()
-            self.lcd_serial.write(line)
+        except serial.serialutil.SerialException as e:
+            # Error writing data to device: close serial port and reopen it in background
+            logger.error("SerialException: Failed to send serial data to device.")
+            self._connection_lost(e)
 
     def ReadData(self, readSize: int):
+        if not self.connection.is_connected():
+            return None
+        start = time.perf_counter()
         try:
             response = self.lcd_serial.read(readSize)
+            self.link_monitor.record_read(len(response), time.perf_counter() - start)
             # logger.debug("Received: [{}]".format(str(response, 'utf-8')))
             return response
         except serial.serialutil.SerialTimeoutException:
             # We timed-out trying to read from our device, slow things down.
             logger.warning("(Read data) Too fast! Slow down!")
-        except serial.serialutil.SerialException:
-            # Error writing data to device: close and reopen serial port, try to read again
-            logger.error(
-                "SerialException: Failed to read serial data from device. Closing and reopening COM port before retrying once.")
-            self.closeSerial()
-            time.sleep(1)
-            self.openSerial()
-            return self.lcd_serial.read(readSize)
+        except serial.serialutil.SerialException as e:
+            # Error reading data from device: close serial port and reopen it in background
+            logger.error("SerialException: Failed to read serial data from device.")
+            self._connection_lost(e)
 
     @staticmethod
     @abstractmethod
@@ -191,18 +352,222 @@ class LcdComm(ABC):
         pass
 
     @abstractmethod
-    def DisplayPILImage(
+    def _display_pil_image(
             self,
             image: Image,
             x: int = 0, y: int = 0,
             image_width: int = 0,
             image_height: int = 0
     ):
+        # Send an image to the display, without comparing it with the framebuffer content
         pass
 
+    @classmethod
+    def framebuffer_pixels(cls, rgb: np.ndarray) -> np.ndarray:
+        # Convert RGB pixels to the pixel format used by the display, to compare images with the framebuffer.
+        # RGB565 pixels are kept in the device byte order, so that they can be sent without conversion
+        return codec.image_to_rgb565_array(rgb, byteorder=cls.RGB565_BYTEORDER or "little")
+
+    @classmethod
+    def framebuffer_to_image(cls, pixels: np.ndarray) -> Image.Image:
+        # Get an image that can be sent to the display from framebuffer pixels (see framebuffer_pixels)
+        if cls.RGB565_BYTEORDER is not None:
+            # RGB565 pixels are already in the device byte order: they are sent as-is
+            return codec.rgb565_image(pixels)
+        return Image.fromarray(codec.rgb565_to_rgb(pixels), "RGB")
+
+    def _framebuffer_image(self) -> Optional[Image.Image]:
+        # Get the full screen content from the framebuffer, if it is entirely known
+        if self.framebuffer is None or self.framebuffer_orientation != self.orientation \
+                or not self.framebuffer.valid.all():
+            return None
+        return self.framebuffer_to_image(self.framebuffer.pixels)
+
+    def rgb565_render_enabled(self) -> bool:
+        return self.rgb565_render and self.RGB565_BYTEORDER is not None
+
+    def _fill_screen(self, color: Tuple[int, int, int]) -> bool:
+        # Fill the whole screen with a single color using a command of the display, without sending pixels.
+        # HW revisions having such a command override this method. Returns False if the color could not be filled
+        return False
+
+    def _clear_screen(self, color: Tuple[int, int, int]):
+        # Fill the whole screen with a single color, with a command of the display if it has one or else by sending
+        # a solid image. The framebuffer knows the new content of the screen: next images are compared with it
+        with self.framebuffer_mutex:
+            if not self._fill_screen(color):
+                self._display_pil_image(codec.solid_image((self.get_width(), self.get_height()), color))
+            self._fill_framebuffer(color)
+
+    def _fill_framebuffer(self, color: Tuple[int, int, int]):
+        # Whole screen has been filled with a single color. Must be called with the framebuffer mutex held
+        self.screen_epoch += 1
+        if not self.framebuffer_enabled:
+            return
+        pixel = self.framebuffer_pixels(np.array(color, dtype=np.uint8).reshape(1, 1, 3))
+        self.framebuffer = ShadowFramebuffer(self.get_width(), self.get_height(), dtype=pixel.dtype)
+        self.framebuffer.fill(pixel[0, 0])
+        self.framebuffer_orientation = self.orientation
+
+    def _full_screen_color(self, image: Image, x: int, y: int) -> Optional[Tuple[int, int, int]]:
+        # Get the color of an image covering the whole screen with a single color, None otherwise
+        if (x, y) != (0, 0) or image.size != (self.get_width(), self.get_height()):
+            return None
+        return codec.solid_color(image)
+
+    def _fill_or_queue_rects(self, image: Image, x: int, y: int, rects: List[Rect]):
+        # Send areas of an image displayed at (x, y), using the fill command of the display instead if the image
+        # is a solid color covering the whole screen. The framebuffer must already contain the image
+        if not self.connection.is_connected():
+            # Display is disconnected: the framebuffer keeps the latest content, sent at once when reconnected
+            return
+        if rects:
+            color = self._full_screen_color(image, x, y)
+            if color is not None and self._fill_screen(color):
+                if self.framebuffer is not None:
+                    self.framebuffer.clear_changed(rects)
+            else:
+                self._queue_rects(image, x, y, rects)
+
+    def invalidate_framebuffer(self):
+        # Screen content is not known anymore (e.g. after a reset / clear): next images will be sent entirely
+        with self.framebuffer_mutex:
+            self.framebuffer = None
+            self.screen_epoch += 1
+
+    def _changed_rects(self, image: Image, x: int, y: int) -> List[Rect]:
+        # Update the framebuffer with an image and get the areas of the screen that need to be sent
+        if not self.framebuffer_enabled:
+            return [(x, y, x + image.size[0], y + image.size[1])]
+
+        if codec.is_rgb565_image(image):
+            pixels = np.asarray(image)
+        else:
+            pixels = self.framebuffer_pixels(codec.image_to_array(image))
+
+        if self.framebuffer is None or self.framebuffer_orientation != self.orientation:
+            # A screen filled with a single color is the same in all orientations
+            solid = self.framebuffer.solid if self.framebuffer is not None else None
+            self.framebuffer = ShadowFramebuffer(self.get_width(), self.get_height(), dtype=pixels.dtype)
+            self.framebuffer_orientation = self.orientation
+            if solid is not None and solid.dtype == pixels.dtype:
+                self.framebuffer.fill(solid)
+
+        return [(x + left, y + top, x + right, y + bottom) for left, top, right, bottom in
+                self.framebuffer.update(pixels, x, y, self.command_cost, self.pixel_cost)]
+
+    def _display_pil_images(self, images: List[Tuple[Image.Image, int, int]]):
+        # Send several images to the display. HW revisions able to send them in a single request override this method
+        for image, x, y in images:
+            self._display_pil_image(image, x, y)
+
+    def _send_rects(self, image: Image, x: int, y: int, rects: List[Rect]):
+        # Send areas of an image displayed at (x, y). Areas are given in screen coordinates
+        images = []
+        for left, top, right, bottom in rects:
+            box = (left - x, top - y, right - x, bottom - y)
+            if box == (0, 0, image.size[0], image.size[1]):
+                images.append((image, left, top))
+            else:
+                images.append((image.crop(box), left, top))
+        if images:
+            self._display_pil_images(images)
+
+    def _queue_rects(self, image: Image, x: int, y: int, rects: List[Rect]):
+        # Send areas of an image displayed at (x, y). If the queue supports it, the requests are queued as a single
+        # update for the region covered by the image, that supersedes the update for this region still waiting if any
+        if not isinstance(self.update_queue, UpdateQueue):
+            self._send_rects(image, x, y, rects)
+            if self.framebuffer is not None:
+                self.framebuffer.clear_changed(rects)
+            return
+
+        region = (x, y, x + image.size[0], y + image.size[1])
+        with self.update_queue_mutex:
+            pending = self.update_queue.pending_update(region)
+            if pending is not None:
+                # Pending update will not be sent: areas it was sending are sent from the new image instead
+                if self.framebuffer is not None:
+                    self.framebuffer.mark_changed(pending.rects)
+                rects = merge_rects(pending.rects + rects, self.command_cost, self.pixel_cost)
+            with self.update_queue.capture() as requests:
+                self._send_rects(image, x, y, rects)
+            if self.framebuffer is not None:
+                self.framebuffer.clear_changed(rects)
+            self.update_queue.put_update(RegionUpdate(region, rects, requests), pending)
+
+    def DisplayPILImage(
+            self,
+            image: Image,
+            x: int = 0, y: int = 0,
+            image_width: int = 0,
+            image_height: int = 0
+    ):
+        # If the image height/width isn't provided, use the native image size
+        if not image_height:
+            image_height = image.size[1]
+        if not image_width:
+            image_width = image.size[0]
+
+        # If our image size + the (x, y) position offsets are bigger than our display, reduce the image size
+        image_width = min(image_width, image.size[0], self.get_width() - x)
+        image_height = min(image_height, image.size[1], self.get_height() - y)
+
+        if self.progress_bars or self.radial_bars:
+            self._forget_overwritten_bars(x, y, image_width, image_height)
+
+        if (not self.framebuffer_enabled and not self.compositor_enabled) \
+                or x < 0 or y < 0 or image_width <= 0 or image_height <= 0:
+            # Invalid coordinates are reported by the HW-specific code
+            self._display_pil_image(image, x, y, image_width, image_height)
+            return
+
+        if image_width != image.size[0] or image_height != image.size[1]:
+            image = image.crop((0, 0, image_width, image_height))
+
+        if self.rgb565_render_enabled() and not codec.is_rgb565_image(image):
+            # Image is converted only once: the same pixels are stored in the framebuffer and sent to the display
+            image = codec.rgb565_image(codec.image_to_rgb565_array(image, byteorder=self.RGB565_BYTEORDER))
+
+        with self.framebuffer_mutex:
+            if self.compositor_enabled:
+                # Draw on the off-screen frame, it will be sent on next flush
+                if self.frame is None or self.frame_orientation != self.orientation:
+                    mode = codec.RGB565_MODES[self.RGB565_BYTEORDER] if self.rgb565_render_enabled() else "RGB"
+                    self.frame = Image.new(mode, (self.get_width(), self.get_height()), 0)
+                    self.frame_orientation = self.orientation
+                    self.frame_damage = []
+                self.frame.paste(image, (x, y))
+                self.frame_damage.append((x, y, x + image_width, y + image_height))
+            else:
+                # Only send the parts of the image that are different from what is currently displayed
+                self._fill_or_queue_rects(image, x, y, self._changed_rects(image, x, y))
+
+    def FlushFrame(self):
+        # Send all changes made on the off-screen frame since last flush to the screen, in one batch of requests
+        with self.framebuffer_mutex:
+            if not self.frame_damage or self.frame_orientation != self.orientation:
+                return
+
+            rects = []
+            for left, top, right, bottom in merge_rects(self.frame_damage, self.command_cost, self.pixel_cost):
+                rects.extend(self._changed_rects(self.frame.crop((left, top, right, bottom)), left, top))
+            self.frame_damage = []
+
+            # Merge close areas of the frame: sending a few more pixels is cheaper than sending more commands
+            rects = merge_rects(rects, self.command_cost, self.pixel_cost)
+
+            # Lock queue mutex so that the whole frame is queued without other requests in-between
+            with self.update_queue_mutex:
+                self._fill_or_queue_rects(self.frame, 0, 0, rects)
+
     def DisplayBitmap(self, bitmap_path: str, x: int = 0, y: int = 0, width: int = 0, height: int = 0):
         image = self.open_image(bitmap_path)
-        self.DisplayPILImage(image, x, y, width, height)
+        if self.rgb565_render_enabled():
+            # Bitmap is converted to RGB565 only once
+            self.DisplayPILImage(codec.rgb565_image(self.open_image_rgb565(bitmap_path)), x, y, width, height)
+        else:
+            self.DisplayPILImage(image, x, y, width, height)
         return image, x, y
 
     def DisplayText(
@@ -229,6 +594,12 @@ class LcdComm(ABC):
         if isinstance(background_color, str):
             background_color = tuple(map(int, background_color.split(', ')))
 
+        # Colors are used in the text cache key: they must be hashable
+        if isinstance(font_color, list):
+            font_color = tuple(font_color)
+        if isinstance(background_color, list):
+            background_color = tuple(background_color)
+
         assert x <= self.get_width(), 'Text X coordinate ' + str(x) + ' must be <= display width ' + str(
             self.get_width())
         assert y <= self.get_height(), 'Text Y coordinate ' + str(y) + ' must be <= display height ' + str(
@@ -236,62 +607,123 @@ class LcdComm(ABC):
         assert len(text) > 0, 'Text must not be empty'
         assert font_size > 0, "Font size must be > 0"
 
-        if background_image is None:
-            # A text bitmap is created with max width/height by default : text with solid background
-            text_image = Image.new(
-                'RGB',
-                (self.get_width(), self.get_height()),
-                background_color
-            )
-        else:
-            # The text bitmap is created from provided background image : text with transparent background
-            text_image = self.open_image(background_image)
-
-        # Get text bounding box
-        if (font, font_size) not in self.font_cache:
-            self.font_cache[(font, font_size)] = ImageFont.truetype("./res/fonts/" + font, font_size)
-        font = self.font_cache[(font, font_size)]
-        d = ImageDraw.Draw(text_image)
-
-        if width == 0 or height == 0:
-            left, top, right, bottom = d.textbbox((x, y), text, font=font, align=align, anchor=anchor)
-
-            # textbbox may return float values, which is not good for the bitmap operations below.
-            # Let's extend the bounding box to the next whole pixel in all directions
-            left, top = math.floor(left), math.floor(top)
-            right, bottom = math.ceil(right), math.ceil(bottom)
+        # Single-line texts with solid background are composed from a glyph atlas of the font, without FreeType
+        atlas = None
+        if background_image is None and (width == 0 or height == 0) and isinstance(x, int) and isinstance(y, int) \
+                and '\n' not in text and (anchor is None or anchor.startswith("l")) and self.glyph_atlas_enabled:
+            atlas = self.glyph_atlas(font, font_size, font_color, background_color, anchor)
+
+        # Rendered text is cached: unchanged values (e.g. static labels, totals) are not rendered / converted again
+        key = (text, x, y, width, height, font, font_size, font_color, background_color, background_image, align,
+               anchor, self.orientation, self.rgb565_render_enabled())
+        cached = self.text_cache.get(key)
+        if cached is None:
+            cached = self._render_text(text, x, y, width, height, font, font_size, font_color, background_color,
+                                       background_image, align, anchor, atlas)
+            self.text_cache.put(key, cached)
+        text_image, left, top = cached
+
+        if atlas is not None and not self.framebuffer_enabled and atlas.can_compose(text):
+            # Without framebuffer, only the character cells that changed since the text was last displayed are sent
+            field = (x, y, font, font_size, font_color, background_color, anchor, self.orientation)
+            previous = self.text_fields.get(field)
+            self.text_fields[field] = (text, left, top, text_image.size, self.screen_epoch)
+            if previous is not None and previous[1:] == (left, top, text_image.size, self.screen_epoch) \
+                    and len(previous[0]) == len(text):
+                cells = atlas.changed_cells(previous[0], text)
+                if cells:
+                    start, end = atlas.cell_span(cells)
+                    start, end = max(start + x - left, 0), min(end + x - left, text_image.size[0])
+                    self.DisplayPILImage(text_image.crop((start, 0, end, text_image.size[1])), left + start, top)
+                return text_image, left, top
+
+        self.DisplayPILImage(text_image, left, top)
+        return text_image, left, top
+
+    def _render_text(self, text: str, x: int, y: int, width: int, height: int, font: str, font_size: int,
+                     font_color: Tuple[int, int, int], background_color: Tuple[int, int, int], background_image: str,
+                     align: str, anchor: str, atlas: Optional[GlyphAtlas]) -> Tuple[Image.Image, int, int]:
+        composed = atlas.render(text) if atlas is not None else None
+        if composed is not None:
+            text_image, left, top = composed
+            left, top = x + left, y + top
+            right, bottom = left + text_image.size[0], top + text_image.size[1]
+
+            # Restrict the dimensions if they overflow the display size
+            box = (max(left, 0), max(top, 0), min(right, self.get_width()), min(bottom, self.get_height()))
+            if box != (left, top, right, bottom):
+                text_image = text_image.crop((box[0] - left, box[1] - top, box[2] - left, box[3] - top))
+            left, top = box[0], box[1]
         else:
-            left, top, right, bottom = x, y, x + width, y + height
+            # Get text bounding box
+            font = self.get_font(font, font_size)
 
-            if anchor.startswith("m"):
-                x = (right + left) / 2
-            elif anchor.startswith("r"):
-                x = right
-            else:
-                x = left
+            if width == 0 or height == 0:
+                left, top, right, bottom = self.text_measure.textbbox((x, y), text, font=font, align=align,
+                                                                      anchor=anchor)
 
-            if anchor.endswith("m"):
-                y = (bottom + top) / 2
-            elif anchor.endswith("b"):
-                y = bottom
+                # textbbox may return float values, which is not good for the bitmap operations below.
+                # Let's extend the bounding box to the next whole pixel in all directions
+                left, top = math.floor(left), math.floor(top)
+                right, bottom = math.ceil(right), math.ceil(bottom)
             else:
-                y = top
+                left, top, right, bottom = x, y, x + width, y + height
 
-        # Draw text onto the background image with specified color & font
-        d.text((x, y), text, font=font, fill=font_color, align=align, anchor=anchor)
+                if anchor.startswith("m"):
+                    x = (right + left) / 2
+                elif anchor.startswith("r"):
+                    x = right
+                else:
+                    x = left
 
-        # Restrict the dimensions if they overflow the display size
-        left = max(left, 0)
-        top = max(top, 0)
-        right = min(right, self.get_width())
-        bottom = min(bottom, self.get_height())
+                if anchor.endswith("m"):
+                    y = (bottom + top) / 2
+                elif anchor.endswith("b"):
+                    y = bottom
+                else:
+                    y = top
+
+            # Restrict the dimensions if they overflow the display size
+            left = max(left, 0)
+            top = max(top, 0)
+            right = min(right, self.get_width())
+            bottom = min(bottom, self.get_height())
+
+            # Only the area of the text is allocated: text is drawn at the same position relative to it
+            if background_image is None:
+                # Text with solid background
+                text_image = Image.new('RGB', (right - left, bottom - top), background_color)
+            else:
+                # Text with transparent background: drawn on the area of the background image behind the text
+                text_image = self.background_image(background_image, (left, top, right, bottom))
 
-        # Crop text bitmap to keep only the text
-        text_image = text_image.crop(box=(left, top, right, bottom))
+            # Draw text onto the background image with specified color & font
+            d = ImageDraw.Draw(text_image)
+            d.text((x - left, y - top), text, font=font, fill=font_color, align=align, anchor=anchor)
 
-        self.DisplayPILImage(text_image, left, top)
+        if self.rgb565_render_enabled():
+            # Text is cached converted, as it is sent
+            text_image = codec.rgb565_image(codec.image_to_rgb565_array(text_image, byteorder=self.RGB565_BYTEORDER))
         return text_image, left, top
 
+    def get_font(self, font: str, font_size: int) -> ImageFont.FreeTypeFont:
+        return self.font_manager.get(font, font_size)
+
+    def _font_evicted(self, font: str, font_size: int):
+        # A font was closed by the font manager: release the glyph atlases that use it and the texts rendered with it,
+        # so that the font memory budget also bounds them
+        for key in list(self.glyph_atlases):
+            if key[:2] == (font, font_size):
+                self.glyph_atlases.pop(key, None)
+        self.text_cache.discard(lambda key: key[5:7] == (font, font_size))
+
+    def glyph_atlas(self, font: str, font_size: int, font_color: Tuple[int, int, int],
+                    background_color: Tuple[int, int, int], anchor: str = None) -> GlyphAtlas:
+        key = (font, font_size, font_color, background_color, anchor)
+        if key not in self.glyph_atlases:
+            self.glyph_atlases[key] = GlyphAtlas(self.get_font(font, font_size), font_color, background_color, anchor)
+        return self.glyph_atlases[key]
+
     def DisplayProgressBar(self, x: int, y: int, width: int, height: int, min_value: int = 0, max_value: int = 100,
                            value: int = 50,
                            bar_color: Tuple[int, int, int] = (0, 0, 0),
@@ -307,6 +739,12 @@ class LcdComm(ABC):
         if isinstance(background_color, str):
             background_color = tuple(map(int, background_color.split(', ')))
 
+        # Colors are used as key of the last drawn bars: they must be hashable
+        if isinstance(bar_color, list):
+            bar_color = tuple(bar_color)
+        if isinstance(background_color, list):
+            background_color = tuple(background_color)
+
         assert x <= self.get_width(), 'Progress bar X coordinate must be <= display width'
         assert y <= self.get_height(), 'Progress bar Y coordinate must be <= display height'
         assert x + width <= self.get_width(), 'Progress bar width exceeds display width'
@@ -320,29 +758,71 @@ class LcdComm(ABC):
 
         assert min_value <= value <= max_value, 'Progress bar value shall be between min and max'
 
+        bar_filled_width = (value / (max_value - min_value) * width) - 1
+        if bar_filled_width < 0:
+            bar_filled_width = 0
+        # Coordinates are truncated by PIL: this is the last column of the filled part of the bar
+        bar_filled_width = int(bar_filled_width)
+
+        box = (0, 0, width, height)
+        bar = (x, y, width, height, bar_color, bar_outline, background_color, background_image, self.orientation)
+        epoch = self.screen_epoch
+        if self.progress_bar_incremental:
+            # If the bar is still displayed as it was last drawn, only the strip between the previous and the new fill
+            # edge changes. The outline is never drawn again
+            previous = self.progress_bars.get(bar)
+            if previous is not None and previous[1] == epoch:
+                if previous[0] == bar_filled_width:
+                    # Nothing to draw
+                    return None, x, y
+                border = 1 if bar_outline else 0
+                left = max(min(previous[0], bar_filled_width) + 1, border)
+                right = min(max(previous[0], bar_filled_width) + 1, width - border)
+                if left >= right:
+                    # Fill edge moved outside of the bar or over its outline: nothing to draw
+                    self.progress_bars[bar] = (bar_filled_width, epoch)
+                    return None, x, y
+                box = (left, border, right, height - border)
+
+        bar_image = self._progress_bar_image(x, y, width, height, box, bar_filled_width, bar_color, bar_outline,
+                                             background_color, background_image)
+        self.DisplayPILImage(bar_image, x + box[0], y + box[1])
+        if self.progress_bar_incremental:
+            # Stored once the bar is displayed: displaying an image forgets the bars it is drawn over
+            self.progress_bars[bar] = (bar_filled_width, epoch)
+        return bar_image, x + box[0], y + box[1]
+
+    def _forget_overwritten_bars(self, x: int, y: int, width: int, height: int):
+        # An image is displayed over incremental progress bars: they will be drawn entirely on their next update
+        for bar in list(self.progress_bars):
+            if bar[0] < x + width and x < bar[0] + bar[2] and bar[1] < y + height and y < bar[1] + bar[3]:
+                self.progress_bars.pop(bar, None)
+        for bar in list(self.radial_bars):
+            xc, yc, radius = bar[:3]
+            if xc - radius < x + width and x < xc + radius and yc - radius < y + height and y < yc + radius:
+                self.radial_bars.pop(bar, None)
+
+    def _progress_bar_image(self, x: int, y: int, width: int, height: int, box: Tuple[int, int, int, int],
+                            bar_filled_width: int, bar_color: Tuple[int, int, int], bar_outline: bool,
+                            background_color: Tuple[int, int, int], background_image: str) -> Image.Image:
+        # Draw the area of a progress bar inside the box, relative to the progress bar
+        left, top, right, bottom = box
         if background_image is None:
             # A bitmap is created with solid background
-            bar_image = Image.new('RGB', (width, height), background_color)
+            bar_image = Image.new('RGB', (right - left, bottom - top), background_color)
         else:
-            # A bitmap is created from provided background image
-            bar_image = self.open_image(background_image)
-
-            # Crop bitmap to keep only the progress bar background
-            bar_image = bar_image.crop(box=(x, y, x + width, y + height))
+            # A bitmap is created from the area of the provided background image behind the progress bar
+            bar_image = self.background_image(background_image, (x + left, y + top, x + right, y + bottom))
 
         # Draw progress bar
-        bar_filled_width = (value / (max_value - min_value) * width) - 1
-        if bar_filled_width < 0:
-            bar_filled_width = 0
         draw = ImageDraw.Draw(bar_image)
-        draw.rectangle([0, 0, bar_filled_width, height - 1], fill=bar_color, outline=bar_color)
+        draw.rectangle([-left, -top, bar_filled_width - left, height - 1 - top], fill=bar_color, outline=bar_color)
 
         if bar_outline:
             # Draw outline
-            draw.rectangle([0, 0, width - 1, height - 1], fill=None, outline=bar_color)
+            draw.rectangle([-left, -top, width - 1 - left, height - 1 - top], fill=None, outline=bar_color)
 
-        self.DisplayPILImage(bar_image, x, y)
-        return bar_image, x, y
+        return bar_image
 
     def DisplayLineGraph(self, x: int, y: int, width: int, height: int,
                          values: List[float],
@@ -376,11 +856,8 @@ class LcdComm(ABC):
             # A bitmap is created with solid background
             graph_image = Image.new('RGB', (width, height), background_color)
         else:
-            # A bitmap is created from provided background image
-            graph_image = self.open_image(background_image)
-
-            # Crop bitmap to keep only the plot graph background
-            graph_image = graph_image.crop(box=(x, y, x + width, y + height))
+            # A bitmap is created from the area of the provided background image behind the plot graph
+            graph_image = self.background_image(background_image, (x, y, x + width, y + height))
 
         # if autoscale is enabled, define new min/max value to "zoom" the graph
         if autoscale:
@@ -431,13 +908,12 @@ class LcdComm(ABC):
             # Draw Legend
             draw.line([0, 0, 1, 0], fill=axis_color)
             text = f"{int(max_value)}"
-            font = ImageFont.truetype("./res/fonts/" + "roboto/Roboto-Black.ttf", 10)
+            font = self.get_font(*self.GRAPH_AXIS_FONT)
             left, top, right, bottom = font.getbbox(text)
             draw.text((2, 0 - top), text,
                       font=font, fill=axis_color)
 
             text = f"{int(min_value)}"
-            font = ImageFont.truetype("./res/fonts/" + "roboto/Roboto-Black.ttf", 10)
             left, top, right, bottom = font.getbbox(text)
             draw.text((width - 1 - right, height - 2 - bottom), text,
                       font=font, fill=axis_color)
@@ -474,11 +950,15 @@ class LcdComm(ABC):
         if isinstance(font_color, str):
             font_color = tuple(map(int, font_color.split(', ')))
 
-        if angle_start % 361 == angle_end % 361:
-            if clockwise:
-                angle_start += 0.1
-            else:
-                angle_end += 0.1
+        # Colors are used as key of the last drawn bars: they must be hashable
+        if isinstance(bar_color, list):
+            bar_color = tuple(bar_color)
+        if isinstance(background_color, list):
+            background_color = tuple(background_color)
+        if isinstance(font_color, list):
+            font_color = tuple(font_color)
+
+        angle_start, angle_end = normalize_angles(angle_start, angle_end, clockwise)
 
         assert xc - radius >= 0 and xc + radius <= self.get_width(), 'Progress bar width exceeds display width'
         assert yc - radius >= 0 and yc + radius <= self.get_height(), 'Progress bar height exceeds display height'
@@ -499,105 +979,86 @@ class LcdComm(ABC):
 
         diameter = 2 * radius
         bbox = (xc - radius, yc - radius, xc + radius, yc + radius)
-        #
-        if background_image is None:
-            # A bitmap is created with solid background
-            bar_image = Image.new('RGB', (diameter, diameter), background_color)
-        else:
-            # A bitmap is created from provided background image
-            bar_image = self.open_image(background_image)
-
-            # Crop bitmap to keep only the progress bar background
-            bar_image = bar_image.crop(box=bbox)
-
-        # Draw progress bar
         pct = (value - min_value) / (max_value - min_value)
-        draw = ImageDraw.Draw(bar_image)
+        radial_bar = self.radial_bar(radius, bar_width, angle_start, angle_end, angle_sep, angle_steps, clockwise)
+        bar = (xc, yc, radius, bar_width, angle_start, angle_end, angle_sep, angle_steps, clockwise, with_text, font,
+               font_size, font_color, bar_color, background_color, background_image, self.orientation)
 
-        # PIL arc method uses angles with
-        #  . 3 o'clock for 0
-        #  . clockwise from angle start to angle end
-        angle_start %= 361
-        angle_end %= 361
-        #
-        if clockwise:
-            if angle_end < angle_start:
-                ecart = 360 - angle_start + angle_end
-            else:
-                ecart = angle_end - angle_start
-            #
-            # solid bar case
-            if angle_sep == 0:
-                if angle_end < angle_start:
-                    angleE = angle_start + pct * ecart
-                    angleS = angle_start
-                else:
-                    angleS = angle_start
-                    angleE = angle_start + pct * ecart
-                draw.arc([0, 0, diameter - 1, diameter - 1], angleS, angleE,
-                         fill=bar_color, width=bar_width)
-            # discontinued bar case
-            else:
-                angleE = angle_start + pct * ecart
-                angle_complet = ecart / angle_steps
-                etapes = int((angleE - angle_start) / angle_complet)
-                for i in range(etapes):
-                    draw.arc([0, 0, diameter - 1, diameter - 1],
-                             angle_start + i * angle_complet,
-                             angle_start + (i + 1) * angle_complet - angle_sep,
-                             fill=bar_color,
-                             width=bar_width)
-
-                draw.arc([0, 0, diameter - 1, diameter - 1],
-                         angle_start + etapes * angle_complet,
-                         angleE,
-                         fill=bar_color,
-                         width=bar_width)
-        else:
-            if angle_end < angle_start:
-                ecart = angle_start - angle_end
-            else:
-                ecart = 360 - angle_end + angle_start
-            # solid bar case
-            if angle_sep == 0:
-                if angle_end < angle_start:
-                    angleE = angle_start
-                    angleS = angle_start - pct * ecart
-                else:
-                    angleS = angle_start - pct * ecart
-                    angleE = angle_start
-                draw.arc([0, 0, diameter - 1, diameter - 1], angleS, angleE,
-                         fill=bar_color, width=bar_width)
-            # discontinued bar case
-            else:
-                angleS = angle_start - pct * ecart
-                angle_complet = ecart / angle_steps
-                etapes = int((angle_start - angleS) / angle_complet)
-                for i in range(etapes):
-                    draw.arc([0, 0, diameter - 1, diameter - 1],
-                             angle_start - (i + 1) * angle_complet + angle_sep,
-                             angle_start - i * angle_complet,
-                             fill=bar_color,
-                             width=bar_width)
-
-                draw.arc([0, 0, diameter - 1, diameter - 1],
-                         angleS,
-                         angle_start - etapes * angle_complet,
-                         fill=bar_color,
-                         width=bar_width)
-
-        # Draw text
+        mask, mask_image = radial_bar.mask(pct) if self.radial_bar_masks_enabled else (None, None)
+
+        # Text position and area. Text is drawn at fractional coordinates: area is extended by 1 pixel on each side
+        text_box = None
         if with_text:
             if text is None:
                 text = f"{int(pct * 100 + .5)}%"
-            font = ImageFont.truetype("./res/fonts/" + font, font_size)
+            font = self.get_font(font, font_size)
             left, top, right, bottom = font.getbbox(text)
             w, h = right - left, bottom - top
-            draw.text((radius - w / 2, radius - top - h / 2), text,
+            text_position = (radius - w / 2, radius - top - h / 2)
+            text_box = (math.floor(text_position[0] + left) - 1, math.floor(text_position[1] + top) - 1,
+                        math.ceil(text_position[0] + right) + 1, math.ceil(text_position[1] + bottom) + 1)
+
+        box = (0, 0, diameter, diameter)
+        epoch = self.screen_epoch
+        if self.progress_bar_incremental and mask is not None:
+            # If the bar is still displayed as it was last drawn, only the sector of the bar that changed is sent,
+            # with the text if it changed
+            previous = self.radial_bars.get(bar)
+            if previous is not None and previous[3] == epoch:
+                boxes = [changed_box(previous[0], mask)]
+                if text != previous[1]:
+                    boxes += [previous[2], text_box]
+                boxes = [b for b in boxes if b is not None]
+                box = (max(min(b[0] for b in boxes), 0), max(min(b[1] for b in boxes), 0),
+                       min(max(b[2] for b in boxes), diameter), min(max(b[3] for b in boxes), diameter)) \
+                    if boxes else None
+                if box is None or box[0] >= box[2] or box[1] >= box[3]:
+                    # Nothing to draw
+                    self.radial_bars[bar] = (mask, text, text_box, epoch)
+                    return None, xc - radius, yc - radius
+
+        if background_image is None:
+            # A bitmap is created with solid background
+            bar_image = Image.new('RGB', (diameter, diameter), background_color)
+        else:
+            # A bitmap is created from the area of the provided background image behind the progress bar
+            bar_image = self.background_image(background_image, bbox)
+
+        if mask is not None:
+            # Draw progress bar: pixels covered by the bar for this value are set to the bar color
+            color = tuple(bar_color) + (255,) * (len(bar_image.mode) - len(bar_color))
+            bar_image.paste(color, (0, 0, diameter, diameter), mask_image)
+        else:
+            # Draw progress bar
+            draw = ImageDraw.Draw(bar_image)
+            for start, end in radial_bar.arcs(pct):
+                draw.arc([0, 0, diameter - 1, diameter - 1], start, end, fill=bar_color, width=bar_width)
+
+        # Draw text, unless it is outside of the area sent
+        if with_text and text_box[0] < box[2] and box[0] < text_box[2] \
+                and text_box[1] < box[3] and box[1] < text_box[3]:
+            draw = ImageDraw.Draw(bar_image)
+            draw.text(text_position, text,
                       font=font, fill=font_color)
 
-        self.DisplayPILImage(bar_image, xc - radius, yc - radius)
-        return bar_image, xc - radius, yc - radius
+        if box != (0, 0, diameter, diameter):
+            bar_image = bar_image.crop(box)
+
+        self.DisplayPILImage(bar_image, xc - radius + box[0], yc - radius + box[1])
+        if self.progress_bar_incremental and mask is not None:
+            # Stored once the bar is displayed: displaying an image forgets the bars it is drawn over
+            self.radial_bars[bar] = (mask, text, text_box, epoch)
+        return bar_image, xc - radius + box[0], yc - radius + box[1]
+
+    def radial_bar(self, radius: int, bar_width: int, angle_start: float, angle_end: float, angle_sep: float,
+                   angle_steps: int, clockwise: bool) -> RadialBar:
+        # Geometry and masks of a radial progress bar, computed only once
+        angle_start, angle_end = normalize_angles(angle_start, angle_end, clockwise)
+        key = (radius, bar_width, angle_start, angle_end, angle_sep, angle_steps, clockwise)
+        if key not in self.radial_bar_cache:
+            self.radial_bar_cache[key] = RadialBar(radius, bar_width, angle_start, angle_end, angle_sep, angle_steps,
+                                                   clockwise)
+        return self.radial_bar_cache[key]
 
     # Load image from the filesystem, or get from the cache if it has already been loaded previously
     def open_image(self, bitmap_path: str) -> Image.Image:
@@ -605,3 +1066,30 @@ class LcdComm(ABC):
             logger.debug("Bitmap " + bitmap_path + " is now loaded in the cache")
             self.image_cache[bitmap_path] = Image.open(bitmap_path)
         return copy.copy(self.image_cache[bitmap_path])
+
+    # Get the area of a background image behind a widget, as a read-only array shared by all refreshes of the widget
+    def background_crop(self, bitmap_path: str, box: Tuple[int, int, int, int]) -> np.ndarray:
+        key = (bitmap_path, box, self.orientation)
+        pixels = self.background_cache.get(key)
+        if pixels is None:
+            if bitmap_path not in self.image_cache:
+                self.open_image(bitmap_path)
+            image = self.image_cache[bitmap_path].crop(box)
+            if image.mode not in ("RGB", "RGBA"):
+                image = image.convert("RGB")
+            pixels = np.array(image)
+            pixels.flags.writeable = False
+            self.background_cache.put(key, pixels)
+        return pixels
+
+    # Get a new bitmap of the area of a background image behind a widget, to draw the widget on it
+    def background_image(self, bitmap_path: str, box: Tuple[int, int, int, int]) -> Image.Image:
+        return Image.fromarray(self.background_crop(bitmap_path, box))
+
+    # Get the pixels of an image as RGB565 values in the device byte order, converted only once
+    def open_image_rgb565(self, bitmap_path: str) -> np.ndarray:
+        if bitmap_path not in self.rgb565_cache:
+            pixels = codec.image_to_rgb565_array(self.open_image(bitmap_path), byteorder=self.RGB565_BYTEORDER)
+            pixels.flags.writeable = False
+            self.rgb565_cache[bitmap_path] = pixels
+        return self.rgb565_cache[bitmap_path]
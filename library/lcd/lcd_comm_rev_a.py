@@ -18,10 +18,12 @@
 
 import time
 from enum import Enum
+from math import ceil
 
-from serial.tools.list_ports import comports
 import numpy as np
+from serial.tools.list_ports import comports
 
+import library.lcd.codec as codec
 from library.lcd.lcd_comm import *
 from library.log import logger
 
@@ -52,10 +54,22 @@ class SubRevision(Enum):
 
 # This class is for Turing Smart Screen (rev. A) 3.5" and UsbMonitor screens (all sizes)
 class LcdCommRevA(LcdComm):
+    # Pixels are sent as RGB565 in Little-Endian
+    RGB565_BYTEORDER = "little"
+
+    # DISPLAY_PIXELS command: the number of pixels is given in the X field of the command, then each pixel is sent as
+    # X and Y coordinates (16-bit Big-Endian, like sizes in SET_ORIENTATION) followed by its RGB565 color.
+    # This layout has not been checked on all screens: the command is only used if enabled (see sparse_pixels)
+    PIXEL_ENTRY = np.dtype([('x', '>u2'), ('y', '>u2'), ('color', '<u2')])
+    PIXELS_PER_COMMAND = 1023
+
     def __init__(self, com_port: str = "AUTO", display_width: int = 320, display_height: int = 480,
-                 update_queue: queue.Queue = None):
+                 update_queue: queue.Queue = None, sparse_pixels: bool = False):
         logger.debug("HW revision: A")
         LcdComm.__init__(self, com_port, display_width, display_height, update_queue)
+        self.sub_revision = SubRevision.TURING_3_5  # Run a Hello command to detect correct sub-rev.
+        # Send scattered changed pixels with DISPLAY_PIXELS commands, on screens that support it
+        self.sparse_pixels = sparse_pixels
         self.openSerial()
 
     def __del__(self):
@@ -124,6 +138,7 @@ class LcdCommRevA(LcdComm):
         logger.info("Display reset (COM port may change)...")
         # Reset command bypasses queue because it is run when queue threads are not yet started
         self.SendCommand(Command.RESET, 0, 0, 0, 0, bypass_queue=True)
+        self.invalidate_framebuffer()
         self.closeSerial()
         # Wait for display reset then reconnect
         time.sleep(5)
@@ -131,14 +146,23 @@ class LcdCommRevA(LcdComm):
 
     def Clear(self):
         self.SetOrientation(Orientation.PORTRAIT)  # Bug: orientation needs to be PORTRAIT before clearing
-        self.SendCommand(Command.CLEAR, 0, 0, 0, 0)
+        self._clear_screen((255, 255, 255))
         self.SetOrientation()  # Restore default orientation
 
+    def _fill_screen(self, color: Tuple[int, int, int]) -> bool:
+        # CLEAR command fills the screen in white, only in portrait orientation (see Clear).
+        # TO_BLACK command is not used as it has not been tested
+        if color != (255, 255, 255) or self.orientation != Orientation.PORTRAIT:
+            return False
+        self.SendCommand(Command.CLEAR, 0, 0, 0, 0)
+        return True
+
     def ScreenOff(self):
         self.SendCommand(Command.SCREEN_OFF, 0, 0, 0, 0)
 
     def ScreenOn(self):
         self.SendCommand(Command.SCREEN_ON, 0, 0, 0, 0)
+        self.invalidate_framebuffer()
 
     def SetBrightness(self, level: int = 25):
         assert 0 <= level <= 100, 'Brightness level must be [0-100]'
@@ -170,35 +194,52 @@ class LcdCommRevA(LcdComm):
         byteBuffer[8] = (width & 255)
         byteBuffer[9] = (height >> 8)
         byteBuffer[10] = (height & 255)
-        self.lcd_serial.write(bytes(byteBuffer))
+        self.WriteLine(bytes(byteBuffer))
+
+    def sparse_pixels_supported(self) -> bool:
+        # DISPLAY_PIXELS command is only supported by next generation screens
+        return self.sparse_pixels and self.sub_revision != SubRevision.TURING_3_5
+
+    def sparse_pixels_cost(self, count: int) -> int:
+        # Cost in bytes of sending pixels with DISPLAY_PIXELS commands, to compare with sending a bitmap:
+        # COMMAND_COST + PIXEL_COST * area (see LcdComm)
+        return ceil(count / self.PIXELS_PER_COMMAND) * self.command_cost + count * self.PIXEL_ENTRY.itemsize
+
+    def _send_rects(self, image: Image, x: int, y: int, rects: List[Rect]):
+        # Areas where only a few scattered pixels changed (e.g. a line graph) are sent pixel by pixel, if it costs less
+        # than sending the whole area as a bitmap
+        if self.framebuffer is None or not self.sparse_pixels_supported():
+            LcdComm._send_rects(self, image, x, y, rects)
+            return
+
+        bitmap_rects = []
+        for left, top, right, bottom in rects:
+            changed = self.framebuffer.changed[top:bottom, left:right]
+            count = np.count_nonzero(changed)
+            if self.sparse_pixels_cost(count) < self.command_cost + self.pixel_cost * (right - left) * (bottom - top):
+                ys, xs = np.nonzero(changed)
+                entries = np.empty(count, dtype=self.PIXEL_ENTRY)
+                entries['x'] = xs + left
+                entries['y'] = ys + top
+                entries['color'] = self.framebuffer.pixels[top:bottom, left:right][changed]
+                self._display_pixels(entries)
+            else:
+                bitmap_rects.append((left, top, right, bottom))
+        LcdComm._send_rects(self, image, x, y, bitmap_rects)
+
+    def _display_pixels(self, entries: np.ndarray):
+        # Send a list of pixels, in PIXEL_ENTRY format
+        with self.update_queue_mutex:
+            for start in range(0, len(entries), self.PIXELS_PER_COMMAND):
+                chunk = entries[start:start + self.PIXELS_PER_COMMAND]
+                self.SendCommand(Command.DISPLAY_PIXELS, len(chunk), 0, 0, 0)
+                self.SendLine(chunk.tobytes())
 
     @staticmethod
     def imageToRGB565LE(image: Image):
-        if image.mode not in ["RGB", "RGBA"]:
-            # we need the first 3 channels to be R, G and B
-            image = image.convert("RGB")
-
-        rgb = np.asarray(image)
-
-        # flatten the first 2 dimensions (width and height) into a single stream
-        # of RGB pixels
-        rgb = rgb.reshape((image.size[1] * image.size[0], -1))
-
-        # extract R, G, B channels and promote them to 16 bits
-        r = rgb[:, 0].astype(np.uint16)
-        g = rgb[:, 1].astype(np.uint16)
-        b = rgb[:, 2].astype(np.uint16)
-
-        # construct RGB565
-        r = (r >> 3)
-        g = (g >> 2)
-        b = (b >> 3)
-        rgb565 = (r << 11) | (g << 5) | b
-
-        # serialize to little-endian
-        return rgb565.newbyteorder('<').tobytes()
+        return codec.image_to_rgb565(image, byteorder="little")
 
-    def DisplayPILImage(
+    def _display_pil_image(
             self,
             image: Image,
             x: int = 0, y: int = 0,
@@ -17,10 +17,9 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
-import struct
-
 from serial.tools.list_ports import comports
 
+import library.lcd.codec as codec
 from library.lcd.lcd_comm import *
 from library.log import logger
 
@@ -50,6 +49,9 @@ class SubRevision(IntEnum):
 
 # This class is for XuanFang (rev. B & flagship) 3.5" screens
 class LcdCommRevB(LcdComm):
+    # Pixels are sent as RGB565 in Big-Endian
+    RGB565_BYTEORDER = "big"
+
     def __init__(self, com_port: str = "AUTO", display_width: int = 320, display_height: int = 480,
                  update_queue: queue.Queue = None):
         logger.debug("HW revision: B")
@@ -149,9 +151,7 @@ class LcdCommRevB(LcdComm):
         # Force an orientation in case the screen is currently configured with one different from the theme
         backup_orientation = self.orientation
         self.SetOrientation(orientation=Orientation.PORTRAIT)
-
-        blank = Image.new("RGB", (self.get_width(), self.get_height()), (255, 255, 255))
-        self.DisplayPILImage(blank)
+        self._clear_screen((255, 255, 255))
 
         # Restore orientation
         self.SetOrientation(orientation=backup_orientation)
@@ -163,6 +163,7 @@ class LcdCommRevB(LcdComm):
     def ScreenOn(self):
         # HW revision B does not implement a "ScreenOn" native command: using SetBrightness() instead
         self.SetBrightness()
+        self.invalidate_framebuffer()
 
     def SetBrightness(self, level: int = 25):
         assert 0 <= level <= 100, 'Brightness level must be [0-100]'
@@ -195,7 +196,7 @@ class LcdCommRevB(LcdComm):
         else:
             self.SendCommand(Command.SET_ORIENTATION, payload=[OrientationValueRevB.ORIENTATION_LANDSCAPE])
 
-    def DisplayPILImage(
+    def _display_pil_image(
             self,
             image: Image,
             x: int = 0, y: int = 0,
@@ -232,34 +233,17 @@ class LcdCommRevB(LcdComm):
                                   (y0 >> 8) & 255, y0 & 255,
                                   (x1 >> 8) & 255, x1 & 255,
                                   (y1 >> 8) & 255, y1 & 255])
-        pix = image.load()
-        line = bytes()
+        if image_width != image.size[0] or image_height != image.size[1]:
+            image = image.crop((0, 0, image_width, image_height))
+
+        # Color information is 0bRRRRRGGGGGGBBBBB, encoded in Big-Endian for revision B
+        # Reverse orientations are managed from software, because display does not manage it
+        reverse = self.orientation == Orientation.REVERSE_PORTRAIT or self.orientation == Orientation.REVERSE_LANDSCAPE
+        rgb565be = codec.image_to_rgb565(image, byteorder="big", reverse=reverse)
 
         # Lock queue mutex then queue all the requests for the image data
         with self.update_queue_mutex:
-            for h in range(image_height):
-                for w in range(image_width):
-                    if self.orientation == Orientation.PORTRAIT or self.orientation == Orientation.LANDSCAPE:
-                        R = pix[w, h][0] >> 3
-                        G = pix[w, h][1] >> 2
-                        B = pix[w, h][2] >> 3
-                    else:
-                        # Manage reverse orientations from software, because display does not manage it
-                        R = pix[image_width - w - 1, image_height - h - 1][0] >> 3
-                        G = pix[image_width - w - 1, image_height - h - 1][1] >> 2
-                        B = pix[image_width - w - 1, image_height - h - 1][2] >> 3
-
-                    # Color information is 0bRRRRRGGGGGGBBBBB
-                    # Revision A: Encode in Little-Endian (native x86/ARM encoding)
-                    # Revition B: Encode in Big-Endian
-                    rgb = (R << 11) | (G << 5) | B
-                    line += struct.pack('>H', rgb)
-
-                    # Send image data by multiple of "display width" bytes
-                    if len(line) >= self.get_width() * 8:
-                        self.SendLine(line)
-                        line = bytes()
-
-            # Write last line if needed
-            if len(line) > 0:
-                self.SendLine(line)
+            # Send image data by multiple of "display width" bytes
+            chunk_size = self.get_width() * 8
+            for start in range(0, len(rgb565be), chunk_size):
+                self.SendLine(rgb565be[start:start + chunk_size])
@@ -19,15 +19,21 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 import queue
+import threading
 import time
+from collections import deque
 from enum import Enum
 from math import ceil
+from typing import List, Tuple
 
+import numpy as np
 import serial
 from PIL import Image
 from serial.tools.list_ports import comports
 
+import library.lcd.codec as codec
 from library.lcd.lcd_comm import Orientation, LcdComm
+from library.lcd.transport import Transport
 from library.log import logger
 
 
@@ -57,6 +63,8 @@ class Count:
 #   SEND QUERY_STATUS
 #   READ STATUS(1024)
 
+# STATUS frames are read by a separate thread: several commands can be sent before their STATUS is received
+
 class Command(Enum):
     # COMMANDS
     HELLO = bytearray((0x01, 0xef, 0x69, 0x00, 0x00, 0x00, 0x01, 0x00, 0x00, 0x00, 0xc5, 0xd3))
@@ -128,10 +136,51 @@ class SubRevision(Enum):
 
 # This class is for Turing Smart Screen 5" screens
 class LcdCommRevC(LcdComm):
+    # Several areas are sent in one UPDATE_BITMAP request: an additional area only costs its 5-byte row headers.
+    # Pixels are sent in 24-bit BGR format. Default costs are estimated from the protocol and not measured on a
+    # display: they can be tuned with the COMMAND_COST / PIXEL_COST options of config.yaml
+    COMMAND_COST = 64
+    PIXEL_COST = 3
+
+    # Partial updates are sent as 24-bit pixels with row headers, full frames as 32-bit pixels without headers:
+    # full frames carry more bytes, but are handled faster by the display. When the updated area exceeds this
+    # fraction of the screen, the whole screen is sent with DISPLAY_BITMAP instead (if its content is known).
+    # Default value is an estimate, it can be tuned with the FULL_FRAME_RATIO option of config.yaml
+    FULL_FRAME_RATIO = 0.8
+
+    # Size of the STATUS frames sent by the display after images and QUERY_STATUS / STOP_MEDIA commands
+    STATUS_SIZE = 1024
+
+    # Default number of STATUS frames that can be awaited at once: commands are sent without waiting for the answers
+    # to the previous ones, until this many answers are missing. Set to 1 to wait for each answer before going on
+    STATUS_WINDOW = 4
+
+    # Maximum time to wait for a STATUS frame, in seconds. After that it is considered lost
+    STATUS_TIMEOUT = 1
+
     def __init__(self, com_port: str = "AUTO", display_width: int = 480, display_height: int = 800,
-                 update_queue: queue.Queue = None):
+                 update_queue: queue.Queue = None, status_window: int = STATUS_WINDOW,
+                 full_frame_ratio: float = FULL_FRAME_RATIO, command_cost: int = COMMAND_COST,
+                 pixel_cost: int = PIXEL_COST):
         logger.debug("HW revision: C")
         LcdComm.__init__(self, com_port, display_width, display_height, update_queue)
+
+        self.full_frame_ratio = full_frame_ratio
+        self.command_cost = command_cost
+        self.pixel_cost = pixel_cost
+
+        # STATUS frames awaited: time at which each one was requested, oldest first
+        self.status_window = max(1, status_window)
+        self.pending_status = deque()
+        self.status_condition = threading.Condition()
+        self.status_reader = None
+        # Set while the status reader thread reads the port, and to keep it from reading it (e.g. to read a HELLO answer)
+        self.status_reading = False
+        self.status_paused = False
+        self.last_status = {}
+        # Set when the display asked to send an image again: next update will send the whole screen
+        self.resend_requested = False
+
         self.openSerial()
 
     def __del__(self):
@@ -162,42 +211,157 @@ class LcdCommRevC(LcdComm):
 
     def _send_command(self, cmd: Command, payload: bytearray = None, padding: Padding = None,
                       bypass_queue: bool = False, readsize: int = None):
-        message = bytearray()
-
-        if cmd != Command.SEND_PAYLOAD:
-            message = bytearray(cmd.value)
+        header = cmd.value if cmd != Command.SEND_PAYLOAD else b''
 
         # logger.debug("Command: {}".format(cmd.name))
 
         if not padding:
             padding = Padding.NULL
 
-        if payload:
-            message.extend(payload)
+        if not payload:
+            payload = b''
 
-        msg_size = len(message)
+        msg_size = len(header) + len(payload)
+        pad_size = (250 * ceil(msg_size / 250) - msg_size)
 
-        if not (msg_size / 250).is_integer():
-            pad_size = (250 * ceil(msg_size / 250) - msg_size)
-            message += bytearray(padding.value * pad_size)
+        if not header and not pad_size:
+            # Payload is already a multiple of 250 bytes (e.g. generated by _generate_message): send it without copy
+            message = payload
+        else:
+            # Preallocate the whole message, filled with padding, then copy header and payload in it
+            message = bytearray(padding.value * (msg_size + pad_size))
+            message[:len(header)] = header
+            message[len(header):msg_size] = payload
 
         # If no queue for async requests, or if asked explicitly to do the request sequentially: do request now
         if not self.update_queue or bypass_queue:
             self.WriteData(message)
             if readsize:
-                self.ReadData(readsize)
+                self._expect_status()
         else:
             # Lock queue mutex then queue the request
             self.update_queue.put((self.WriteData, [message]))
             if readsize:
-                self.update_queue.put((self.ReadData, [readsize]))
+                self.update_queue.put((self._expect_status, []))
+
+    def _expect_status(self):
+        # A STATUS frame will be sent by the display for the last command: it is read by the status reader thread.
+        # Only wait if too many frames are awaited, so that the display is not sent more than it can handle
+        if not self.connection.is_connected():
+            # Command was not sent: no STATUS frame will come
+            return
+        with self.status_condition:
+            self.pending_status.append(time.perf_counter())
+            if self.status_reader is None:
+                self.status_reader = threading.Thread(target=self._read_status, name="Status_Reader", daemon=True)
+                self.status_reader.start()
+            self.status_condition.notify_all()
+        self._wait_status(self.status_window - 1)
+
+    def _wait_status(self, max_pending: int = 0):
+        # Wait until at most max_pending STATUS frames are awaited. Frames not received in time are considered lost
+        with self.status_condition:
+            while len(self.pending_status) > max_pending:
+                remaining = self.pending_status[0] + self.STATUS_TIMEOUT - time.perf_counter()
+                if remaining <= 0:
+                    logger.warning("Display did not send its status in time, going on without it")
+                    self.pending_status.popleft()
+                else:
+                    self.status_condition.wait(remaining)
+
+    def _read_status(self):
+        # Status reader thread: read STATUS frames while some are awaited
+        frame = bytearray()
+        while True:
+            with self.status_condition:
+                while not self.pending_status or self.status_paused:
+                    self.status_condition.wait()
+                self.status_reading = True
+            try:
+                data = self.lcd_serial.read(self.STATUS_SIZE - len(frame))
+            except Exception as e:
+                # Port is closed / being reopened (e.g. display reset): try again later
+                logger.debug(f"Cannot read display status: {e}")
+                data = None
+            with self.status_condition:
+                self.status_reading = False
+                self.status_condition.notify_all()
+            if data is None:
+                frame.clear()
+                time.sleep(0.1)
+                continue
+            if not frame:
+                # Frames start with their text fields: 0x00 bytes are the end of a frame that was cut (see below)
+                data = data.lstrip(b'\x00')
+            frame += data
+            self._resync_status(frame)
+            if len(frame) == self.STATUS_SIZE:
+                self._status_received(bytes(frame))
+                frame.clear()
+
+    @staticmethod
+    def _resync_status(frame: bytearray):
+        # Frames are text fields padded with 0x00: text following the padding is the start of the next frame, and
+        # means some bytes of the current frame were lost. The cut frame is dropped (its answer will time out), so that
+        # the next frames are read from their start
+        end = frame.find(b'\x00')
+        if end < 0:
+            return
+        start = len(frame) - len(frame[end:].lstrip(b'\x00'))
+        if start < len(frame):
+            logger.debug("Display status frame was cut, dropping it")
+            del frame[:start]
+
+    def _status_received(self, frame: bytes):
+        with self.status_condition:
+            if self.pending_status:
+                self.link_monitor.record_read(len(frame), time.perf_counter() - self.pending_status.popleft())
+            self.status_condition.notify_all()
+
+        self.last_status = self.parse_status(frame)
+        if self.last_status.get("needReSend") == "1":
+            logger.warning("Display asked to send the last image again: next update will send the whole screen")
+            self.resend_requested = True
+
+    @staticmethod
+    def parse_status(frame: bytes) -> dict:
+        # STATUS frames are text fields "name:value" terminated by '!', padded with 0x00 e.g. "needReSend:0!"
+        text = frame.rstrip(b'\x00').decode(errors='ignore')
+        return dict(field.split(':', 1) for field in text.split('!') if ':' in field)
+
+    def _pause_status_reader(self):
+        # Keep the status reader thread from reading the port, once it is done with its current read
+        with self.status_condition:
+            self.status_paused = True
+            while self.status_reading:
+                self.status_condition.wait()
+
+    def _resume_status_reader(self):
+        with self.status_condition:
+            self.status_paused = False
+            self.status_condition.notify_all()
+
+    def _restore_connection(self, transport: Transport):
+        # STATUS frames awaited from the previous connection will never come: forget them once the status reader is
+        # done with the previous port, before using the new one
+        self._pause_status_reader()
+        with self.status_condition:
+            self.pending_status.clear()
+        self._resume_status_reader()
+        LcdComm._restore_connection(self, transport)
 
     def _hello(self):
-        # This command reads LCD answer on serial link, so it bypasses the queue
-        self.sub_revision = SubRevision.UNKNOWN
-        self._send_command(Command.HELLO, bypass_queue=True)
-        response = str(self.lcd_serial.read(22).decode())
-        self.lcd_serial.flushInput()
+        # This command reads LCD answer on serial link, so it bypasses the queue.
+        # Wait for awaited STATUS frames first, and pause the status reader so that it does not get the answer
+        self._wait_status()
+        self._pause_status_reader()
+        try:
+            self.sub_revision = SubRevision.UNKNOWN
+            self._send_command(Command.HELLO, bypass_queue=True)
+            response = str(self.lcd_serial.read(22).decode())
+            self.lcd_serial.flushInput()
+        finally:
+            self._resume_status_reader()
         if response.startswith(SubRevision.FIVEINCH.value):
             self.sub_revision = SubRevision.FIVEINCH
         else:
@@ -212,6 +376,10 @@ class LcdCommRevC(LcdComm):
         logger.info("Display reset (COM port may change)...")
         # Reset command bypasses queue because it is run when queue threads are not yet started
         self._send_command(Command.RESTART, bypass_queue=True)
+        self.invalidate_framebuffer()
+        with self.status_condition:
+            # Display will not answer anymore: do not wait for STATUS frames
+            self.pending_status.clear()
         self.closeSerial()
         # Wait for display reset then reconnect
         time.sleep(15)
@@ -222,9 +390,7 @@ class LcdCommRevC(LcdComm):
         # Force an orientation in case the screen is currently configured with one different from the theme
         backup_orientation = self.orientation
         self.SetOrientation(orientation=Orientation.PORTRAIT)
-
-        blank = Image.new("RGB", (self.get_width(), self.get_height()), (0, 0, 0))
-        self.DisplayPILImage(blank)
+        self._clear_screen((0, 0, 0))
 
         # Restore orientation
         self.SetOrientation(orientation=backup_orientation)
@@ -241,6 +407,7 @@ class LcdCommRevC(LcdComm):
         self._send_command(Command.STOP_VIDEO)
         self._send_command(Command.STOP_MEDIA, readsize=1024)
         # self._send_command(Command.SET_BRIGHTNESS, payload=bytearray([255]))
+        self.invalidate_framebuffer()
 
     def SetBrightness(self, level: int = 25):
         # logger.info("Call SetBrightness")
@@ -263,7 +430,7 @@ class LcdCommRevC(LcdComm):
             b = Command.STARTMODE_DEFAULT.value + Padding.NULL.value + Command.NO_FLIP.value + SleepInterval.OFF.value
             self._send_command(Command.OPTIONS, payload=b)
 
-    def DisplayPILImage(
+    def _display_pil_image(
             self,
             image: Image,
             x: int = 0, y: int = 0,
@@ -293,7 +460,7 @@ class LcdCommRevC(LcdComm):
                 self._send_command(Command.START_DISPLAY_BITMAP, padding=Padding.START_DISPLAY_BITMAP)
                 self._send_command(Command.DISPLAY_BITMAP)
                 self._send_command(Command.SEND_PAYLOAD,
-                                   payload=bytearray(self._generate_full_image(image, self.orientation)),
+                                   payload=self._generate_full_image(image, self.orientation),
                                    readsize=1024)
                 self._send_command(Command.QUERY_STATUS, readsize=1024)
         else:
@@ -305,64 +472,119 @@ class LcdCommRevC(LcdComm):
                 self._send_command(Command.QUERY_STATUS, readsize=1024)
             Count.Start += 1
 
+    def _display_pil_images(self, images: List[Tuple[Image.Image, int, int]]):
+        # Send all images in a single UPDATE_BITMAP request, followed by a single status read
+        update_area = sum(image.size[0] * image.size[1] for image, _, _ in images)
+        if update_area > self.full_frame_ratio * self.get_width() * self.get_height() or self.resend_requested:
+            full_image = self._framebuffer_image()
+            if full_image is not None:
+                self.resend_requested = False
+                self._display_pil_image(full_image)
+                return
+
+        if len(images) == 1:
+            self._display_pil_image(*images[0])
+            return
+
+        with self.update_queue_mutex:
+            img, pyd = self._generate_update_images(images, Count.Start, Command.UPDATE_BITMAP, self.orientation)
+            self._send_command(Command.SEND_PAYLOAD, payload=pyd)
+            self._send_command(Command.SEND_PAYLOAD, payload=img)
+            self._send_command(Command.QUERY_STATUS, readsize=1024)
+        Count.Start += 1
+
     @staticmethod
-    def _generate_full_image(image: Image, orientation: Orientation = Orientation.PORTRAIT):
-        if orientation == Orientation.PORTRAIT:
-            image = image.rotate(90, expand=True)
-        elif orientation == Orientation.REVERSE_PORTRAIT:
-            image = image.rotate(270, expand=True)
-        elif orientation == Orientation.REVERSE_LANDSCAPE:
-            image = image.rotate(180)
+    def framebuffer_to_image(pixels: np.ndarray) -> Image.Image:
+        return Image.fromarray(codec.rgb888_to_rgb(pixels), "RGB")
 
-        image_data = image.convert("RGBA").load()
-        image_ret = ''
-        for y in range(image.height):
-            for x in range(image.width):
-                pixel = image_data[x, y]
-                image_ret += f'{pixel[2]:02x}{pixel[1]:02x}{pixel[0]:02x}{pixel[3]:02x}'
+    @staticmethod
+    def framebuffer_pixels(rgb: np.ndarray) -> np.ndarray:
+        # Display uses 24-bit colors
+        return codec.rgb_to_rgb888(rgb)
+
+    # Rotation (number of 90° counterclockwise rotations) from each orientation to the native landscape orientation
+    # of the display. Images are rotated by the encoders while they are converted, without making a rotated copy
+    ROTATIONS = {
+        Orientation.PORTRAIT: 1,
+        Orientation.LANDSCAPE: 0,
+        Orientation.REVERSE_PORTRAIT: 3,
+        Orientation.REVERSE_LANDSCAPE: 2,
+    }
 
-        hex_data = bytearray.fromhex(image_ret)
-        return b'\x00'.join(hex_data[i:i + 249] for i in range(0, len(hex_data), 249))
+    @staticmethod
+    def _generate_full_image(image: Image, orientation: Orientation = Orientation.PORTRAIT):
+        return LcdCommRevC._generate_message(
+            codec.image_to_bgra_array(image, rotation=LcdCommRevC.ROTATIONS[orientation]))
 
-    def _generate_update_image(self, image, x, y, count, cmd: Command = None,
-                               orientation: Orientation = Orientation.PORTRAIT):
+    def _generate_update_rows(self, image, x, y, orientation: Orientation = Orientation.PORTRAIT) -> bytes:
+        # Position of the image in the native orientation, once rotated
         x0, y0 = x, y
+        width, height = image.size
 
         if orientation == Orientation.PORTRAIT:
-            image = image.rotate(90, expand=True)
-            x0 = self.get_width() - x - image.height
+            x0 = self.get_width() - x - width
         elif orientation == Orientation.REVERSE_PORTRAIT:
-            image = image.rotate(270, expand=True)
-            y0 = self.get_height() - y - image.width
+            y0 = self.get_height() - y - height
         elif orientation == Orientation.REVERSE_LANDSCAPE:
-            image = image.rotate(180, expand=True)
-            y0 = self.get_width() - x - image.width
-            x0 = self.get_height() - y - image.height
+            y0 = self.get_width() - x - width
+            x0 = self.get_height() - y - height
         elif orientation == Orientation.LANDSCAPE:
             x0, y0 = y, x
 
-        img_raw_data = []
-        image_data = image.convert("RGBA").load()
-        for h in range(image.height):
-            img_raw_data.append(f'{((x0 + h) * self.display_height) + y0:06x}{image.width:04x}')
-            for w in range(image.width):
-                current_pixel = image_data[w, h]
-                img_raw_data.append(f'{current_pixel[2]:02x}{current_pixel[1]:02x}{current_pixel[0]:02x}')
+        # Each row of the image has its own position header, so rows of several images can be sent in one message
+        return codec.image_to_bgr_rows_array(image, (x0 * self.display_height) + y0, self.display_height,
+                                             rotation=self.ROTATIONS[orientation])
+
+    @staticmethod
+    def _generate_message(data: np.ndarray, suffix: bytes = b'') -> bytearray:
+        # Build a message from data bytes and a suffix, padded with 0x00 to a multiple of 250 bytes.
+        # Messages bigger than 250 bytes are split into 249-byte chunks separated by a 0x00 byte
+        data = data.reshape(-1)
+        size = len(data)
+        chunks = ceil(size / 249) if size > 250 else 1
+        msg_size = size + chunks - 1 + len(suffix)
+
+        message = bytearray(250 * ceil(msg_size / 250))
+        view = np.frombuffer(message, dtype=np.uint8)
+        if chunks > 1:
+            # Copy full chunks with a strided assignment: 249 data bytes then 1 padding byte (left to 0x00)
+            full_chunks = size // 249
+            view[:full_chunks * 250].reshape(full_chunks, 250)[:, :249] = \
+                data[:full_chunks * 249].reshape(full_chunks, 249)
+            view[full_chunks * 250:full_chunks * 250 + size - full_chunks * 249] = data[full_chunks * 249:]
+        else:
+            view[:size] = data
+        del view
 
-        image_msg = ''.join(img_raw_data)
-        image_size = f'{int((len(image_msg) / 2) + 2):06x}'  # The +2 is for the "ef69" that will be added later.
+        message[msg_size - len(suffix):msg_size] = suffix
+        return message
+
+    @staticmethod
+    def _generate_update_payload(image_rows: List[np.ndarray], count, cmd: Command = None):
+        # The +2 is for the "ef69" that will be added later.
+        image_size = (sum(rows.size for rows in image_rows) + 2).to_bytes(3, 'big')
 
         # logger.debug("Render Count: {}".format(count))
         payload = bytearray()
 
         if cmd:
             payload.extend(cmd.value)
-        payload.extend(bytearray.fromhex(image_size))
+        payload.extend(image_size)
         payload.extend(Padding.NULL.value * 3)
         payload.extend(count.to_bytes(4, 'big'))
 
-        if len(image_msg) > 500:
-            image_msg = '00'.join(image_msg[i:i + 498] for i in range(0, len(image_msg), 498))
-        image_msg += 'ef69'
+        if len(image_rows) == 1:
+            image_msg = image_rows[0]
+        else:
+            image_msg = np.concatenate([rows.reshape(-1) for rows in image_rows])
+
+        return LcdCommRevC._generate_message(image_msg, suffix=b'\xef\x69'), payload
+
+    def _generate_update_image(self, image, x, y, count, cmd: Command = None,
+                               orientation: Orientation = Orientation.PORTRAIT):
+        return self._generate_update_payload([self._generate_update_rows(image, x, y, orientation)], count, cmd)
 
-        return bytearray.fromhex(image_msg), payload
+    def _generate_update_images(self, images: List[Tuple[Image.Image, int, int]], count, cmd: Command = None,
+                                orientation: Orientation = Orientation.PORTRAIT):
+        image_rows = [self._generate_update_rows(image, x, y, orientation) for image, x, y in images]
+        return self._generate_update_payload(image_rows, count, cmd)
@@ -16,11 +16,12 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
-import struct
 from enum import Enum
 
+import numpy as np
 from serial.tools.list_ports import comports
 
+import library.lcd.codec as codec
 from library.lcd.lcd_comm import *
 from library.log import logger
 
@@ -40,6 +41,16 @@ class Command(Enum):
 
 # This class is for Kipye Qiye Smart Display 3.5"
 class LcdCommRevD(LcdComm):
+    # Pixels are sent as RGB565 in Big-Endian
+    RGB565_BYTEORDER = "big"
+
+    # Bitmap data is sent in packets of 64 bytes: 1 command byte (0x50) + 63 data bytes
+    PACKET_SIZE = 64
+    PACKET_COMMAND = 0x50
+
+    # Number of packets sent in a single write to the serial port
+    PACKETS_PER_WRITE = 64
+
     def __init__(self, com_port: str = "AUTO", display_width: int = 320, display_height: int = 480,
                  update_queue: queue.Queue = None):
         logger.debug("HW revision: D")
@@ -61,11 +72,14 @@ class LcdCommRevD(LcdComm):
 
         return auto_com_port
 
-    def WriteData(self, byteBuffer: bytearray):
-        LcdComm.WriteData(self, byteBuffer)
-
-        # Empty the input buffer after each write: we don't process acknowledgements the screen sends back
-        self.lcd_serial.reset_input_buffer()
+    def _reset_input_buffer(self):
+        # Empty the input buffer: we don't process acknowledgements the screen sends back
+        if not self.connection.is_connected():
+            return
+        try:
+            self.lcd_serial.reset_input_buffer()
+        except serial.serialutil.SerialException as e:
+            self._connection_lost(e)
 
     def SendCommand(self, cmd: Command, payload: bytearray = None, bypass_queue: bool = False):
         message = bytearray(cmd.value)
@@ -89,10 +103,14 @@ class LcdCommRevD(LcdComm):
         self.Clear()
 
     def Clear(self):
-        # HW revision D does not implement a Clear command: display a blank image on the whole screen
-        color = 0xFFFF  # RGB565 White color
-        color_bytes = bytearray(color.to_bytes(2))
-        self.SendCommand(cmd=Command.DISPCOLOR, payload=color_bytes)
+        # HW revision D does not implement a Clear command: fill the whole screen in white
+        self._clear_screen((255, 255, 255))
+
+    def _fill_screen(self, color: Tuple[int, int, int]) -> bool:
+        # DISPCOLOR command fills the whole screen with any RGB565 color
+        color_bytes = codec.rgb_to_rgb565(np.array(color, dtype=np.uint8).reshape(1, 1, 3)).astype('>u2').tobytes()
+        self.SendCommand(cmd=Command.DISPCOLOR, payload=bytearray(color_bytes))
+        return True
 
     def ScreenOff(self):
         # HW revision D does not implement a "ScreenOff" native command: using SetBrightness(0) instead
@@ -101,6 +119,7 @@ class LcdCommRevD(LcdComm):
     def ScreenOn(self):
         # HW revision D does not implement a "ScreenOn" native command: using SetBrightness() instead
         self.SetBrightness()
+        self.invalidate_framebuffer()
 
     def SetBrightness(self, level: int = 25):
         assert 0 <= level <= 100, 'Brightness level must be [0-100]'
@@ -125,7 +144,7 @@ class LcdCommRevD(LcdComm):
         else:
             self.SendCommand(cmd=Command.SETORG)
 
-    def DisplayPILImage(
+    def _display_pil_image(
             self,
             image: Image,
             x: int = 0, y: int = 0,
@@ -159,47 +178,59 @@ class LcdCommRevD(LcdComm):
             (x0, y0) = (x, y)
             (x1, y1) = (x + image_width - 1, y + image_height - 1)
         else:
-            # Landscape / reverse landscape orientations are software managed: rotate image -90° and get new coordinates
-            image = image.rotate(270, expand=True)
+            # Landscape / reverse landscape orientations are software managed: image is rotated -90° by the encoder
             (x0, y0) = (self.display_width - y - image_height, x)
             (x1, y1) = (self.display_width - y - 1, x + image_width - 1)
             image_width, image_height = image_height, image_width
 
-        # Send bitmap size
-        image_data = bytearray(x0.to_bytes(2))
-        image_data += bytearray(x1.to_bytes(2))
-        image_data += bytearray(y0.to_bytes(2))
-        image_data += bytearray(y1.to_bytes(2))
-        self.SendCommand(cmd=Command.BLOCKWRITE, payload=image_data)
-
-        # Prepare bitmap data transmission
-        self.SendCommand(Command.INTOPICMODE)
-
-        pix = image.load()
-        line = bytes([80])
+        # Color information is 0bRRRRRGGGGGGBBBBB, encoded in Big-Endian for revision D
+        rotation = 0 if self.orientation in (Orientation.PORTRAIT, Orientation.REVERSE_PORTRAIT) else 3
+        packets = self._generate_packets(codec.image_to_rgb565_array(image, byteorder="big", rotation=rotation))
 
-        # Lock queue mutex then queue all the requests for the image data
+        # Lock queue mutex then queue all the requests for the image, so that they are not mixed with other requests
         with self.update_queue_mutex:
-            for h in range(image_height):
-                for w in range(image_width):
-                    R = pix[w, h][0] >> 3
-                    G = pix[w, h][1] >> 2
-                    B = pix[w, h][2] >> 3
-
-                    # Color information is 0bRRRRRGGGGGGBBBBB
-                    # Revision A: Encode in Little-Endian (native x86/ARM encoding)
-                    # Revition B: Encode in Big-Endian
-                    rgb = (R << 11) | (G << 5) | B
-                    line += struct.pack('>H', rgb)
-
-                    # Send image data by multiple of 64 bytes + 1 command byte
-                    if len(line) >= 65:
-                        self.SendLine(line[0:64])
-                        line = bytes([80]) + line[64:]
-
-            # Write last line if needed
-            if len(line) > 0:
-                self.SendLine(line)
-
-        # Indicate the complete bitmap has been transmitted
-        self.SendCommand(Command.OUTPICMODE)
+            # Send bitmap size
+            image_data = bytearray(x0.to_bytes(2))
+            image_data += bytearray(x1.to_bytes(2))
+            image_data += bytearray(y0.to_bytes(2))
+            image_data += bytearray(y1.to_bytes(2))
+            self.SendCommand(cmd=Command.BLOCKWRITE, payload=image_data)
+
+            # Prepare bitmap data transmission
+            self.SendCommand(Command.INTOPICMODE)
+
+            # Send image data by multiple of 64-byte packets
+            write_size = self.PACKET_SIZE * self.PACKETS_PER_WRITE
+            packets = memoryview(packets)
+            for start in range(0, len(packets), write_size):
+                self.SendLine(packets[start:start + write_size])
+
+            # Indicate the complete bitmap has been transmitted
+            self.SendCommand(Command.OUTPICMODE)
+
+            # Acknowledgements sent back by the screen are not processed: discard them once the bitmap is sent
+            if self.update_queue:
+                self.update_queue.put((self._reset_input_buffer, []))
+            else:
+                self._reset_input_buffer()
+
+    @classmethod
+    def _generate_packets(cls, data: np.ndarray) -> bytearray:
+        # Split data into packets made of 1 command byte + 63 data bytes, in a single preallocated buffer.
+        # Last packet is shorter if data size is not a multiple of 63
+        data = np.ascontiguousarray(data).reshape(-1).view(np.uint8)
+        size = len(data)
+        data_size = cls.PACKET_SIZE - 1
+        full_packets = size // data_size
+        rest = size - full_packets * data_size
+
+        packets = bytearray(size + full_packets + (1 if rest else 0))
+        view = np.frombuffer(packets, dtype=np.uint8)
+        grid = view[:full_packets * cls.PACKET_SIZE].reshape(full_packets, cls.PACKET_SIZE)
+        grid[:, 0] = cls.PACKET_COMMAND
+        grid[:, 1:] = data[:full_packets * data_size].reshape(full_packets, data_size)
+        if rest:
+            view[full_packets * cls.PACKET_SIZE] = cls.PACKET_COMMAND
+            view[full_packets * cls.PACKET_SIZE + 1:] = data[full_packets * data_size:]
+
+        return packets
@@ -0,0 +1,452 @@
+# turing-smart-screen-python - a Python system monitor and library for USB-C displays like Turing Smart Screen or XuanFang
+# https://github.com/mathoudebine/turing-smart-screen-python/
+
+# Copyright (C) 2021-2023  Matthieu Houdebine (mathoudebine)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# LCD emulators: parse the byte streams sent by the HW revisions A/B/C/D, answer like the real displays and rebuild
+# the content of the screen. Unlike LcdSimulated, the whole wire protocol is used, so emulators can be used to test
+# and benchmark the drivers without hardware (see tools/lcd-emulator.py).
+# Screen content is stored as an RGB array in the native portrait orientation of the panel. Images sent in landscape /
+# reverse orientations are rotated back to it, so that screenshot() can show the screen in any orientation.
+
+import os
+import selectors
+import socket
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from math import ceil
+from typing import Generator, Optional
+from urllib.parse import urlparse
+
+import numpy as np
+from PIL import Image
+
+import library.lcd.codec as codec
+from library.lcd.lcd_comm import Orientation
+from library.log import logger
+
+# Number of 90° counterclockwise rotations from the panel to an orientation: view[y, x] is the logical pixel (x, y)
+ROTATIONS = {
+    Orientation.PORTRAIT: 0,
+    Orientation.LANDSCAPE: 1,
+    Orientation.REVERSE_PORTRAIT: 2,
+    Orientation.REVERSE_LANDSCAPE: 3,
+}
+
+# Parsers are generators yielding the number of bytes they need, and receiving these bytes
+Parser = Generator[int, bytes, None]
+
+
+class LcdEmulator(ABC):
+    def __init__(self, display_width: int, display_height: int):
+        # Screen content, in native portrait orientation
+        self.display_width = display_width
+        self.display_height = display_height
+        self.panel = np.full((display_height, display_width, 3), 255, dtype=np.uint8)
+        self.brightness = None
+        self.screen_on = True
+        self.mutex = threading.Lock()
+
+        # Data received and not parsed yet
+        self.buffer = bytearray()
+        self.position = 0
+
+        # Data to send back to the host: (time at which it is sent, data)
+        self.replies = deque()
+        # Time taken by the display to answer a command, in seconds
+        self.reply_delay = 0
+
+        # Statistics
+        self.bytes_received = 0
+        self.commands = 0
+        self.bitmaps = 0
+        self.pixels = 0
+        self.errors = 0
+
+        self.parser = self.parse()
+        self.needed = next(self.parser)
+
+    @abstractmethod
+    def parse(self) -> Parser:
+        pass
+
+    def feed(self, data: bytes):
+        # Process data received from the host
+        with self.mutex:
+            self.bytes_received += len(data)
+            self.buffer += data
+            while len(self.buffer) - self.position >= self.needed:
+                chunk = bytes(self.buffer[self.position:self.position + self.needed])
+                self.position += self.needed
+                self.needed = self.parser.send(chunk)
+            if self.position > len(self.buffer) // 2:
+                # Drop parsed data once in a while, rather than after each chunk
+                del self.buffer[:self.position]
+                self.position = 0
+
+    def reply(self, data: bytes):
+        self.replies.append((time.monotonic() + self.reply_delay, data))
+
+    def get_replies(self) -> bytes:
+        # Get data to send back to the host now
+        with self.mutex:
+            replies = bytearray()
+            now = time.monotonic()
+            while self.replies and self.replies[0][0] <= now:
+                replies += self.replies.popleft()[1]
+            return bytes(replies)
+
+    def view(self, rotation: int) -> np.ndarray:
+        # Writable view of the panel in an orientation, given as a number of 90° counterclockwise rotations
+        return np.rot90(self.panel, rotation)
+
+    def draw(self, view: np.ndarray, x0: int, y0: int, rgb: np.ndarray, new_bitmap: bool = True) -> bool:
+        height, width = rgb.shape[:2]
+        if x0 < 0 or y0 < 0 or x0 + width > view.shape[1] or y0 + height > view.shape[0]:
+            logger.warning("Emulator: bitmap (%d, %d) %dx%d is out of screen" % (x0, y0, width, height))
+            self.errors += 1
+            return False
+        view[y0:y0 + height, x0:x0 + width] = rgb
+        self.bitmaps += new_bitmap
+        self.pixels += width * height
+        return True
+
+    def unknown(self, data: bytes):
+        logger.warning("Emulator: unknown command %s" % data[:16].hex())
+        self.errors += 1
+
+    def screenshot(self, orientation: Orientation = Orientation.PORTRAIT) -> Image.Image:
+        # Screen content as seen in an orientation
+        with self.mutex:
+            return Image.fromarray(np.ascontiguousarray(self.view(ROTATIONS[orientation])), "RGB")
+
+
+class LcdEmulatorRevA(LcdEmulator):
+    # Answer of UsbMonitor screens to HELLO command (official Turing 3.5" screens do not answer)
+    HELLO_REPLY = bytes([0x01] * 6)
+
+    def __init__(self, display_width: int = 320, display_height: int = 480, hello_reply: bytes = HELLO_REPLY):
+        self.hello_reply = hello_reply
+        self.orientation = Orientation.PORTRAIT
+        LcdEmulator.__init__(self, display_width, display_height)
+
+    def parse(self) -> Parser:
+        while True:
+            header = yield 6
+            self.commands += 1
+            cmd = header[5]
+            x = (header[0] << 2) + (header[1] >> 6)
+            y = ((header[1] & 63) << 4) + (header[2] >> 4)
+            ex = ((header[2] & 15) << 6) + (header[3] >> 2)
+            ey = ((header[3] & 3) << 8) + header[4]
+
+            if header == bytes([69] * 6):  # HELLO
+                self.reply(self.hello_reply)
+            elif cmd == 197:  # DISPLAY_BITMAP
+                width, height = ex - x + 1, ey - y + 1
+                data = yield width * height * 2
+                rgb = codec.rgb565_to_rgb(np.frombuffer(data, dtype='<u2').reshape(height, width))
+                self.draw(self.view(ROTATIONS[self.orientation]), x, y, rgb)
+            elif cmd == 195:  # DISPLAY_PIXELS: x field is the number of pixels
+                data = yield x * 6
+                entries = np.frombuffer(data, dtype=[('x', '>u2'), ('y', '>u2'), ('color', '<u2')])
+                view = self.view(ROTATIONS[self.orientation])
+                xs, ys = entries['x'].astype(np.intp), entries['y'].astype(np.intp)
+                if (xs >= view.shape[1]).any() or (ys >= view.shape[0]).any():
+                    logger.warning("Emulator: pixel out of screen")
+                    self.errors += 1
+                else:
+                    view[ys, xs] = codec.rgb565_to_rgb(entries['color'])
+                    self.pixels += len(entries)
+            elif cmd == 121:  # SET_ORIENTATION
+                data = yield 10
+                self.orientation = Orientation(data[0] - 100)
+            elif cmd == 101:  # RESET
+                self.orientation = Orientation.PORTRAIT
+            elif cmd == 102:  # CLEAR
+                self.panel[:] = 255
+            elif cmd == 103:  # TO_BLACK
+                self.panel[:] = 0
+            elif cmd == 108:  # SCREEN_OFF
+                self.screen_on = False
+            elif cmd == 109:  # SCREEN_ON
+                self.screen_on = True
+            elif cmd == 110:  # SET_BRIGHTNESS
+                self.brightness = x
+            else:
+                self.unknown(header)
+
+
+class LcdEmulatorRevB(LcdEmulator):
+    # Sub-revision returned in HELLO answer (see lcd_comm_rev_b.SubRevision)
+    SUB_REVISION = 0x11
+
+    def __init__(self, display_width: int = 320, display_height: int = 480, sub_revision: int = SUB_REVISION):
+        self.sub_revision = sub_revision
+        self.landscape = False
+        self.led_color = None
+        LcdEmulator.__init__(self, display_width, display_height)
+
+    def parse(self) -> Parser:
+        while True:
+            frame = yield 10
+            self.commands += 1
+            cmd = frame[0]
+            if frame[9] != cmd:
+                self.unknown(frame)
+            elif cmd == 0xCA:  # HELLO
+                self.reply(bytes([0xCA]) + frame[1:6] + bytes([0x0A, self.sub_revision, 0x00, 0xCA]))
+            elif cmd == 0xCC:  # DISPLAY_BITMAP
+                x0, y0, x1, y1 = (int.from_bytes(frame[i:i + 2], 'big') for i in range(1, 9, 2))
+                width, height = x1 - x0 + 1, y1 - y0 + 1
+                data = yield width * height * 2
+                rgb = codec.rgb565_to_rgb(np.frombuffer(data, dtype='>u2').reshape(height, width))
+                # Landscape is managed by the display, reverse orientations by the driver
+                self.draw(self.view(1 if self.landscape else 0), x0, y0, rgb)
+            elif cmd == 0xCB:  # SET_ORIENTATION
+                self.landscape = frame[1] == 0x01
+            elif cmd == 0xCD:  # SET_LIGHTING
+                self.led_color = tuple(frame[1:4])
+            elif cmd == 0xCE:  # SET_BRIGHTNESS
+                self.brightness = frame[1]
+            else:
+                self.unknown(frame)
+
+
+class LcdEmulatorRevC(LcdEmulator):
+    # Messages are padded to a multiple of this size
+    MESSAGE_SIZE = 250
+    HELLO_REPLY = b'chs_5inch.dev1_rom1.87\x00'
+    STATUS_REPLY = b'needReSend:0!'.ljust(1024, b'\x00')
+
+    def __init__(self, display_width: int = 480, display_height: int = 800):
+        self.flip = False
+        self.render_count = None
+        LcdEmulator.__init__(self, display_width, display_height)
+
+    def native_view(self) -> np.ndarray:
+        # Images are sent in the native landscape orientation of the display, already rotated by the driver
+        return self.view(1)
+
+    @classmethod
+    def message_size(cls, data_size: int) -> int:
+        # Size of a message carrying data_size bytes: 249-byte chunks separated by 0x00, padded to MESSAGE_SIZE
+        chunks = ceil(data_size / 249) if data_size > cls.MESSAGE_SIZE else 1
+        return cls.MESSAGE_SIZE * ceil((data_size + chunks - 1) / cls.MESSAGE_SIZE)
+
+    @classmethod
+    def message_data(cls, message: bytes, data_size: int) -> np.ndarray:
+        # Remove the 0x00 separating 249-byte chunks
+        data = np.frombuffer(message, dtype=np.uint8)
+        if data_size > cls.MESSAGE_SIZE:
+            data = data.reshape(-1, cls.MESSAGE_SIZE)[:, :249].reshape(-1)
+        return data[:data_size]
+
+    def parse(self) -> Parser:
+        while True:
+            message = yield self.MESSAGE_SIZE
+            self.commands += 1
+            cmd = message[0]
+            if cmd == 0x01 and message[1:3] == b'\xef\x69':  # HELLO
+                self.reply(self.HELLO_REPLY)
+            elif cmd == 0xc8:  # DISPLAY_BITMAP: full screen, BGRA
+                height, width = self.native_view().shape[:2]
+                data_size = width * height * 4
+                data = self.message_data((yield self.message_size(data_size)), data_size)
+                bgra = data.reshape(height, width, 4)
+                self.draw(self.native_view(), 0, 0, bgra[..., 2::-1])
+                self.reply(self.STATUS_REPLY)
+            elif cmd == 0xcc:  # UPDATE_BITMAP: rows of BGR pixels, each with its position
+                data_size = int.from_bytes(message[4:7], 'big')
+                self.render_count = int.from_bytes(message[10:14], 'big')
+                data = self.message_data((yield self.message_size(data_size)), data_size)
+                self.draw_rows(data[:-2])
+                self.bitmaps += 1
+            elif cmd == 0xcf or cmd == 0x96:  # QUERY_STATUS, STOP_MEDIA
+                self.reply(self.STATUS_REPLY)
+            elif cmd == 0x7d:  # OPTIONS
+                self.flip = message[13] == 0x01
+            elif cmd == 0x7b:  # SET_BRIGHTNESS
+                self.brightness = message[10]
+            elif cmd == 0x83:  # TURNOFF / TURNON
+                self.screen_on = message[6] == 0x00
+            elif cmd in (0x79, 0x84, 0x86, 0x2c):  # STOP_VIDEO, RESTART, PRE_UPDATE_BITMAP, START_DISPLAY_BITMAP
+                pass
+            else:
+                self.unknown(message)
+
+    def draw_rows(self, data: np.ndarray):
+        view = self.native_view()
+        stride = view.shape[1]
+        position = 0
+        while position + 5 <= len(data):
+            offset = int.from_bytes(data[position:position + 3].tobytes(), 'big')
+            width = int.from_bytes(data[position + 3:position + 5].tobytes(), 'big')
+            bgr = data[position + 5:position + 5 + width * 3].reshape(1, width, 3)
+            self.draw(view, offset % stride, offset // stride, bgr[..., ::-1], new_bitmap=False)
+            position += 5 + width * 3
+
+
+class LcdEmulatorRevD(LcdEmulator):
+    PACKET_SIZE = 64
+
+    def __init__(self, display_width: int = 320, display_height: int = 480):
+        self.rotation = 0
+        self.mirror = False
+        self.bitmap = None
+        LcdEmulator.__init__(self, display_width, display_height)
+
+    def display_view(self) -> np.ndarray:
+        # Landscape is managed by the driver, reverse orientations / mirroring by the display
+        view = self.view(self.rotation)
+        return view[:, ::-1] if self.mirror else view
+
+    def parse(self) -> Parser:
+        while True:
+            cmd = yield 2
+            self.commands += 1
+            if cmd[0] == 67 and cmd[1] in (72, 71, 68, 70):  # SETORG, SET180, SETHF, SETVF
+                yield 2
+                self.rotation = 2 if cmd[1] in (71, 70) else 0
+                self.mirror = cmd[1] in (68, 70)
+            elif cmd == bytes((67, 67)):  # SETBL
+                self.brightness = int.from_bytes((yield 2), 'big')
+            elif cmd == bytes((67, 66)):  # DISPCOLOR
+                color = np.frombuffer((yield 2), dtype='>u2').reshape(1, 1)
+                self.panel[:] = codec.rgb565_to_rgb(color)[0, 0]
+            elif cmd == bytes((67, 65)):  # BLOCKWRITE
+                data = yield 8
+                self.bitmap = [int.from_bytes(data[i:i + 2], 'big') for i in range(0, 8, 2)]
+            elif cmd == bytes((68, 0)):  # INTOPICMODE
+                yield 2
+                if self.bitmap is None:
+                    self.unknown(cmd)
+                    continue
+                x0, x1, y0, y1 = self.bitmap
+                width, height = x1 - x0 + 1, y1 - y0 + 1
+                # Pixels are sent in packets of 1 command byte + 63 data bytes
+                size = width * height * 2
+                packets = ceil(size / (self.PACKET_SIZE - 1))
+                data = np.frombuffer((yield size + packets), dtype=np.uint8)
+                if np.any(data[::self.PACKET_SIZE] != 0x50):
+                    self.unknown(data[:self.PACKET_SIZE].tobytes())
+                data = np.delete(data, np.s_[::self.PACKET_SIZE])
+                rgb = codec.rgb565_to_rgb(data.view('>u2').reshape(height, width))
+                self.draw(self.display_view(), x0, y0, rgb)
+            elif cmd == bytes((65, 0)):  # OUTPICMODE
+                yield 2
+                self.bitmap = None
+            elif cmd == bytes((71, 0)):  # GETINFO
+                yield 2
+            else:
+                self.unknown(cmd)
+
+
+EMULATORS = {
+    "A": LcdEmulatorRevA,
+    "B": LcdEmulatorRevB,
+    "C": LcdEmulatorRevC,
+    "D": LcdEmulatorRevD,
+}
+
+
+class Throttle:
+    # Limit the rate at which data is received, to behave like a real link (0 for no limit)
+    def __init__(self, bytes_per_second: float = 0):
+        self.bytes_per_second = bytes_per_second
+        self.start = time.monotonic()
+        self.received = 0
+
+    def read_size(self, default: int) -> int:
+        # Read small chunks when throttled, so that the sender is slowed down progressively
+        return max(1, min(default, int(self.bytes_per_second / 100))) if self.bytes_per_second else default
+
+    def wait(self, size: int):
+        if not self.bytes_per_second:
+            return
+        self.received += size
+        delay = self.start + self.received / self.bytes_per_second - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        elif delay < -1:
+            # Link was idle: do not allow bursts above the link speed
+            self.start, self.received = time.monotonic(), 0
+
+
+def serve_pty(emulator: LcdEmulator, bytes_per_second: float = 0, ready: Optional[threading.Event] = None,
+              names: Optional[list] = None, stop: Optional[threading.Event] = None):
+    # Emulate a display on a pseudo-terminal: the driver opens the returned device name as its COM port (Linux / macOS)
+    import tty
+    master, slave = os.openpty()
+    tty.setraw(master)
+    name = os.ttyname(slave)
+    logger.info("Emulator listening on %s" % name)
+    if names is not None:
+        names.append(name)
+    if ready:
+        ready.set()
+    _serve_fd(emulator, master, os.read, os.write, bytes_per_second, stop)
+
+
+def serve_socket(emulator: LcdEmulator, uri: str, bytes_per_second: float = 0, ready: Optional[threading.Event] = None,
+                 stop: Optional[threading.Event] = None):
+    # Emulate a display on a socket (tcp://host:port or unix:///path), one connection at a time
+    url = urlparse(uri)
+    if url.scheme == "unix":
+        if os.path.exists(url.path):
+            os.unlink(url.path)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(url.path)
+        server.listen()
+    else:
+        server = socket.create_server((url.hostname or "", url.port))
+    logger.info("Emulator listening on %s" % uri)
+    if ready:
+        ready.set()
+    while not (stop and stop.is_set()):
+        connection, _ = server.accept()
+        with connection:
+            _serve_fd(emulator, connection.fileno(), lambda fd, size: connection.recv(size),
+                      lambda fd, data: connection.send(data), bytes_per_second, stop)
+
+
+def _serve_fd(emulator: LcdEmulator, fd: int, read, write, bytes_per_second: float, stop: Optional[threading.Event]):
+    throttle = Throttle(bytes_per_second)
+    selector = selectors.DefaultSelector()
+    selector.register(fd, selectors.EVENT_READ)
+    while not (stop and stop.is_set()):
+        # Wake up regularly while delayed replies are waiting to be sent
+        ready = selector.select(timeout=0.001 if emulator.replies else 0.1)
+        replies = emulator.get_replies()
+        while replies:
+            replies = replies[write(fd, replies):]
+        if not ready:
+            continue
+        try:
+            data = read(fd, throttle.read_size(1024 * 1024))
+        except OSError:
+            # Pseudo-terminal returns an error when the other side is closed
+            time.sleep(0.1)
+            continue
+        if not data:
+            break
+        emulator.feed(data)
+        replies = emulator.get_replies()
+        while replies:
+            replies = replies[write(fd, replies):]
+        throttle.wait(len(data))
@@ -50,7 +50,7 @@ class LcdSimulated(LcdComm):
         pass
 
     def ScreenOn(self):
-        pass
+        self.invalidate_framebuffer()
 
     def SetBrightness(self, level: int = 25):
         pass
@@ -58,13 +58,23 @@ class LcdSimulated(LcdComm):
     def SetBackplateLedColor(self, led_color: Tuple[int, int, int] = (255, 255, 255)):
         pass
 
+    @staticmethod
+    def framebuffer_pixels(rgb: np.ndarray) -> np.ndarray:
+        # Simulated display uses 24-bit colors
+        return codec.rgb_to_rgb888(rgb)
+
+    @staticmethod
+    def framebuffer_to_image(pixels: np.ndarray) -> Image.Image:
+        return Image.fromarray(codec.rgb888_to_rgb(pixels), "RGB")
+
     def SetOrientation(self, orientation: Orientation = Orientation.PORTRAIT):
         self.orientation = orientation
         # Just draw the screen again with the new width/height based on orientation
         with self.update_queue_mutex:
             self.screen_image = Image.new("RGB", (self.get_width(), self.get_height()), (255, 255, 255))
+        self.invalidate_framebuffer()
 
-    def DisplayPILImage(
+    def _display_pil_image(
             self,
             image: Image,
             x: int = 0, y: int = 0,
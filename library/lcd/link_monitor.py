@@ -0,0 +1,101 @@
+# turing-smart-screen-python - a Python system monitor and library for USB-C displays like Turing Smart Screen or XuanFang
+# https://github.com/mathoudebine/turing-smart-screen-python/
+
+# Copyright (C) 2021-2023  Matthieu Houdebine (mathoudebine)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Link monitor: measures the throughput of the serial link and the latency of the commands sent to the display.
+# It gives the number of bytes the link can carry in a given time, and decides whether a widget refresh should be
+# skipped depending on its priority, so that high-priority widgets keep a target latency when the link is overloaded.
+
+import threading
+from enum import IntEnum
+
+
+class Priority(IntEnum):
+    LOW = 0
+    NORMAL = 1
+    HIGH = 2
+
+    @staticmethod
+    def from_theme(value) -> 'Priority':
+        # Priority declared in theme: HIGH, NORMAL or LOW (NORMAL if missing)
+        if value is None:
+            return Priority.NORMAL
+        return Priority[str(value).upper()]
+
+
+class LinkMonitor:
+    # Weight of the newest measurement in the moving averages
+    SMOOTHING = 0.2
+
+    # Minimum time spent writing before updating the throughput average, so that small writes are averaged
+    THROUGHPUT_WINDOW = 0.2  # seconds
+
+    # Part of the latency target kept free for normal/high priority widgets: low priority widgets are refreshed only
+    # if the data waiting to be sent can be sent in less than (1 - LOW_PRIORITY_RESERVE) * target latency
+    LOW_PRIORITY_RESERVE = 0.5
+
+    def __init__(self, target_latency: float = 1.0):
+        # Maximum time for a refresh to reach the display. Set to 0 to never skip refreshes
+        self.target_latency = target_latency
+
+        self.mutex = threading.Lock()
+        self.bytes_per_second = 0.0  # Link throughput, 0 until measured
+        self.write_latency = 0.0  # Average duration of a write command, in seconds
+        self.read_latency = 0.0  # Average duration of a read command (wait for the display response), in seconds
+
+        self.window_bytes = 0
+        self.window_time = 0.0
+
+        self.skipped = {}  # { key=widget name, value=number of refreshes skipped }
+
+    def _average(self, average: float, value: float) -> float:
+        return value if not average else average + self.SMOOTHING * (value - average)
+
+    def record_write(self, size: int, duration: float):
+        with self.mutex:
+            self.write_latency = self._average(self.write_latency, duration)
+            self.window_bytes += size
+            self.window_time += duration
+            if self.window_time >= self.THROUGHPUT_WINDOW:
+                self.bytes_per_second = self._average(self.bytes_per_second, self.window_bytes / self.window_time)
+                self.window_bytes = 0
+                self.window_time = 0.0
+
+    def record_read(self, size: int, duration: float):
+        with self.mutex:
+            self.read_latency = self._average(self.read_latency, duration)
+
+    def budget(self, interval: float, pending_bytes: int = 0) -> float:
+        # Number of bytes that can still be sent within interval seconds, once pending data has been sent.
+        # Negative if pending data already needs more than interval seconds. Time spent waiting for the display to
+        # answer a refresh is not available to send data
+        with self.mutex:
+            return self.bytes_per_second * max(interval - self.read_latency, 0.0) - pending_bytes
+
+    def allow(self, priority: Priority, pending_bytes: int = 0) -> bool:
+        # Return True if a widget with this priority should be refreshed, given the amount of data waiting to be sent
+        if priority >= Priority.HIGH or not self.target_latency or not self.bytes_per_second:
+            return True
+
+        budget = self.budget(self.target_latency, pending_bytes)
+        if priority == Priority.LOW:
+            return budget > self.bytes_per_second * self.target_latency * self.LOW_PRIORITY_RESERVE
+        return budget > 0
+
+    def skip(self, name: str):
+        with self.mutex:
+            self.skipped[name] = self.skipped.get(name, 0) + 1
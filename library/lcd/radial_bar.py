@@ -0,0 +1,132 @@
+# turing-smart-screen-python - a Python system monitor and library for USB-C displays like Turing Smart Screen or XuanFang
+# https://github.com/mathoudebine/turing-smart-screen-python/
+
+# Copyright (C) 2021-2023  Matthieu Houdebine (mathoudebine)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Radial bar: geometry of a radial progress bar, and masks of the pixels covered by the bar for a value.
+# Arcs are rasterized by PIL once: the steps of discontinued bars are stored in a table giving the first step covering
+# each pixel of the annulus, so that a bar only needs PIL to draw its last, partial step. Masks are cached per value.
+
+from typing import List, Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from library.lcd.cache import LruCache
+
+
+def normalize_angles(angle_start: float, angle_end: float, clockwise: bool) -> Tuple[float, float]:
+    # Bar covering a whole circle: start and end angles must differ
+    if angle_start % 361 == angle_end % 361:
+        if clockwise:
+            angle_start += 0.1
+        else:
+            angle_end += 0.1
+    return angle_start % 361, angle_end % 361
+
+
+def changed_box(old_mask: np.ndarray, new_mask: np.ndarray) -> Optional[Tuple[int, int, int, int]]:
+    # Bounding box of the pixels that differ between 2 masks, None if they are identical
+    if old_mask is new_mask:
+        return None
+    changed = old_mask != new_mask
+    rows = np.flatnonzero(changed.any(axis=1))
+    if len(rows) == 0:
+        return None
+    columns = np.flatnonzero(changed.any(axis=0))
+    return int(columns[0]), int(rows[0]), int(columns[-1]) + 1, int(rows[-1]) + 1
+
+
+class RadialBar:
+    # Maximum number of masks kept per bar, each one using about 9/8 * (2 * radius)² bytes
+    MASK_CACHE_SIZE = 16
+
+    def __init__(self, radius: int, bar_width: int, angle_start: float, angle_end: float, angle_sep: float,
+                 angle_steps: int, clockwise: bool):
+        # Angles must have been normalized with normalize_angles()
+        self.diameter = 2 * radius
+        self.bar_width = bar_width
+        self.angle_start = angle_start
+        self.angle_sep = angle_sep
+        self.angle_steps = angle_steps
+        self.clockwise = clockwise
+
+        # PIL arc method uses angles with
+        #  . 3 o'clock for 0
+        #  . clockwise from angle start to angle end
+        if clockwise:
+            self.ecart = 360 - angle_start + angle_end if angle_end < angle_start else angle_end - angle_start
+        else:
+            self.ecart = angle_start - angle_end if angle_end < angle_start else 360 - angle_end + angle_start
+        self.angle_complet = self.ecart / angle_steps
+
+        # For discontinued bars: index of the first step covering each pixel, angle_steps for pixels outside of steps
+        self.steps = None
+        if angle_sep != 0:
+            self.steps = np.full((self.diameter, self.diameter), angle_steps, dtype=np.int16)
+            for i in reversed(range(angle_steps)):
+                self.steps[self._arc_mask(*self._step(i))] = i
+
+        self.masks = LruCache(self.MASK_CACHE_SIZE)  # { key=pct, value=(np.ndarray of bool, PIL.Image) }
+
+    def _step(self, i: int) -> Tuple[float, float]:
+        # Arc of a whole step of a discontinued bar
+        if self.clockwise:
+            return (self.angle_start + i * self.angle_complet,
+                    self.angle_start + (i + 1) * self.angle_complet - self.angle_sep)
+        else:
+            return (self.angle_start - (i + 1) * self.angle_complet + self.angle_sep,
+                    self.angle_start - i * self.angle_complet)
+
+    def _steps(self, pct: float) -> Tuple[int, Tuple[float, float]]:
+        # Number of whole steps of the bar, and its last arc: partial step, or whole bar if it is not discontinued
+        if self.clockwise:
+            angleE = self.angle_start + pct * self.ecart
+            if self.angle_sep == 0:
+                return 0, (self.angle_start, angleE)
+            etapes = int((angleE - self.angle_start) / self.angle_complet)
+            return etapes, (self.angle_start + etapes * self.angle_complet, angleE)
+        else:
+            angleS = self.angle_start - pct * self.ecart
+            if self.angle_sep == 0:
+                return 0, (angleS, self.angle_start)
+            etapes = int((self.angle_start - angleS) / self.angle_complet)
+            return etapes, (angleS, self.angle_start - etapes * self.angle_complet)
+
+    def arcs(self, pct: float) -> List[Tuple[float, float]]:
+        # Arcs to draw for a value between 0 and 1, in drawing order
+        etapes, last = self._steps(pct)
+        return [self._step(i) for i in range(etapes)] + [last]
+
+    def _arc_mask(self, start: float, end: float) -> np.ndarray:
+        image = Image.new("L", (self.diameter, self.diameter), 0)
+        ImageDraw.Draw(image).arc([0, 0, self.diameter - 1, self.diameter - 1], start, end, fill=255,
+                                  width=self.bar_width)
+        return np.asarray(image) != 0
+
+    def mask(self, pct: float) -> Tuple[np.ndarray, Image.Image]:
+        # Pixels covered by the bar for a value between 0 and 1: as a read-only (diameter, diameter) array of bool, and
+        # as a 1-bit image to paste the bar color with
+        masks = self.masks.get(pct)
+        if masks is None:
+            etapes, last = self._steps(pct)
+            mask = self._arc_mask(*last)
+            if etapes:
+                mask |= self.steps < etapes
+            mask.flags.writeable = False
+            masks = (mask, Image.fromarray(mask))
+            self.masks.put(pct, masks)
+        return masks
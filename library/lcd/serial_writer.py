@@ -0,0 +1,172 @@
+# turing-smart-screen-python - a Python system monitor and library for USB-C displays like Turing Smart Screen or XuanFang
+# https://github.com/mathoudebine/turing-smart-screen-python/
+
+# Copyright (C) 2021-2023  Matthieu Houdebine (mathoudebine)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Serial writer: executes the requests queued for a display from a single thread, which is the only one using the
+# serial port. Consecutive writes waiting in the queue are concatenated to send them with as few writes as possible.
+
+import queue
+import threading
+import time
+from typing import Optional
+
+from library.lcd.lcd_comm import LcdComm
+from library.lcd.update_queue import UpdateQueue
+from library.log import logger
+
+
+# Request put in the queue to stop the writer once all previous requests have been executed
+STOP_REQUEST = (None, None)
+
+
+class SerialWriter:
+    # Maximum size of the data concatenated in a single write
+    MAX_WRITE_SIZE = 64 * 1024
+
+    # Minimum interval between 2 logs of the link usage statistics, in seconds (0 to disable)
+    STATS_LOG_INTERVAL = 60
+
+    def __init__(self, lcd: LcdComm, update_queue: queue.Queue, max_write_size: int = MAX_WRITE_SIZE):
+        self.lcd = lcd
+        self.update_queue = update_queue
+        self.max_write_size = max_write_size
+
+        # Statistics: total bytes / writes sent, and number of queued writes merged into those writes
+        self.stats_mutex = threading.Lock()
+        self.bytes_sent = 0
+        self.writes = 0
+        self.merged_writes = 0
+        self.last_stats = (time.monotonic(), 0, 0, 0)
+        self.last_stats_log = time.monotonic()
+
+        # Stop management: deadline after which pending requests are dropped, and event set when the writer is not running
+        self.stop_deadline = None
+        self.stopped = threading.Event()
+        self.stopped.set()
+
+    def _is_write(self, f) -> bool:
+        # Only plain writes can be merged: WriteData may be overridden by HW revisions to do additional processing
+        return f == self.lcd.WriteLine or (f == self.lcd.WriteData and type(self.lcd).WriteData is LcdComm.WriteData)
+
+    def _write(self, data, merged: int):
+        self.lcd.WriteLine(data)
+        with self.stats_mutex:
+            self.bytes_sent += len(data)
+            self.writes += 1
+            self.merged_writes += merged
+
+    def process(self, block: bool = True, timeout: Optional[float] = None) -> bool:
+        # Execute the next request in the queue. If it is a write, all following writes already in the queue are
+        # concatenated with it. Other requests (e.g. reads) are executed in order, after pending data has been written.
+        # Return False if the queue was empty or if a stop request has been reached
+        try:
+            request = self.update_queue.get(block=block, timeout=timeout)
+        except queue.Empty:
+            return False
+
+        buffer = None
+        merged = 0
+        while True:
+            if request is STOP_REQUEST:
+                if buffer is not None:
+                    self._write(buffer, merged)
+                return False
+
+            f, args = request
+            if f and self._is_write(f):
+                data = args[0]
+                if buffer is not None and len(buffer) + len(data) > self.max_write_size:
+                    self._write(buffer, merged)
+                    buffer = None
+                if buffer is None and len(data) >= self.max_write_size:
+                    # Big enough to be written as-is, without copy
+                    self._write(data, 1)
+                elif buffer is None:
+                    buffer = bytearray(data)
+                    merged = 1
+                else:
+                    buffer += data
+                    merged += 1
+            else:
+                # Any other request is a barrier: write pending data before executing it
+                if buffer is not None:
+                    self._write(buffer, merged)
+                    buffer = None
+                if f:
+                    f(*args)
+                break
+
+            try:
+                request = self.update_queue.get_nowait()
+            except queue.Empty:
+                break
+
+        if buffer is not None:
+            self._write(buffer, merged)
+
+        self._log_stats()
+        return True
+
+    def run(self):
+        # Execute requests as they arrive in the queue, until stop() is called. Blocks while the queue is empty
+        self.stopped.clear()
+        try:
+            while self.process():
+                if self.stop_deadline is not None and time.monotonic() > self.stop_deadline:
+                    logger.warning("Stop deadline reached, %d pending requests for the display are dropped" %
+                                   self.update_queue.qsize())
+                    break
+        finally:
+            self.stopped.set()
+
+    def stop(self, timeout: Optional[float] = None) -> bool:
+        # Ask the writer to stop once all requests already in the queue are executed, and wait for it.
+        # Requests still pending after timeout seconds are dropped. Return False if the writer is still running
+        if self.stopped.is_set():
+            return True
+        self.stop_deadline = time.monotonic() + timeout if timeout is not None else None
+        self.update_queue.put(STOP_REQUEST)
+        return self.stopped.wait(timeout)
+
+    def get_stats(self) -> dict:
+        # Get link usage since last call: bytes/s, writes/s and average number of queued writes merged per write
+        with self.stats_mutex:
+            now = time.monotonic()
+            last_time, last_bytes, last_writes, last_merged = self.last_stats
+            self.last_stats = (now, self.bytes_sent, self.writes, self.merged_writes)
+            elapsed = max(now - last_time, 1e-6)
+            writes = self.writes - last_writes
+            return {
+                "bytes_per_second": (self.bytes_sent - last_bytes) / elapsed,
+                "writes_per_second": writes / elapsed,
+                "average_batch_size": (self.merged_writes - last_merged) / writes if writes else 0,
+                "average_write_size": (self.bytes_sent - last_bytes) / writes if writes else 0,
+            }
+
+    def _log_stats(self):
+        if not self.STATS_LOG_INTERVAL or time.monotonic() - self.last_stats_log < self.STATS_LOG_INTERVAL:
+            return
+        self.last_stats_log = time.monotonic()
+        stats = self.get_stats()
+        logger.debug("Serial link: %.1f kB/s, %.1f writes/s, %.1f requests/write (%.0f bytes/write)" % (
+            stats["bytes_per_second"] / 1000, stats["writes_per_second"], stats["average_batch_size"],
+            stats["average_write_size"]))
+        if isinstance(self.update_queue, UpdateQueue):
+            stats = self.update_queue.get_stats()
+            logger.debug("Update queue: %d updates, %d superseded, %d requests pending, latency %.2fs avg / %.2fs max" % (
+                stats["updates"], stats["superseded"], stats["pending"], stats["average_latency"],
+                stats["max_latency"]))
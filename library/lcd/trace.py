@@ -0,0 +1,112 @@
+# turing-smart-screen-python - a Python system monitor and library for USB-C displays like Turing Smart Screen or XuanFang
+# https://github.com/mathoudebine/turing-smart-screen-python/
+
+# Copyright (C) 2021-2023  Matthieu Houdebine (mathoudebine)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Traces: record all data exchanged with a display in a binary file, to replay it later (see tools/trace-replay.py).
+# File format: 8-byte magic + 1-byte version, then one record per write / read:
+#   direction (1 byte: 0 = write, 1 = read), time since start of the trace in seconds (8-byte float),
+#   requested size (4 bytes, size of the data for writes), size of the data (4 bytes), data
+# All values are little-endian.
+
+import struct
+import threading
+import time
+from enum import IntEnum
+from typing import Iterator, NamedTuple
+
+from library.lcd.transport import Transport
+
+MAGIC = b'TSSTRACE'
+VERSION = 1
+RECORD_HEADER = struct.Struct('<BdII')
+
+
+class Direction(IntEnum):
+    WRITE = 0
+    READ = 1
+
+
+class TraceRecord(NamedTuple):
+    direction: Direction
+    timestamp: float
+    size: int  # Requested size for reads
+    data: bytes
+
+
+class TraceRecorder:
+    def __init__(self, path: str):
+        self.path = path
+        self.mutex = threading.Lock()
+        self.file = open(path, "wb")
+        self.file.write(MAGIC + bytes((VERSION,)))
+        self.start = time.monotonic()
+
+    def _record(self, direction: Direction, size: int, data: bytes):
+        with self.mutex:
+            if self.file.closed:
+                return
+            self.file.write(RECORD_HEADER.pack(direction, time.monotonic() - self.start, size, len(data)))
+            self.file.write(data)
+
+    def record_write(self, data: bytes):
+        self._record(Direction.WRITE, len(data), data)
+
+    def record_read(self, size: int, data: bytes):
+        self._record(Direction.READ, size, data)
+
+    def close(self):
+        with self.mutex:
+            self.file.close()
+
+
+class TracingTransport(Transport):
+    # Transport recording all data written / read through another transport
+    def __init__(self, transport: Transport, recorder: TraceRecorder):
+        self.transport = transport
+        self.recorder = recorder
+
+    def write(self, data: bytes) -> int:
+        self.recorder.record_write(bytes(data))
+        return self.transport.write(data)
+
+    def read(self, size: int) -> bytes:
+        data = self.transport.read(size)
+        self.recorder.record_read(size, data)
+        return data
+
+    def reset_input_buffer(self):
+        self.transport.reset_input_buffer()
+
+    def close(self):
+        self.transport.close()
+
+
+def read_trace(path: str) -> Iterator[TraceRecord]:
+    with open(path, "rb") as file:
+        header = file.read(len(MAGIC) + 1)
+        if header[:len(MAGIC)] != MAGIC or header[-1] != VERSION:
+            raise ValueError(f"{path} is not a trace file (version {VERSION})")
+        while True:
+            header = file.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+            direction, timestamp, size, data_size = RECORD_HEADER.unpack(header)
+            data = file.read(data_size)
+            if len(data) < data_size:
+                # Trace was not closed properly: ignore the truncated record
+                return
+            yield TraceRecord(Direction(direction), timestamp, size, data)
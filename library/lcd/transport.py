@@ -0,0 +1,179 @@
+# turing-smart-screen-python - a Python system monitor and library for USB-C displays like Turing Smart Screen or XuanFang
+# https://github.com/mathoudebine/turing-smart-screen-python/
+
+# Copyright (C) 2021-2023  Matthieu Houdebine (mathoudebine)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Transports: links used to send data to the display. The transport is selected from the COM port value:
+#   - tcp://host:port         TCP socket, e.g. to a bridge connected to the display (see tools/serial-bridge.py)
+#   - unix:///path/to/socket  Unix domain socket
+#   - file:///path/to/file    Raw file or named pipe: data is only written, nothing is read back
+#   - anything else           Serial port name, e.g. COM3 or /dev/ttyACM0
+# All transports have the subset of the pyserial API used by the HW revisions, and raise pyserial exceptions on errors
+
+import os
+import socket
+import time
+from abc import ABC, abstractmethod
+from urllib.parse import urlparse
+
+import serial
+
+
+class Transport(ABC):
+    @abstractmethod
+    def write(self, data: bytes) -> int:
+        pass
+
+    @abstractmethod
+    def read(self, size: int) -> bytes:
+        # Read size bytes, or less if the timeout expired
+        pass
+
+    @abstractmethod
+    def reset_input_buffer(self):
+        # Discard data received and not read yet
+        pass
+
+    @abstractmethod
+    def close(self):
+        pass
+
+    def flushInput(self):
+        # Legacy pyserial name of reset_input_buffer, used by HW revisions
+        self.reset_input_buffer()
+
+
+class SerialTransport(Transport):
+    def __init__(self, port: str, baudrate: int = 115200, timeout: float = 1):
+        self.serial = serial.Serial(port, baudrate, timeout=timeout, rtscts=1)
+
+    def write(self, data: bytes) -> int:
+        return self.serial.write(data)
+
+    def read(self, size: int) -> bytes:
+        return self.serial.read(size)
+
+    def reset_input_buffer(self):
+        self.serial.reset_input_buffer()
+
+    def close(self):
+        self.serial.close()
+
+
+class SocketTransport(Transport):
+    def __init__(self, address, timeout: float = 1):
+        # Address is a (host, port) tuple for TCP, or a path for Unix domain sockets
+        self.timeout = timeout
+        try:
+            if isinstance(address, tuple):
+                self.socket = socket.create_connection(address, timeout)
+                # Requests are already merged in large writes: send them as soon as possible
+                self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            else:
+                self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                self.socket.settimeout(timeout)
+                self.socket.connect(address)
+            # Like serial ports, writes block until all data is sent: only reads have a timeout
+            self.socket.settimeout(None)
+        except OSError as e:
+            raise serial.SerialException(f"Cannot connect to {address}: {e}")
+
+    def write(self, data: bytes) -> int:
+        try:
+            self.socket.sendall(data)
+        except OSError as e:
+            raise serial.SerialException(f"Write failed: {e}")
+        return len(data)
+
+    def read(self, size: int) -> bytes:
+        # Same behavior as a serial port: wait for size bytes until timeout, then return what has been received
+        data = bytearray()
+        deadline = time.monotonic() + self.timeout
+        try:
+            while len(data) < size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.socket.settimeout(remaining)
+                chunk = self.socket.recv(size - len(data))
+                if not chunk:
+                    raise serial.SerialException("Connection closed by peer")
+                data += chunk
+        except socket.timeout:
+            pass
+        except OSError as e:
+            raise serial.SerialException(f"Read failed: {e}")
+        finally:
+            self.socket.settimeout(None)
+        return bytes(data)
+
+    def reset_input_buffer(self):
+        try:
+            self.socket.setblocking(False)
+            try:
+                while self.socket.recv(65536):
+                    pass
+            except (BlockingIOError, socket.timeout):
+                pass
+            finally:
+                self.socket.settimeout(None)
+        except OSError as e:
+            raise serial.SerialException(f"Read failed: {e}")
+
+    def close(self):
+        self.socket.close()
+
+
+class FileTransport(Transport):
+    def __init__(self, path: str):
+        try:
+            # Unbuffered: each write is sent to the file / pipe as-is
+            self.file = open(path, "wb", buffering=0)
+        except OSError as e:
+            raise serial.SerialException(f"Cannot open {path}: {e}")
+
+    def write(self, data: bytes) -> int:
+        try:
+            # Unbuffered writes to a pipe may be partial
+            view = memoryview(data)
+            while view:
+                view = view[self.file.write(view):]
+        except OSError as e:
+            raise serial.SerialException(f"Write failed: {e}")
+        return len(data)
+
+    def read(self, size: int) -> bytes:
+        # Nothing can be read back from a file: behave like a display that never answers
+        return b''
+
+    def reset_input_buffer(self):
+        pass
+
+    def close(self):
+        self.file.close()
+
+
+def open_transport(com_port: str, baudrate: int = 115200, timeout: float = 1) -> Transport:
+    # Open the transport matching the COM port value
+    url = urlparse(com_port)
+    if url.scheme == "tcp":
+        return SocketTransport((url.hostname, url.port), timeout)
+    elif url.scheme == "unix":
+        return SocketTransport(url.path, timeout)
+    elif url.scheme == "file":
+        return FileTransport(os.path.abspath(url.netloc + url.path))
+    else:
+        return SerialTransport(com_port, baudrate, timeout)
@@ -0,0 +1,172 @@
+# turing-smart-screen-python - a Python system monitor and library for USB-C displays like Turing Smart Screen or XuanFang
+# https://github.com/mathoudebine/turing-smart-screen-python/
+
+# Copyright (C) 2021-2023  Matthieu Houdebine (mathoudebine)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Update queue: a queue of serial requests where the requests drawing an image on a region of the screen are grouped
+# in an update. When the serial link is slower than the producers, a newer update for the same region replaces the
+# pending one instead of being sent after it, so that the queue depth and the display latency stay bounded.
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from queue import Queue
+from typing import List, Optional
+
+from library.lcd.framebuffer import Rect
+
+
+def _request_size(request) -> int:
+    # Number of bytes sent by a request, if it is a write
+    f, args = request
+    if args and isinstance(args[0], (bytes, bytearray, memoryview)):
+        return len(args[0])
+    return 0
+
+
+def _overlap(a: Rect, b: Rect) -> bool:
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+class RegionUpdate:
+    def __init__(self, region: Rect, rects: List[Rect], requests: list):
+        # Area of the screen covered by the image: updates with the same region supersede each other
+        self.region = region
+        # Areas of the screen actually sent, and the serial requests sending them
+        self.rects = rects
+        self.requests = deque(requests)
+        self.data_size = sum(_request_size(request) for request in requests)
+        self.time = time.monotonic()
+        # Set once the first request has been taken from the queue: the update cannot be replaced anymore
+        self.started = False
+
+
+class UpdateQueue(Queue):
+    # Queue.Queue hooks (_init, _qsize, _put, _get) are overridden, all of them are called with the queue mutex held
+
+    def _init(self, maxsize):
+        # Items are requests (f, args) or RegionUpdate objects. Requests are barriers: updates queued before a request
+        # are never replaced by updates queued after it (e.g. a draw before and after a Clear / orientation change)
+        self.queue = deque()
+        self.size = 0  # Number of requests waiting, including the requests of updates
+        self.bytes = 0  # Number of bytes waiting to be written
+
+        # Threads currently capturing the requests they queue, see capture()
+        self.local = threading.local()
+
+        # Statistics
+        self.updates = 0  # Updates queued
+        self.superseded = 0  # Updates replaced by a newer one before being sent
+        self.latency_sum = 0.0  # Time between queueing an update and sending it
+        self.latency_max = 0.0
+        self.sent = 0
+
+    def _qsize(self):
+        return self.size
+
+    def _put(self, item):
+        self.queue.append(item)
+        if isinstance(item, RegionUpdate):
+            self.size += len(item.requests)
+            self.bytes += item.data_size
+        else:
+            self.size += 1
+            self.bytes += _request_size(item)
+
+    def _get(self):
+        item = self.queue[0]
+        if not isinstance(item, RegionUpdate):
+            self.size -= 1
+            self.bytes -= _request_size(item)
+            return self.queue.popleft()
+
+        if not item.started:
+            item.started = True
+            latency = time.monotonic() - item.time
+            self.latency_sum += latency
+            self.latency_max = max(self.latency_max, latency)
+            self.sent += 1
+        request = item.requests.popleft()
+        if not item.requests:
+            self.queue.popleft()
+        self.size -= 1
+        self.bytes -= _request_size(request)
+        return request
+
+    def put(self, item, block=True, timeout=None):
+        capture = getattr(self.local, "capture", None)
+        if capture is not None:
+            capture.append(item)
+        else:
+            Queue.put(self, item, block, timeout)
+
+    @contextmanager
+    def capture(self):
+        # Requests queued by the current thread within this context are added to the yielded list instead
+        self.local.capture = []
+        try:
+            yield self.local.capture
+        finally:
+            self.local.capture = None
+
+    def pending_update(self, region: Rect) -> Optional[RegionUpdate]:
+        # Get the update waiting for a region, if it can still be replaced
+        with self.mutex:
+            for item in reversed(self.queue):
+                if not isinstance(item, RegionUpdate) or item.started:
+                    break
+                if item.region == region:
+                    return item
+            return None
+
+    def put_update(self, update: RegionUpdate, replaces: Optional[RegionUpdate] = None):
+        # Queue an update. If it replaces a pending update, its rects must include the rects of the replaced update
+        if not update.requests:
+            return
+        with self.mutex:
+            self.updates += 1
+            index = next((i for i, item in enumerate(self.queue) if item is replaces), None)
+            if index is not None and not replaces.started:
+                following = list(self.queue)[index + 1:]
+                if all(isinstance(item, RegionUpdate) for item in following):
+                    self.superseded += 1
+                    self.size -= len(replaces.requests)
+                    self.bytes -= replaces.data_size
+                    if any(_overlap(item.region, update.region) for item in following):
+                        # Overlapping updates queued in-between must stay before the new one: send it last
+                        del self.queue[index]
+                    else:
+                        # Keep the position of the replaced update in the queue, so that it is not delayed further
+                        self.queue[index] = update
+                        self.size += len(update.requests)
+                        self.bytes += update.data_size
+                        return
+            self._put(update)
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+
+    def get_stats(self) -> dict:
+        # Get update counters: updates queued, superseded and sent, and the latency of the updates sent
+        with self.mutex:
+            return {
+                "updates": self.updates,
+                "superseded": self.superseded,
+                "pending": self.size,
+                "pending_bytes": self.bytes,
+                "average_latency": self.latency_sum / self.sent if self.sent else 0,
+                "max_latency": self.latency_max,
+            }
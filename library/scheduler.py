@@ -26,10 +26,16 @@ from functools import wraps
 
 import library.config as config
 import library.stats as stats
+from library.display import display
+from library.lcd.link_monitor import Priority
+from library.lcd.serial_writer import SerialWriter
 from library.log import logger
 
 STOPPING = False
 
+# Only the queue handler thread sends requests to the display, through this writer
+writer = SerialWriter(display.lcd, config.update_queue)
+
 
 def async_job(threadname=None):
     """ wrapper to handle asynchronous threads """
@@ -81,8 +87,31 @@ def schedule(interval):
     return decorator
 
 
+def throttle(name, priority):
+    """ wrapper to skip a refresh when the display link cannot carry it, depending on the priority set in the theme """
+    priority = Priority.from_theme(priority)
+
+    def decorator(func):
+        """ Decorator to extend throttled """
+
+        @wraps(func)
+        def throttled(*args, **kwargs):
+            """ Only run the refresh if the data waiting to be sent allows it """
+            pending_bytes = config.update_queue.get_stats()["pending_bytes"]
+            if not display.lcd.link_monitor.allow(priority, pending_bytes):
+                display.lcd.link_monitor.skip(name)
+                logger.debug("Display link overloaded (%d bytes waiting): skip %s refresh" % (pending_bytes, name))
+                return
+            return func(*args, **kwargs)
+
+        return throttled
+
+    return decorator
+
+
 @async_job("CPU_Percentage")
 @schedule(timedelta(seconds=config.THEME_DATA['STATS']['CPU']['PERCENTAGE'].get("INTERVAL", 0)).total_seconds())
+@throttle("CPU_Percentage", config.THEME_DATA['STATS']['CPU']['PERCENTAGE'].get("PRIORITY"))
 def CPUPercentage():
     """ Refresh the CPU Percentage """
     # logger.debug("Refresh CPU Percentage")
@@ -91,6 +120,7 @@ def CPUPercentage():
 
 @async_job("CPU_Frequency")
 @schedule(timedelta(seconds=config.THEME_DATA['STATS']['CPU']['FREQUENCY'].get("INTERVAL", 0)).total_seconds())
+@throttle("CPU_Frequency", config.THEME_DATA['STATS']['CPU']['FREQUENCY'].get("PRIORITY"))
 def CPUFrequency():
     """ Refresh the CPU Frequency """
     # logger.debug("Refresh CPU Frequency")
@@ -99,6 +129,7 @@ def CPUFrequency():
 
 @async_job("CPU_Load")
 @schedule(timedelta(seconds=config.THEME_DATA['STATS']['CPU']['LOAD'].get("INTERVAL", 0)).total_seconds())
+@throttle("CPU_Load", config.THEME_DATA['STATS']['CPU']['LOAD'].get("PRIORITY"))
 def CPULoad():
     """ Refresh the CPU Load """
     # logger.debug("Refresh CPU Load")
@@ -107,6 +138,7 @@ def CPULoad():
 
 @async_job("CPU_Load")
 @schedule(timedelta(seconds=config.THEME_DATA['STATS']['CPU']['TEMPERATURE'].get("INTERVAL", 0)).total_seconds())
+@throttle("CPU_Temperature", config.THEME_DATA['STATS']['CPU']['TEMPERATURE'].get("PRIORITY"))
 def CPUTemperature():
     """ Refresh the CPU Temperature """
     # logger.debug("Refresh CPU Temperature")
@@ -115,6 +147,7 @@ def CPUTemperature():
 
 @async_job("CPU_FanSpeed")
 @schedule(timedelta(seconds=config.THEME_DATA['STATS']['CPU']['FAN_SPEED'].get("INTERVAL", 0)).total_seconds())
+@throttle("CPU_FanSpeed", config.THEME_DATA['STATS']['CPU']['FAN_SPEED'].get("PRIORITY"))
 def CPUFanSpeed():
     """ Refresh the CPU Fan Speed """
     # logger.debug("Refresh CPU Fan Speed")
@@ -123,6 +156,7 @@ def CPUFanSpeed():
 
 @async_job("GPU_Stats")
 @schedule(timedelta(seconds=config.THEME_DATA['STATS']['GPU'].get("INTERVAL", 0)).total_seconds())
+@throttle("GPU_Stats", config.THEME_DATA['STATS']['GPU'].get("PRIORITY"))
 def GpuStats():
     """ Refresh the GPU Stats """
     # logger.debug("Refresh GPU Stats")
@@ -131,6 +165,7 @@ def GpuStats():
 
 @async_job("Memory_Stats")
 @schedule(timedelta(seconds=config.THEME_DATA['STATS']['MEMORY'].get("INTERVAL", 0)).total_seconds())
+@throttle("Memory_Stats", config.THEME_DATA['STATS']['MEMORY'].get("PRIORITY"))
 def MemoryStats():
     # logger.debug("Refresh memory stats")
     stats.Memory.stats()
@@ -138,6 +173,7 @@ def MemoryStats():
 
 @async_job("Disk_Stats")
 @schedule(timedelta(seconds=config.THEME_DATA['STATS']['DISK'].get("INTERVAL", 0)).total_seconds())
+@throttle("Disk_Stats", config.THEME_DATA['STATS']['DISK'].get("PRIORITY"))
 def DiskStats():
     # logger.debug("Refresh disk stats")
     stats.Disk.stats()
@@ -145,6 +181,7 @@ def DiskStats():
 
 @async_job("Net_Stats")
 @schedule(timedelta(seconds=config.THEME_DATA['STATS']['NET'].get("INTERVAL", 0)).total_seconds())
+# Not throttled: network rates are computed from the counters of the previous refresh, skipping one would double them
 def NetStats():
     # logger.debug("Refresh net stats")
     stats.Net.stats()
@@ -152,18 +189,21 @@ def NetStats():
 
 @async_job("Date_Stats")
 @schedule(timedelta(seconds=config.THEME_DATA['STATS']['DATE'].get("INTERVAL", 0)).total_seconds())
+@throttle("Date_Stats", config.THEME_DATA['STATS']['DATE'].get("PRIORITY"))
 def DateStats():
     # logger.debug("Refresh date stats")
     stats.Date.stats()
 
 @async_job("SystemUptime_Stats")
 @schedule(timedelta(seconds=config.THEME_DATA['STATS']['UPTIME'].get("INTERVAL", 0)).total_seconds())
+@throttle("SystemUptime_Stats", config.THEME_DATA['STATS']['UPTIME'].get("PRIORITY"))
 def SystemUptimeStats():
     # logger.debug("Refresh system uptime stats")
     stats.SystemUptime.stats()
 
 @async_job("Custom_Stats")
 @schedule(timedelta(seconds=config.THEME_DATA['STATS']['CUSTOM'].get("INTERVAL", 0)).total_seconds())
+@throttle("Custom_Stats", config.THEME_DATA['STATS']['CUSTOM'].get("PRIORITY"))
 def CustomStats():
     # print("Refresh custom stats")
     stats.Custom.stats()
@@ -171,6 +211,7 @@ def CustomStats():
 
 @async_job("Weather_Stats")
 @schedule(timedelta(seconds=config.THEME_DATA['STATS']['WEATHER'].get("INTERVAL", None)).total_seconds())
+@throttle("Weather_Stats", config.THEME_DATA['STATS']['WEATHER'].get("PRIORITY"))
 def WeatherStats():
     # print("Refresh weather stats")
     try:
@@ -181,27 +222,28 @@ def WeatherStats():
 
 @async_job("Rss_Stats")
 @schedule(timedelta(seconds=config.THEME_DATA['STATS']['RSS'].get("INTERVAL", None)).total_seconds())
+@throttle("Rss_Stats", config.THEME_DATA['STATS']['RSS'].get("PRIORITY"))
 def RssStats():
     # print("Refresh weather stats")
     stats.Rss.stats()
 
 
+@async_job("Frame_Flush")
+@schedule(timedelta(seconds=config.CONFIG_DATA['display'].get("FRAME_INTERVAL", 0)).total_seconds())
+def FrameFlush():
+    """ Send the changes of the off-screen frame to the display (compositor mode) """
+    # logger.debug("Flush frame")
+    display.lcd.FlushFrame()
+
+
 @async_job("Queue_Handler")
-@schedule(timedelta(milliseconds=1).total_seconds())
 def QueueHandler():
-    # Do next action waiting in the queue
-    global STOPPING
-    if STOPPING:
-        # Empty the action queue to allow program to exit cleanly
-        while not config.update_queue.empty():
-            f, args = config.update_queue.get()
-            f(*args)
-    else:
-        # Execute first action in the queue
-        f, args = config.update_queue.get()
-        if f:
-            f(*args)
-
-
-def is_queue_empty() -> bool:
-    return config.update_queue.empty()
+    """ Send the requests waiting in the queue to the display, until stop_queue_handler() is called """
+    # Blocks while the queue is empty: no CPU is used when there is nothing to send
+    writer.run()
+
+
+def stop_queue_handler(timeout: float) -> bool:
+    """ Stop the queue handler once all pending requests are sent. Requests still pending after timeout are dropped """
+    return writer.stop(timeout)
+
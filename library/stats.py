@@ -33,6 +33,7 @@ from psutil._common import bytes2human
 from uptime import uptime
 
 import library.config as config
+import library.lcd.codec as codec
 from library.display import display
 from library.log import logger
 
@@ -828,7 +829,7 @@ class Custom:
 
 import time
 from typing import Any
-from PIL import Image, ImageFont
+from PIL import Image
 import library.sensors.sensors_weather as sensors_weather
 
 
@@ -883,17 +884,12 @@ class Weather:
 
             ratio: int = draw_config.get("RATIO", 1)
             font: str = draw_config.get("FONT", "roboto-mono/RobotoMono-Regular.ttf")
-            font_cache = display.lcd.font_cache
-            for size in (12, 18):
-                true_size = int(size * ratio)
-                if (font, true_size) not in font_cache:
-                    font_cache[(font, true_size)] = ImageFont.truetype("./res/fonts/" + font, true_size)
 
             if draw_config.get("BACKGROUND_IMAGE"):
                 x = draw_config.get("X", 0)
                 y = draw_config.get("Y", 0)
-                basic_image = display.lcd.open_image(get_theme_file_path(draw_config.get("BACKGROUND_IMAGE"))).crop(
-                    (x, y, x + int(200 * ratio), y + int(80 * ratio)))
+                basic_image = display.lcd.background_image(get_theme_file_path(draw_config.get("BACKGROUND_IMAGE")),
+                                                           (x, y, x + int(200 * ratio), y + int(80 * ratio)))
             else:
                 background_color = draw_config.get("BACKGROUND_COLOR", (0, 0, 0))
                 if isinstance(background_color, str):
@@ -901,8 +897,8 @@ class Weather:
                 basic_image = Image.new("RGB", (int(200 * ratio), int(80 * ratio)), background_color)
 
             draw = sensors_weather.WeatherDraw(
-                font_cache[(font, int(12 * ratio))],
-                font_cache[(font, int(18 * ratio))],
+                display.lcd.get_font(font, int(12 * ratio)),
+                display.lcd.get_font(font, int(18 * ratio)),
                 draw_config.get("FONT_COLOR", (255, 255, 255)),
                 basic_image,
                 ratio,
@@ -954,9 +950,10 @@ class Weather:
             y = draw_config.get("Y", 0)
             image = self.cache["images"][key]["image"]
             if draw_config.get("ANIMATION", False) and int(now) % duration == 0 and self.cache["last_image"] != None:
-                new_image = image.copy()
+                # Images drawn with RGB565 rendering have no alpha channel: fade between RGB images
+                new_image = codec.rgb_image(image).copy()
                 new_image.putalpha(int(now % 1 * 256))
-                last_image = self.cache["last_image"].copy()
+                last_image = codec.rgb_image(self.cache["last_image"]).copy()
                 last_image.paste(new_image, (0, 0), new_image)
                 display.lcd.DisplayPILImage(last_image, x, y)
             else:
@@ -1029,9 +1026,10 @@ class Rss:
         if index != self.cache["last_index"]:
             image, x, y = display_themed_value(draw_config, text)
             if draw_config.get("ANIMATION", False) and int(now) % duration == 0 and self.cache["last_image"] != None:
-                new_image = image.copy()
+                # Images drawn with RGB565 rendering have no alpha channel: fade between RGB images
+                new_image = codec.rgb_image(image).copy()
                 new_image.putalpha(int(now % 1 * 256))
-                last_image = self.cache["last_image"].copy()
+                last_image = codec.rgb_image(self.cache["last_image"]).copy()
                 last_image.paste(new_image, (0, 0), new_image)
                 display.lcd.DisplayPILImage(last_image, x, y)
             else:
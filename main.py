@@ -87,11 +87,14 @@ if __name__ == "__main__":
         wait_time = 5
         logger.info("Waiting for all pending request to be sent to display (%ds max)..." % wait_time)
 
-        while not scheduler.is_queue_empty() and wait_time > 0:
-            time.sleep(0.1)
-            wait_time = wait_time - 0.1
+        start = time.time()
+        if not scheduler.stop_queue_handler(timeout=wait_time):
+            logger.warning("Queue handler did not stop in time, some requests may not have been sent to display")
 
-        logger.debug("(%.1fs)" % (5 - wait_time))
+        logger.debug("(%.1fs)" % (time.time() - start))
+
+        # Close the trace file, if any, once all requests have been sent
+        display.lcd.StopTrace()
 
         # Remove tray icon just before exit
         if tray_icon:
@@ -215,6 +218,7 @@ if __name__ == "__main__":
     scheduler.CustomStats()
     scheduler.WeatherStats()
     scheduler.RssStats()
+    scheduler.FrameFlush()
     scheduler.QueueHandler()
 
     if tray_icon and platform.system() == "Darwin":  # macOS-specific
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# turing-smart-screen-python - a Python system monitor and library for USB-C displays like Turing Smart Screen or XuanFang
+# https://github.com/mathoudebine/turing-smart-screen-python/
+
+# Copyright (C) 2021-2023  Matthieu Houdebine (mathoudebine)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# codec-benchmark.py: Micro-benchmark of the vectorized pixel encoders (library/lcd/codec.py) against the per-pixel
+# loops they replaced, and of the rotation done by the encoders against PIL rotation followed by encoding. Outputs are
+# checked to be identical. Run from the root of the project: python tools/codec-benchmark.py
+
+import os
+import struct
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import library.lcd.codec as codec  # noqa: E402
+
+
+def legacy_rgb565(image: Image.Image, byteorder: str) -> bytes:
+    # Per-pixel loop previously used by revisions B & D
+    pix = image.load()
+    fmt = '<H' if byteorder == "little" else '>H'
+    line = bytes()
+    for h in range(image.height):
+        for w in range(image.width):
+            rgb = ((pix[w, h][0] >> 3) << 11) | ((pix[w, h][1] >> 2) << 5) | (pix[w, h][2] >> 3)
+            line += struct.pack(fmt, rgb)
+    return line
+
+
+def legacy_bgra(image: Image.Image) -> bytes:
+    # Hex-string loop previously used by revision C for full frames
+    image_data = image.convert("RGBA").load()
+    image_ret = ''
+    for y in range(image.height):
+        for x in range(image.width):
+            pixel = image_data[x, y]
+            image_ret += f'{pixel[2]:02x}{pixel[1]:02x}{pixel[0]:02x}{pixel[3]:02x}'
+    return bytes(bytearray.fromhex(image_ret))
+
+
+def legacy_bgr_rows(image: Image.Image, first_row_offset: int, row_stride: int) -> bytes:
+    # Hex-string loop previously used by revision C for partial updates
+    img_raw_data = []
+    image_data = image.convert("RGBA").load()
+    for h in range(image.height):
+        img_raw_data.append(f'{first_row_offset + h * row_stride:06x}{image.width:04x}')
+        for w in range(image.width):
+            current_pixel = image_data[w, h]
+            img_raw_data.append(f'{current_pixel[2]:02x}{current_pixel[1]:02x}{current_pixel[0]:02x}')
+    return bytes(bytearray.fromhex(''.join(img_raw_data)))
+
+
+def measure(func, *args, runs: int = 1):
+    start = time.perf_counter()
+    for _ in range(runs):
+        result = func(*args)
+    return (time.perf_counter() - start) / runs, result
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    images = {
+        '320x480': Image.fromarray(rng.integers(0, 256, (480, 320, 3), dtype=np.uint8), "RGB"),
+        '480x800': Image.fromarray(rng.integers(0, 256, (800, 480, 3), dtype=np.uint8), "RGB"),
+    }
+
+    benchmarks = [
+        ("RGB565 LE", '320x480', lambda i: legacy_rgb565(i, "little"), lambda i: codec.image_to_rgb565(i, "little")),
+        ("RGB565 BE", '320x480', lambda i: legacy_rgb565(i, "big"), lambda i: codec.image_to_rgb565(i, "big")),
+        ("BGRA", '480x800', legacy_bgra, codec.image_to_bgra),
+        ("BGR rows", '480x800', lambda i: legacy_bgr_rows(i, 0, 800), lambda i: codec.image_to_bgr_rows(i, 0, 800)),
+    ]
+
+    print(f"{'Format':<12}{'Size':<10}{'Legacy (ms)':>14}{'Codec (ms)':>14}{'Speedup':>10}")
+    for name, size, legacy, vectorized in benchmarks:
+        legacy_time, legacy_result = measure(legacy, images[size])
+        codec_time, codec_result = measure(vectorized, images[size], runs=20)
+        assert legacy_result == codec_result, f"{name}: codec output differs from legacy output"
+        print(f"{name:<12}{size:<10}{legacy_time * 1000:>14.1f}{codec_time * 1000:>14.2f}"
+              f"{legacy_time / codec_time:>9.0f}x")
+
+    # Rotation to the native orientation of the display (revisions C & D), for full frames and widgets
+    images['200x60'] = Image.fromarray(rng.integers(0, 256, (60, 200, 3), dtype=np.uint8), "RGB")
+    rotations = [
+        ("RGB565 BE", '320x480', lambda i, r: codec.image_to_rgb565(i, "big", rotation=r)),
+        ("RGB565 BE", '200x60', lambda i, r: codec.image_to_rgb565(i, "big", rotation=r)),
+        ("BGRA", '480x800', lambda i, r: codec.image_to_bgra(i, rotation=r)),
+        ("BGR rows", '480x800', lambda i, r: codec.image_to_bgr_rows(i, 0, 800, rotation=r)),
+        ("BGR rows", '200x60', lambda i, r: codec.image_to_bgr_rows(i, 0, 800, rotation=r)),
+    ]
+
+    print()
+    print(f"{'Format':<12}{'Size':<10}{'Rotation':>10}{'PIL (ms)':>14}{'Codec (ms)':>14}{'Speedup':>10}")
+    for name, size, encode in rotations:
+        for rotation in (1, 2, 3):
+            pil_time, pil_result = measure(lambda i: encode(i.rotate(rotation * 90, expand=True), 0), images[size],
+                                           runs=20)
+            codec_time, codec_result = measure(encode, images[size], rotation, runs=20)
+            assert pil_result == codec_result, f"{name} {rotation * 90}°: rotated output differs from PIL rotation"
+            print(f"{name:<12}{size:<10}{rotation * 90:>9}°{pil_time * 1000:>14.2f}{codec_time * 1000:>14.2f}"
+                  f"{pil_time / codec_time:>9.1f}x")
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# turing-smart-screen-python - a Python system monitor and library for USB-C displays like Turing Smart Screen or XuanFang
+# https://github.com/mathoudebine/turing-smart-screen-python/
+
+# Copyright (C) 2021-2023  Matthieu Houdebine (mathoudebine)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# emulator-benchmark.py: Measure end-to-end refresh times of the drivers of each HW revision, through a pseudo-terminal
+# connected to an emulated display (library/lcd/lcd_emulator.py), and check that the emulated screen content is the
+# expected one in all orientations, including after the screen has been turned off and on. Line graph updates show
+# the gain of sparse pixel updates on revision A.
+# Exits with an error code if a protocol error is detected.
+# Linux / macOS only. Run from the root of the project: python tools/emulator-benchmark.py [link speed in bytes/s]
+
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import library.lcd.codec as codec  # noqa: E402
+from library.lcd.lcd_comm import Orientation  # noqa: E402
+from library.lcd.lcd_comm_rev_a import LcdCommRevA  # noqa: E402
+from library.lcd.lcd_comm_rev_b import LcdCommRevB  # noqa: E402
+from library.lcd.lcd_comm_rev_c import LcdCommRevC  # noqa: E402
+from library.lcd.lcd_comm_rev_d import LcdCommRevD  # noqa: E402
+from library.lcd.lcd_emulator import EMULATORS, serve_pty  # noqa: E402
+
+REVISIONS = [("A", LcdCommRevA, 16), ("B", LcdCommRevB, 16), ("C", LcdCommRevC, 24), ("D", LcdCommRevD, 16)]
+WIDGET_UPDATES = 50
+GRAPH_UPDATES = 50
+GRAPH_SAMPLES = 60
+
+
+def widget(rng, value: int) -> Image.Image:
+    # Small text-like widget on a textured background
+    image = Image.fromarray(rng.integers(0, 64, (30, 100, 3), dtype=np.uint8))
+    ImageDraw.Draw(image).text((5, 5), "%d %%" % value, fill=(255, 255, 255))
+    return image
+
+
+def expected_pixels(image: Image.Image, color_depth: int) -> np.ndarray:
+    pixels = np.asarray(image)
+    return codec.rgb565_to_rgb(codec.rgb_to_rgb565(pixels)) if color_depth == 16 else pixels
+
+
+class SentBytes:
+    # Count bytes written to the transport of a driver
+    def __init__(self, lcd):
+        self.count = 0
+        write = lcd.lcd_serial.write
+
+        def counting_write(data):
+            self.count += len(data)
+            return write(data)
+
+        lcd.lcd_serial.write = counting_write
+
+
+def wait_received(emulator, sent: SentBytes, timeout: float = 60):
+    # Wait for the emulator to receive all data sent: refresh is over once the display got all of it
+    deadline = time.monotonic() + timeout
+    while emulator.bytes_received < sent.count and time.monotonic() < deadline:
+        time.sleep(0.001)
+
+
+if __name__ == "__main__":
+    speed = float(sys.argv[1]) if len(sys.argv) > 1 else 0
+    errors = 0
+
+    print(f"{'Rev.':<6}{'Orientation':<20}{'Full screen (ms)':>18}{'Widget (ms)':>14}{'Graph (ms)':>12}"
+          f"{'Graph bytes':>13}{'Bytes sent':>14}{'Check':>8}")
+    for revision, lcd_class, color_depth in REVISIONS:
+        for orientation in Orientation:
+            emulator = EMULATORS[revision]()
+            names, ready, stop = [], threading.Event(), threading.Event()
+            threading.Thread(target=serve_pty, args=(emulator, speed, ready, names, stop), daemon=True).start()
+            ready.wait()
+
+            lcd = lcd_class(com_port=names[0], display_width=emulator.display_width,
+                            display_height=emulator.display_height)
+            if revision == "A":
+                # Emulator supports DISPLAY_PIXELS like UsbMonitor screens
+                lcd.sparse_pixels = True
+            sent = SentBytes(lcd)
+            if revision != "D":
+                lcd.InitializeComm()
+            lcd.SetOrientation(orientation)
+            width, height = lcd.get_width(), lcd.get_height()
+            rng = np.random.default_rng(int(orientation))
+
+            reference = Image.fromarray(rng.integers(0, 256, (height, width, 3), dtype=np.uint8))
+            start = time.perf_counter()
+            lcd.DisplayPILImage(reference)
+            wait_received(emulator, sent)
+            full_screen = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for value in range(WIDGET_UPDATES):
+                image = widget(rng, value)
+                lcd.DisplayPILImage(image, 10, 10)
+                reference.paste(image, (10, 10))
+                wait_received(emulator, sent)
+            widget_update = (time.perf_counter() - start) / WIDGET_UPDATES
+
+            # Line graph moving by one sample at each update, like a CPU usage history
+            samples = list(np.clip(50 + np.cumsum(rng.integers(-3, 4, GRAPH_SAMPLES + GRAPH_UPDATES)), 0, 100))
+            graph_bytes = sent.count
+            start = time.perf_counter()
+            for value in range(GRAPH_UPDATES):
+                image, x, y = lcd.DisplayLineGraph(10, 60, 200, 80, samples[value:value + GRAPH_SAMPLES])
+                reference.paste(image, (x, y))
+                wait_received(emulator, sent)
+            graph_update = (time.perf_counter() - start) / GRAPH_UPDATES
+            graph_bytes = (sent.count - graph_bytes) // GRAPH_UPDATES
+
+            # Screen content may be lost while the screen is off: it must be sent again once the screen is back on
+            lcd.ScreenOff()
+            wait_received(emulator, sent)
+            with emulator.mutex:
+                emulator.panel[:] = 0
+            lcd.ScreenOn()
+            lcd.DisplayPILImage(reference)
+            wait_received(emulator, sent)
+
+            stop.set()
+            lcd.closeSerial()
+
+            check = np.array_equal(np.asarray(emulator.screenshot(orientation)),
+                                   expected_pixels(reference, color_depth)) and not emulator.errors
+            errors += not check
+            print(f"{revision:<6}{orientation.name:<20}{full_screen * 1000:>18.1f}{widget_update * 1000:>14.2f}"
+                  f"{graph_update * 1000:>12.2f}{graph_bytes:>13}{emulator.bytes_received:>14}"
+                  f"{'OK' if check else 'FAIL':>8}")
+
+    sys.exit(1 if errors else 0)
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# turing-smart-screen-python - a Python system monitor and library for USB-C displays like Turing Smart Screen or XuanFang
+# https://github.com/mathoudebine/turing-smart-screen-python/
+
+# Copyright (C) 2021-2023  Matthieu Houdebine (mathoudebine)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# lcd-emulator.py: Emulate a display of HW revision A, B, C or D on a pseudo-terminal or a socket (see
+# library/lcd/lcd_emulator.py). Set COM_PORT in config.yaml to the printed pseudo-terminal or to the socket URI, and
+# REVISION to the emulated revision, then run main.py: the screen content is regularly saved to a PNG file.
+# Linux / macOS only. Run from the root of the project, e.g.:
+#   python tools/lcd-emulator.py A --screenshot screencap.png
+#   python tools/lcd-emulator.py C --port tcp://127.0.0.1:5555 --speed 1000000
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from library.lcd.lcd_comm import Orientation  # noqa: E402
+from library.lcd.lcd_emulator import EMULATORS, serve_pty, serve_socket  # noqa: E402
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Emulate a smart screen on a pseudo-terminal or a socket")
+    parser.add_argument("revision", choices=sorted(EMULATORS.keys()), help="HW revision to emulate")
+    parser.add_argument("--port", default="pty",
+                        help="pty (default), tcp://host:port or unix:///path/to/socket")
+    parser.add_argument("--size", default=None, help="Display size in portrait, e.g. 480x800 (default: revision size)")
+    parser.add_argument("--speed", type=float, default=0,
+                        help="Link speed in bytes/s, to behave like a real display (default: no limit)")
+    parser.add_argument("--latency", type=float, default=0,
+                        help="Time taken by the display to answer a command in seconds (default: 0)")
+    parser.add_argument("--screenshot", default="screencap.png", help="PNG file where screen content is saved")
+    parser.add_argument("--orientation", default="PORTRAIT", choices=[o.name for o in Orientation],
+                        help="Orientation of the screenshot")
+    parser.add_argument("--interval", type=float, default=1, help="Interval between screenshots in seconds")
+    args = parser.parse_args()
+
+    if args.size:
+        width, height = (int(v) for v in args.size.split("x"))
+        emulator = EMULATORS[args.revision](width, height)
+    else:
+        emulator = EMULATORS[args.revision]()
+    emulator.reply_delay = args.latency
+
+    if args.port == "pty":
+        names = []
+        ready = threading.Event()
+        threading.Thread(target=serve_pty, args=(emulator, args.speed, ready, names), daemon=True).start()
+        ready.wait()
+        print(f"Emulating HW revision {args.revision} on {names[0]}")
+    else:
+        threading.Thread(target=serve_socket, args=(emulator, args.port, args.speed), daemon=True).start()
+        print(f"Emulating HW revision {args.revision} on {args.port}")
+
+    try:
+        while True:
+            time.sleep(args.interval)
+            emulator.screenshot(Orientation[args.orientation]).save(args.screenshot)
+            print(f"\r{emulator.bytes_received} bytes, {emulator.commands} commands, {emulator.bitmaps} bitmaps, "
+                  f"{emulator.errors} errors", end="", flush=True)
+    except KeyboardInterrupt:
+        print()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# turing-smart-screen-python - a Python system monitor and library for USB-C displays like Turing Smart Screen or XuanFang
+# https://github.com/mathoudebine/turing-smart-screen-python/
+
+# Copyright (C) 2021-2023  Matthieu Houdebine (mathoudebine)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# queue-benchmark.py: Compare the queue dispatcher (library/lcd/serial_writer.py) with the previous dispatcher, a
+# sched.scheduler re-armed every millisecond. Measures CPU usage when idle and requests/s under load.
+# Run from the root of the project: python tools/queue-benchmark.py
+
+import os
+import queue
+import sched
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from library.lcd.serial_writer import SerialWriter  # noqa: E402
+
+IDLE_DURATION = 2  # seconds
+REQUESTS = 5000
+
+
+class NullDisplay:
+    # Stands for a LcdComm object: writes are discarded
+    def WriteLine(self, line: bytes):
+        pass
+
+    def WriteData(self, byteBuffer: bytearray):
+        pass
+
+
+class LegacyDispatcher:
+    # Previous implementation: QueueHandler() wrapped in @schedule(timedelta(milliseconds=1))
+    def __init__(self, update_queue: queue.Queue):
+        self.update_queue = update_queue
+        self.stopping = False
+
+    def handle(self):
+        f, args = self.update_queue.get()
+        if f:
+            f(*args)
+
+    def periodic(self, scheduler, interval):
+        if not self.stopping:
+            scheduler.enter(interval, 1, self.periodic, (scheduler, interval))
+        self.handle()
+
+    def run(self):
+        scheduler = sched.scheduler(time.time, time.sleep)
+        self.periodic(scheduler, 0.001)
+        scheduler.run()
+
+    def stop(self):
+        self.stopping = True
+        self.update_queue.put((None, None))
+
+
+def benchmark(name: str, update_queue: queue.Queue, run, stop, request):
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    time.sleep(0.2)
+
+    # CPU used by the dispatcher while the queue is empty
+    cpu_start = time.process_time()
+    time.sleep(IDLE_DURATION)
+    idle_cpu = (time.process_time() - cpu_start) / IDLE_DURATION * 100
+
+    # Requests/s when the queue is full
+    done = threading.Event()
+    start = time.perf_counter()
+    for _ in range(REQUESTS - 1):
+        update_queue.put(request)
+    update_queue.put((done.set, []))
+    done.wait()
+    rate = REQUESTS / (time.perf_counter() - start)
+
+    stop()
+    thread.join(timeout=1)
+    print(f"{name:<40}{idle_cpu:>12.2f}{rate:>16.0f}")
+
+
+if __name__ == "__main__":
+    display = NullDisplay()
+    data = bytes(320 * 8)
+
+    print(f"{'Dispatcher':<40}{'Idle CPU %':>12}{'Requests/s':>16}")
+
+    legacy_queue = queue.Queue()
+    legacy = LegacyDispatcher(legacy_queue)
+    benchmark("sched re-armed every 1 ms", legacy_queue, legacy.run, legacy.stop, (display.WriteLine, [data]))
+
+    for label, request in [("calls", (len, [data])), ("writes", (display.WriteLine, [data]))]:
+        writer_queue = queue.Queue()
+        writer = SerialWriter(display, writer_queue)
+        benchmark(f"SerialWriter blocking consumer ({label})", writer_queue, writer.run, lambda: writer.stop(1),
+                  request)
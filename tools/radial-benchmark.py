@@ -0,0 +1,126 @@
+# turing-smart-screen-python - a Python system monitor and library for USB-C displays like Turing Smart Screen or XuanFang
+# https://github.com/mathoudebine/turing-smart-screen-python/
+
+# Copyright (C) 2021-2023  Matthieu Houdebine (mathoudebine)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# radial-benchmark.py: Compare radial progress bars drawn with PIL arcs and sent entirely (previous path) with bars
+# composed from precomputed masks where only the changed sector is sent (library/lcd/radial_bar.py), on the radial
+# progress bars of a theme. Values follow a random walk. Screen contents are checked to be identical.
+# Run from the root of the project: python tools/radial-benchmark.py [theme name, default 5inchTheme2Radial]
+
+import os
+import random
+import sys
+import time
+
+import numpy as np
+import yaml
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from library.lcd.lcd_comm import Orientation  # noqa: E402
+from library.lcd.lcd_simulated import LcdSimulated  # noqa: E402
+
+UPDATES = 500
+
+
+def theme_radial_bars(theme_data, radial_bars: list):
+    # Get the radial progress bars shown by the theme, with their section name
+    for name, value in theme_data.items():
+        if isinstance(value, dict):
+            if "RADIUS" in value and value.get("SHOW", False):
+                radial_bars.append((name, value))
+            theme_radial_bars(value, radial_bars)
+    return radial_bars
+
+
+def draw(lcd: LcdSimulated, theme_dir: str, theme_data: dict, value: int):
+    # Draw a radial progress bar of the theme, like library/stats.py does
+    text = f"{value:>3}%" if theme_data.get("SHOW_TEXT", False) else ""
+    background_image = theme_data.get("BACKGROUND_IMAGE")
+    lcd.DisplayRadialProgressBar(
+        xc=theme_data.get("X", 0), yc=theme_data.get("Y", 0),
+        radius=theme_data.get("RADIUS", 1), bar_width=theme_data.get("WIDTH", 1),
+        min_value=theme_data.get("MIN_VALUE", 0), max_value=theme_data.get("MAX_VALUE", 100),
+        angle_start=theme_data.get("ANGLE_START", 0), angle_end=theme_data.get("ANGLE_END", 360),
+        angle_steps=theme_data.get("ANGLE_STEPS", 1), angle_sep=theme_data.get("ANGLE_SEP", 0),
+        clockwise=theme_data.get("CLOCKWISE", False), value=value,
+        bar_color=theme_data.get("BAR_COLOR", (0, 0, 0)), text=text,
+        font=theme_data.get("FONT", "roboto-mono/RobotoMono-Regular.ttf"), font_size=theme_data.get("FONT_SIZE", 10),
+        font_color=theme_data.get("FONT_COLOR", (0, 0, 0)),
+        background_color=theme_data.get("BACKGROUND_COLOR", (0, 0, 0)),
+        background_image=theme_dir + background_image if background_image else None)
+
+
+def run(theme_dir: str, theme: dict, masks: bool):
+    size = theme["display"].get("DISPLAY_SIZE", '5"')
+    lcd = LcdSimulated(display_width=480, display_height=800) if size == '5"' else LcdSimulated()
+    if theme["display"].get("DISPLAY_ORIENTATION") == 'landscape':
+        lcd.SetOrientation(Orientation.LANDSCAPE)
+    # Framebuffer is disabled so that each path sends the areas it draws
+    lcd.framebuffer_enabled = False
+    lcd.radial_bar_masks_enabled = masks
+    lcd.progress_bar_incremental = masks
+
+    pixels_sent = [0]
+    display_pil_image = lcd._display_pil_image
+
+    def counting_display_pil_image(image, x=0, y=0, image_width=0, image_height=0):
+        pixels_sent[0] += image.size[0] * image.size[1]
+        display_pil_image(image, x, y, image_width, image_height)
+
+    lcd._display_pil_image = counting_display_pil_image
+
+    radial_bars = theme_radial_bars(theme, [])
+    start = time.perf_counter()
+    if masks:
+        for _, theme_data in radial_bars:
+            lcd.radial_bar(theme_data.get("RADIUS", 1), theme_data.get("WIDTH", 1), theme_data.get("ANGLE_START", 0),
+                           theme_data.get("ANGLE_END", 360), theme_data.get("ANGLE_SEP", 0),
+                           theme_data.get("ANGLE_STEPS", 1), theme_data.get("CLOCKWISE", False))
+    precompute_time = time.perf_counter() - start
+
+    rng = random.Random(0)
+    values = [50] * len(radial_bars)
+    start = time.perf_counter()
+    for _ in range(UPDATES):
+        for i, (_, theme_data) in enumerate(radial_bars):
+            values[i] = min(max(values[i] + rng.randint(-5, 5), 0), 100)
+            draw(lcd, theme_dir, theme_data, values[i])
+    update_time = (time.perf_counter() - start) / (UPDATES * len(radial_bars))
+
+    return radial_bars, precompute_time, update_time, pixels_sent[0] / (UPDATES * len(radial_bars)), \
+        np.asarray(lcd.screen_image.convert("RGB"))
+
+
+if __name__ == "__main__":
+    theme_name = sys.argv[1] if len(sys.argv) > 1 else "5inchTheme2Radial"
+    theme_dir = "res/themes/" + theme_name + "/"
+    with open(theme_dir + "theme.yaml", "rt", encoding='utf8') as stream:
+        theme = yaml.safe_load(stream)
+
+    radial_bars, _, arcs_time, arcs_pixels, arcs_screen = run(theme_dir, theme, masks=False)
+    _, precompute_time, masks_time, masks_pixels, masks_screen = run(theme_dir, theme, masks=True)
+
+    print(f"Theme {theme_name}: {len(radial_bars)} radial progress bars "
+          f"({', '.join(name for name, _ in radial_bars)}), {UPDATES} updates each")
+    print(f"Masks precomputed in {precompute_time * 1000:.1f} ms")
+    print(f"{'Path':<24}{'Update (ms)':>14}{'Pixels sent':>14}")
+    print(f"{'PIL arcs, full bar':<24}{arcs_time * 1000:>14.3f}{arcs_pixels:>14.0f}")
+    print(f"{'Masks, changed sector':<24}{masks_time * 1000:>14.3f}{masks_pixels:>14.0f}")
+    print(f"Speedup {arcs_time / masks_time:.1f}x, {arcs_pixels / masks_pixels:.1f}x less pixels sent")
+    if not np.array_equal(arcs_screen, masks_screen):
+        print("Screen contents differ!")
+        sys.exit(1)
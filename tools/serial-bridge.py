@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# turing-smart-screen-python - a Python system monitor and library for USB-C displays like Turing Smart Screen or XuanFang
+# https://github.com/mathoudebine/turing-smart-screen-python/
+
+# Copyright (C) 2021-2023  Matthieu Houdebine (mathoudebine)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# serial-bridge.py: Share the serial port of a display over a TCP or Unix domain socket, so that the display can be
+# connected to a small bridge box and driven from another host, with COM_PORT set to tcp://bridge:port in config.yaml.
+# Data is forwarded in both directions with non-blocking bulk writes. Only one client is served at a time.
+# Linux / macOS only (serial port must support select())
+
+import os
+import selectors
+import socket
+import sys
+from urllib.parse import urlparse
+
+import serial
+
+# Maximum amount of data buffered for the display: the client is not read anymore until the display caught up
+MAX_BUFFER_SIZE = 1024 * 1024
+READ_SIZE = 64 * 1024
+
+
+def listen(uri: str) -> socket.socket:
+    url = urlparse(uri)
+    if url.scheme == "tcp":
+        server = socket.create_server((url.hostname or "", url.port))
+    elif url.scheme == "unix":
+        if os.path.exists(url.path):
+            os.unlink(url.path)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(url.path)
+        server.listen()
+    else:
+        raise ValueError(f"Unsupported URI {uri}: use tcp://host:port or unix:///path/to/socket")
+    server.setblocking(False)
+    return server
+
+
+def bridge(port: str, uri: str, baudrate: int = 115200):
+    # Non-blocking serial port: read() returns available data, write() returns the number of bytes written
+    lcd_serial = serial.Serial(port, baudrate, timeout=0, write_timeout=0, rtscts=1)
+    server = listen(uri)
+    print(f"Bridging {port} on {uri}")
+
+    selector = selectors.DefaultSelector()
+    selector.register(server, selectors.EVENT_READ)
+    selector.register(lcd_serial.fileno(), selectors.EVENT_READ)
+
+    client = None
+    to_display = bytearray()
+    to_client = bytearray()
+
+    def update_events():
+        # Only wait for the events that can be processed: keep buffers bounded
+        selector.modify(lcd_serial.fileno(), selectors.EVENT_READ | (selectors.EVENT_WRITE if to_display else 0))
+        if client:
+            events = (selectors.EVENT_READ if len(to_display) < MAX_BUFFER_SIZE else 0) | \
+                     (selectors.EVENT_WRITE if to_client else 0)
+            selector.modify(client, events or selectors.EVENT_READ)
+
+    while True:
+        for key, events in selector.select():
+            if key.fileobj is server:
+                connection, address = server.accept()
+                if client:
+                    # Only one client at a time: the display cannot mix requests from different hosts
+                    connection.close()
+                    continue
+                print(f"Client connected: {address}")
+                client = connection
+                client.setblocking(False)
+                selector.register(client, selectors.EVENT_READ)
+                lcd_serial.reset_input_buffer()
+            elif key.fileobj is client:
+                if events & selectors.EVENT_READ:
+                    try:
+                        data = client.recv(READ_SIZE)
+                    except (BlockingIOError, InterruptedError):
+                        data = None
+                    except OSError:
+                        data = b''
+                    if data == b'':
+                        print("Client disconnected")
+                        selector.unregister(client)
+                        client.close()
+                        client = None
+                        to_display.clear()
+                        to_client.clear()
+                    elif data:
+                        to_display += data
+                if client and events & selectors.EVENT_WRITE and to_client:
+                    try:
+                        del to_client[:client.send(to_client)]
+                    except (BlockingIOError, InterruptedError):
+                        pass
+            else:
+                if events & selectors.EVENT_READ:
+                    data = lcd_serial.read(lcd_serial.in_waiting or 1)
+                    if client:
+                        to_client += data
+                if events & selectors.EVENT_WRITE and to_display:
+                    try:
+                        del to_display[:lcd_serial.write(to_display) or 0]
+                    except serial.SerialTimeoutException:
+                        pass
+        update_events()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage :")
+        print("        serial-bridge.py <serial port> <listen URI>")
+        print("Examples : ")
+        print("        serial-bridge.py /dev/ttyACM0 tcp://0.0.0.0:5555")
+        print("        serial-bridge.py /dev/ttyACM0 unix:///run/lcd.sock")
+        sys.exit(0)
+
+    try:
+        bridge(sys.argv[1], sys.argv[2])
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# turing-smart-screen-python - a Python system monitor and library for USB-C displays like Turing Smart Screen or XuanFang
+# https://github.com/mathoudebine/turing-smart-screen-python/
+
+# Copyright (C) 2021-2023  Matthieu Houdebine (mathoudebine)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# trace-replay.py: Use traces of the communication with a display (TRACE_FILE in config.yaml, see library/lcd/trace.py)
+#  - info: print a summary of a trace
+#  - replay: send the data of a trace to a display or an emulator (any COM_PORT, see library/lcd/transport.py) as fast
+#    as possible or with the original timing, and measure throughput and latency of the reads
+#  - diff: compare the data written in two traces, e.g. recorded with two versions of the drivers
+# Run from the root of the project, e.g.:
+#   python tools/trace-replay.py info trace.bin
+#   python tools/trace-replay.py replay trace.bin /dev/ttyACM0 --timing original
+#   python tools/trace-replay.py diff before.bin after.bin
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from library.lcd.trace import Direction, read_trace  # noqa: E402
+from library.lcd.transport import open_transport  # noqa: E402
+
+
+def info(path: str):
+    writes, reads, written, read, duration = 0, 0, 0, 0, 0
+    for record in read_trace(path):
+        if record.direction == Direction.WRITE:
+            writes += 1
+            written += len(record.data)
+        else:
+            reads += 1
+            read += len(record.data)
+        duration = record.timestamp
+    print(f"{path}: {duration:.3f}s, {writes} writes ({written} bytes), {reads} reads ({read} bytes)")
+    if duration:
+        print(f"Average write throughput: {written / duration / 1000:.1f} kB/s")
+
+
+def replay(path: str, com_port: str, original_timing: bool):
+    transport = open_transport(com_port, 115200, timeout=1)
+    written, read_latencies, short_reads = 0, [], 0
+
+    start = time.perf_counter()
+    for record in read_trace(path):
+        if original_timing:
+            delay = record.timestamp - (time.perf_counter() - start)
+            if delay > 0:
+                time.sleep(delay)
+
+        if record.direction == Direction.WRITE:
+            transport.write(record.data)
+            written += len(record.data)
+        else:
+            # Reads wait for the display to process all data written before: they are the latency measurement points
+            read_start = time.perf_counter()
+            data = transport.read(record.size)
+            read_latencies.append(time.perf_counter() - read_start)
+            if len(data) < len(record.data):
+                short_reads += 1
+    elapsed = time.perf_counter() - start
+    transport.close()
+
+    print(f"Replayed {written} bytes in {elapsed:.3f}s: {written / elapsed / 1000:.1f} kB/s")
+    if read_latencies:
+        read_latencies.sort()
+        print(f"{len(read_latencies)} reads: average latency {sum(read_latencies) / len(read_latencies) * 1000:.2f}ms, "
+              f"median {read_latencies[len(read_latencies) // 2] * 1000:.2f}ms, "
+              f"max {read_latencies[-1] * 1000:.2f}ms, {short_reads} reads shorter than in the trace")
+
+
+def written_data(path: str):
+    # All data written in a trace, and offset of the start of each write
+    data, offsets = bytearray(), []
+    for record in read_trace(path):
+        if record.direction == Direction.WRITE:
+            offsets.append(len(data))
+            data += record.data
+    return data, offsets
+
+
+def diff(path_a: str, path_b: str) -> bool:
+    # Compare the byte streams, as writes may be split differently without changing what the display receives
+    data_a, offsets_a = written_data(path_a)
+    data_b, offsets_b = written_data(path_b)
+    print(f"{path_a}: {len(data_a)} bytes in {len(offsets_a)} writes")
+    print(f"{path_b}: {len(data_b)} bytes in {len(offsets_b)} writes")
+    if data_a == data_b:
+        print("Written data is identical")
+        return True
+
+    offset = next((i for i, (a, b) in enumerate(zip(data_a, data_b)) if a != b), min(len(data_a), len(data_b)))
+    for path, data, offsets in ((path_a, data_a, offsets_a), (path_b, data_b, offsets_b)):
+        write = max(i for i, o in enumerate(offsets) if o <= offset) if offsets and offset < len(data) else len(offsets)
+        print(f"{path}: write #{write} at offset {offset}: {data[offset:offset + 16].hex(' ') or '(end of trace)'}")
+    return False
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay or compare traces of the communication with a display")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    parser_info = subparsers.add_parser("info", help="Print a summary of a trace")
+    parser_info.add_argument("trace")
+    parser_replay = subparsers.add_parser("replay", help="Send a trace to a display or an emulator")
+    parser_replay.add_argument("trace")
+    parser_replay.add_argument("com_port", help="COM port or URI (tcp://, unix://, file://) of the display")
+    parser_replay.add_argument("--timing", choices=["fast", "original"], default="fast",
+                               help="Send data as fast as possible (default) or with the timing of the trace")
+    parser_diff = subparsers.add_parser("diff", help="Compare the data written in two traces")
+    parser_diff.add_argument("trace_a")
+    parser_diff.add_argument("trace_b")
+    args = parser.parse_args()
+
+    if args.command == "info":
+        info(args.trace)
+    elif args.command == "replay":
+        replay(args.trace, args.com_port, args.timing == "original")
+    elif args.command == "diff":
+        sys.exit(0 if diff(args.trace_a, args.trace_b) else 1)
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# turing-smart-screen-python - a Python system monitor and library for USB-C displays like Turing Smart Screen or XuanFang
+# https://github.com/mathoudebine/turing-smart-screen-python/
+
+# Copyright (C) 2021-2023  Matthieu Houdebine (mathoudebine)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# transport-benchmark.py: Measure the throughput of each transport (library/lcd/transport.py) against a local
+# loopback standing for the display: a pseudo-terminal for serial ports, local sockets, a named pipe, and the serial
+# bridge (tools/serial-bridge.py) between a TCP socket and a pseudo-terminal.
+# Linux / macOS only. Run from the root of the project: python tools/transport-benchmark.py
+
+import importlib.util
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+import tty
+from typing import Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from library.lcd.transport import open_transport  # noqa: E402
+
+TOTAL_SIZE = 16 * 1024 * 1024
+WRITE_SIZE = 64 * 1024  # Same as SerialWriter.MAX_WRITE_SIZE
+
+
+class Sink:
+    # Reads and discards everything received, until TOTAL_SIZE bytes have been received
+    def __init__(self, read):
+        self.read = read
+        self.done = threading.Event()
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def run(self):
+        received = 0
+        while received < TOTAL_SIZE:
+            data = self.read()
+            if not data:
+                break
+            received += len(data)
+        self.done.set()
+
+
+def socket_sink(server: socket.socket) -> Sink:
+    def read():
+        if not hasattr(read, "connection"):
+            read.connection, _ = server.accept()
+        return read.connection.recv(WRITE_SIZE)
+
+    return Sink(read)
+
+
+def fifo_sink(path: str) -> Sink:
+    def read():
+        if not hasattr(read, "fifo"):
+            # Blocks until the transport opens the pipe
+            read.fifo = open(path, "rb", buffering=0)
+        return read.fifo.read(WRITE_SIZE)
+
+    return Sink(read)
+
+
+def pty_sink() -> Tuple[str, Sink]:
+    master, slave = os.openpty()
+    tty.setraw(master)
+    return os.ttyname(slave), Sink(lambda: os.read(master, WRITE_SIZE))
+
+
+def benchmark(name: str, com_port: str, sink: Sink):
+    transport = open_transport(com_port)
+    data = os.urandom(WRITE_SIZE)
+    start = time.perf_counter()
+    for _ in range(TOTAL_SIZE // WRITE_SIZE):
+        transport.write(data)
+    sink.done.wait()
+    elapsed = time.perf_counter() - start
+    transport.close()
+    print(f"{name:<30}{com_port:<45}{TOTAL_SIZE / elapsed / 1e6:>10.1f}")
+
+
+if __name__ == "__main__":
+    tmp = tempfile.mkdtemp()
+    print(f"{'Transport':<30}{'COM_PORT':<45}{'MB/s':>10}")
+
+    port, sink = pty_sink()
+    benchmark("Serial (pseudo-terminal)", port, sink)
+
+    server = socket.create_server(("127.0.0.1", 0))
+    benchmark("TCP socket", "tcp://127.0.0.1:%d" % server.getsockname()[1], socket_sink(server))
+
+    path = os.path.join(tmp, "lcd.sock")
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen()
+    benchmark("Unix domain socket", "unix://" + path, socket_sink(server))
+
+    path = os.path.join(tmp, "lcd.fifo")
+    os.mkfifo(path)
+    benchmark("Named pipe", "file://" + path, fifo_sink(path))
+
+    # Serial bridge: TCP socket -> bridge -> pseudo-terminal
+    spec = importlib.util.spec_from_file_location("serial_bridge", os.path.join(os.path.dirname(__file__),
+                                                                                 "serial-bridge.py"))
+    serial_bridge = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(serial_bridge)
+    port, sink = pty_sink()
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        bridge_port = s.getsockname()[1]
+    threading.Thread(target=serial_bridge.bridge, args=(port, "tcp://127.0.0.1:%d" % bridge_port), daemon=True).start()
+    time.sleep(0.5)
+    benchmark("Serial bridge (TCP -> pty)", "tcp://127.0.0.1:%d" % bridge_port, sink)